@@ -1,15 +1,144 @@
-from django.contrib import admin
+from django.contrib import admin, messages
 from django.contrib.auth import get_user_model
 from django.contrib.auth.admin import UserAdmin
+from django.core.exceptions import PermissionDenied, ValidationError
+from django.http import HttpResponseRedirect
+from django.template.response import TemplateResponse
+from django.urls import path
+
+from profiles import profile_cache
+from profiles.models import Artist, Fan as FanProfile, VerificationRequests
+from profiles.pagination import EstimatedCountPaginator
+from users.constants import (
+    ACCOUNT_TYPE_ARTISTE,
+    ACCOUNT_TYPE_FAN,
+    VERIFICATION_APPROVED,
+    VERIFICATION_PENDING,
+    VERIFICATION_REJECTED,
+)
 
 User = get_user_model()
 from users.models import Fan
 
-admin.site.register(Fan)
+
+class EstimatedCountMixin:
+    """Changelists over tables too large to count: estimated totals and no second full count."""
+
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+
+def set_verification_status(queryset, status):
+    """Move the pending users behind the selected profiles to ``status`` with one UPDATE; returns how many moved."""
+    user_ids = list(queryset.order_by().values_list("user_id", flat=True))
+    updated = User.objects.filter(pk__in=user_ids, verification_status=VERIFICATION_PENDING).update(
+        verification_status=status
+    )
+    # profiles embed the verification status
+    profile_cache.invalidate(*user_ids)
+    return updated
+
+
+@admin.register(Fan)
+class FanAdmin(EstimatedCountMixin, admin.ModelAdmin):
+    list_select_related = ("user",)
+    raw_id_fields = ("user",)
+    search_fields = ("user__email",)
+
+
+class ProfileAdmin(EstimatedCountMixin, admin.ModelAdmin):
+    list_display = ("user", "stage_name", "likes_count", "dislikes_count")
+    list_select_related = ("user",)
+    raw_id_fields = ("user",)
+    # a popular profile has far too many likers to render as form widgets
+    exclude = ("likes", "dislikes")
+    search_fields = ("user__email",)
+    ordering = ("-pk",)
+    account_type = None
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        if self.account_type is not None:
+            queryset = queryset.filter(user__account_type=self.account_type)
+        return queryset
+
+
+@admin.register(Artist)
+class ArtistAdmin(ProfileAdmin):
+    account_type = ACCOUNT_TYPE_ARTISTE
+
+
+@admin.register(FanProfile)
+class FanProfileAdmin(ProfileAdmin):
+    account_type = ACCOUNT_TYPE_FAN
+
+
+@admin.register(VerificationRequests)
+class VerificationRequestsAdmin(ProfileAdmin):
+    list_display = ("user", "stage_name", "verification_status")
+    ordering = ("pk",)
+    actions = ["approve", "reject"]
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).filter(user__verification_status=VERIFICATION_PENDING)
+
+    @admin.display(ordering="user__verification_status")
+    def verification_status(self, obj):
+        return obj.user.verification_status
+
+    @admin.action(description="Approve selected requests", permissions=["change"])
+    def approve(self, request, queryset):
+        updated = set_verification_status(queryset, VERIFICATION_APPROVED)
+        self.message_user(request, f"Approved {updated} requests.", messages.SUCCESS)
+
+    @admin.action(description="Reject selected requests", permissions=["change"])
+    def reject(self, request, queryset):
+        updated = set_verification_status(queryset, VERIFICATION_REJECTED)
+        self.message_user(request, f"Rejected {updated} requests.", messages.SUCCESS)
+
+    def get_urls(self):
+        queue = path(
+            "queue/", self.admin_site.admin_view(self.queue_view), name="profiles_verificationrequests_queue"
+        )
+        return [queue, *super().get_urls()]
+
+    def queue_view(self, request):
+        """Pending requests oldest first, paged by primary key (``?after=``) instead of OFFSET and COUNT."""
+        if request.method == "POST":
+            if not self.has_change_permission(request):
+                raise PermissionDenied
+            status = {"approve": VERIFICATION_APPROVED, "reject": VERIFICATION_REJECTED}.get(request.POST.get("action"))
+            try:
+                selected = [self.model._meta.pk.to_python(pk) for pk in request.POST.getlist("selected")]
+            except ValidationError:
+                self.message_user(request, "Invalid selection.", messages.ERROR)
+                return HttpResponseRedirect(request.get_full_path())
+            if status and selected:
+                updated = set_verification_status(self.get_queryset(request).filter(pk__in=selected), status)
+                self.message_user(request, f"Updated {updated} requests.", messages.SUCCESS)
+            return HttpResponseRedirect(request.get_full_path())
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+        try:
+            after = int(request.GET.get("after", 0))
+        except ValueError:
+            after = 0
+        queryset = self.get_queryset(request).select_related("user").filter(pk__gt=after).order_by("pk")
+        rows = list(queryset[: self.list_per_page + 1])
+        page = rows[: self.list_per_page]
+        context = {
+            **self.admin_site.each_context(request),
+            "opts": self.model._meta,
+            "title": "Verification queue",
+            "page": page,
+            "next_after": page[-1].pk if len(rows) > len(page) else None,
+            "can_change": self.has_change_permission(request),
+        }
+        return TemplateResponse(request, "admin/profiles/verification_queue.html", context)
 
 
 @admin.register(User)
-class CustomUserAdmin(UserAdmin):
+class CustomUserAdmin(EstimatedCountMixin, UserAdmin):
     list_display = ("email", "account_type", "uid")
     list_filter = ('is_staff', 'is_active', 'account_type')
     fieldsets = (
@@ -55,5 +184,6 @@ class CustomUserAdmin(UserAdmin):
             },
         ),
     )
+    # email__icontains, served by the trigram index from schema.statements() on PostgreSQL
     search_fields = ('email',)
     ordering = ('email',)
@@ -1,5 +1,12 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class ProfilesConfig(AppConfig):
     name = 'profiles'
+
+    def ready(self):
+        from profiles import instrumentation, replicas, schema, signals, suggest  # noqa: F401
+
+        post_migrate.connect(schema.on_post_migrate, sender=self)
+        suggest.load_snapshot()
@@ -0,0 +1,92 @@
+from django.db import transaction
+from django.db.models import Count, Max
+
+from apps.artiste.constants import PLATFORM_LINKS
+from apps.artiste.models import Artiste, Links
+from profiles import profile_cache
+from profiles.models import Profile
+
+# Profile.<platform>_link columns that predate the Links table
+LEGACY_FIELDS = {
+    name: platform
+    for name, platform in PLATFORM_LINKS.items()
+    if any(field.name == name for field in Profile._meta.concrete_fields)
+}
+
+
+def save_links(artiste, urls):
+    """Upsert ``{link_type: url}`` for ``artiste``: one read, then at most one ``INSERT ... ON CONFLICT``.
+
+    Relies on the (artiste, link_type) unique index from ``schema.statements``,
+    so two concurrent saves can't both insert the same platform.
+    """
+    if not urls:
+        return
+    existing = dict(
+        Links.objects.filter(artiste=artiste, link_type__in=list(urls)).values_list("link_type", "link_url")
+    )
+    if all(existing.get(link_type) == url for link_type, url in urls.items()):
+        return
+    with transaction.atomic():
+        Links.objects.bulk_create(
+            [Links(artiste=artiste, link_type=link_type, link_url=url) for link_type, url in urls.items()],
+            update_conflicts=True,
+            unique_fields=["artiste", "link_type"],
+            update_fields=["link_url"],
+        )
+        # bulk writes send no signals
+        profile_cache.invalidate_artiste(artiste.pk, artiste.user_id)
+
+
+def dedupe():
+    """Keep only the newest link per artiste and platform; returns how many rows were removed."""
+    duplicates = (
+        Links.objects.values("artiste_id", "link_type")
+        .annotate(n=Count("pk"), newest=Max("pk"))
+        .filter(n__gt=1)
+        .order_by()
+    )
+    removed = 0
+    for row in duplicates.iterator():
+        removed += (
+            Links.objects.filter(artiste_id=row["artiste_id"], link_type=row["link_type"])
+            .exclude(pk=row["newest"])
+            .delete()[0]
+        )
+    return removed
+
+
+def fold_legacy(batch_size=1000, clear=False):
+    """Copy the legacy Profile link columns into Links for the matching artiste.
+
+    A platform the artiste already has in Links is left alone, since that
+    row is the newer one. With ``clear`` the legacy columns are blanked on
+    the profiles that were folded; a profile without an artiste keeps them.
+    """
+    fields = list(LEGACY_FIELDS)
+    profiles = Profile.objects.exclude(**{name: "" for name in fields}).order_by("pk")
+    folded = 0
+    rows = profiles.values_list("pk", *fields).iterator(chunk_size=batch_size)
+    while True:
+        batch = [row for _, row in zip(range(batch_size), rows)]
+        if not batch:
+            break
+        artistes = dict(Artiste.objects.filter(user_id__in=[row[0] for row in batch]).values_list("user_id", "pk"))
+        existing = set(
+            Links.objects.filter(artiste_id__in=artistes.values()).values_list("artiste_id", "link_type")
+        )
+        new = []
+        for user_id, *urls in batch:
+            artiste_id = artistes.get(user_id)
+            if artiste_id is None:
+                continue
+            for name, url in zip(fields, urls):
+                platform = LEGACY_FIELDS[name]
+                if url and (artiste_id, platform) not in existing:
+                    new.append(Links(artiste_id=artiste_id, link_type=platform, link_url=url))
+        with transaction.atomic():
+            Links.objects.bulk_create(new, batch_size=batch_size)
+            if clear:
+                Profile.objects.filter(pk__in=list(artistes)).update(**{name: "" for name in fields})
+        folded += len(new)
+    return folded
@@ -0,0 +1,177 @@
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from django.http import JsonResponse
+from django.views import View
+from rest_framework import exceptions
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from apps.artiste.models import Artiste, AudioMedia
+from profiles import ranking, replicas, rollups, search, serializers
+from profiles.instrumentation import query_budget
+from profiles.models import EngagementBucket, LeaderboardEntry, Media, SearchDocument
+from profiles.pagination import KeysetPagination
+
+# Django runs every async ORM call of a request on one shared thread, so
+# gathered ORM coroutines would still reach the database one after another.
+# Sub-queries that should overlap run on their own worker thread (and
+# connection) instead; turn this off where connections are scarce.
+PARALLEL_QUERIES = getattr(settings, "PROFILES_ASYNC_PARALLEL_QUERIES", True)
+
+
+def off_loop(func):
+    """Wrap blocking ``func`` for ``await``, on its own worker thread when PARALLEL_QUERIES is on."""
+    if not PARALLEL_QUERIES:
+        return sync_to_async(func)
+
+    def run(*args, **kwargs):
+        close_old_connections()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            close_old_connections()
+
+    return sync_to_async(run, thread_sensitive=False)
+
+
+def _user(request):
+    try:
+        return request.user
+    except exceptions.AuthenticationFailed:
+        return None
+
+
+class AsyncAPIView(View):
+    """Async Django view for read-only endpoints served under ASGI.
+
+    Authenticates with the DRF authentication classes and requires a logged
+    in user, like the ``IsAuthenticated`` sync views; handlers receive the
+    DRF ``Request``. Views marked ``@read_replica`` read from a replica.
+    """
+
+    http_method_names = ["get", "head", "options"]
+
+    async def dispatch(self, request, *args, **kwargs):
+        request = Request(request, authenticators=[auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES])
+        user = await sync_to_async(_user)(request)
+        if not (user and user.is_authenticated):
+            authenticators = request.authenticators
+            header = authenticators[0].authenticate_header(request) if authenticators else None
+            response = JsonResponse(
+                {"detail": "Authentication credentials were not provided."}, status=401 if header else 403
+            )
+            if header:
+                response["WWW-Authenticate"] = header
+            return response
+        alias = await sync_to_async(replicas.choose)(user) if getattr(self, "read_replica", False) else None
+        with replicas.reading(alias):
+            return await super().dispatch(request, *args, **kwargs)
+
+
+def _in_order(objects, ids):
+    return [objects[pk] for pk in ids if pk in objects]
+
+
+def _songs(request, ids):
+    songs = AudioMedia.objects.select_related("artiste", "album").in_bulk(ids)
+    return serializers.SuggestionsSerializer(_in_order(songs, ids), context={"request": request}, many=True).data
+
+
+def _artistes(request, ids):
+    artistes = Artiste.objects.select_related("user").in_bulk(ids)
+    return serializers.ArtisteSerializer(_in_order(artistes, ids), context={"request": request}, many=True).data
+
+
+def _search_songs(request, query, page, page_size):
+    ids, has_more = search.search(SearchDocument.KIND_SONG, query, page, page_size)
+    return _songs(request, ids), has_more
+
+
+def _search_artistes(request, query, page, page_size):
+    ids, has_more = search.search(SearchDocument.KIND_ARTISTE, query, page, page_size)
+    return _artistes(request, ids), has_more
+
+
+@query_budget(10)
+@replicas.read_replica
+class AsyncSearchAPIView(AsyncAPIView):
+    """``SearchAPIView`` with the song and artiste searches running concurrently."""
+
+    page_size = 20
+    max_page_size = 100
+
+    async def get(self, request, *args, **kwargs):
+        search_query = request.query_params.get("search", None)
+        if search_query is None:
+            return JsonResponse({"error": "Please provide a search term"}, status=400)
+        try:
+            page = max(int(request.query_params.get("page", 1)), 1)
+            page_size = min(max(int(request.query_params.get("page_size", self.page_size)), 1), self.max_page_size)
+        except ValueError:
+            return JsonResponse({"error": "Invalid page or page_size"}, status=400)
+
+        (songs, songs_has_more), (artistes, artistes_has_more) = await asyncio.gather(
+            off_loop(_search_songs)(request, search_query, page, page_size),
+            off_loop(_search_artistes)(request, search_query, page, page_size),
+        )
+        data = {
+            "songs": songs,
+            "artistes": artistes,
+            "page": page,
+            "page_size": page_size,
+            "songs_has_more": songs_has_more,
+            "artistes_has_more": artistes_has_more,
+        }
+        return JsonResponse(data)
+
+
+@query_budget(10)
+@replicas.read_replica
+class AsyncSuggestionView(AsyncAPIView):
+    """``SuggestionView`` loading its three boards concurrently."""
+
+    async def get(self, request, *args, **kwargs):
+        boards = await ranking.aget_leaderboards()
+        most_liked_songs, most_liked_artists, top_trending_songs = await asyncio.gather(
+            off_loop(_songs)(request, boards[LeaderboardEntry.BOARD_MOST_LIKED_SONGS]),
+            off_loop(_artistes)(request, boards[LeaderboardEntry.BOARD_MOST_LIKED_ARTISTS]),
+            off_loop(_songs)(request, boards[LeaderboardEntry.BOARD_TOP_TRENDING_SONGS]),
+        )
+        data = {
+            "most_liked_songs": most_liked_songs,
+            "most_liked_artists": most_liked_artists,
+            "top_trending_songs": top_trending_songs,
+        }
+        return JsonResponse(data)
+
+
+@query_budget(15)
+@replicas.read_replica
+class AsyncTrendingSongView(AsyncAPIView):
+    """``TrendingSongView`` on the async ORM, with the same keyset pages."""
+
+    keyset_ordering = ("trending_position", "-pk")
+
+    async def get(self, request, *args, **kwargs):
+        window = request.query_params.get("window", rollups.DEFAULT_WINDOW)
+        if window not in rollups.WINDOWS:
+            return JsonResponse({"window": [f"Choose one of: {', '.join(rollups.WINDOWS)}."]}, status=400)
+        queryset = Media.objects.all()
+        ids = await rollups.atrending_ids(EngagementBucket.KIND_MEDIA, window)
+        if ids:
+            queryset = queryset.filter(pk__in=ids)
+        positions = ranking.delta_case("pk", {pk: position for position, pk in enumerate(ids, start=1)})
+        queryset = serializers.MediaSerializer.setup_eager_loading(queryset.annotate(trending_position=positions))
+
+        paginator = KeysetPagination()
+        try:
+            rows = await paginator.apaginate_queryset(queryset, request, view=self)
+        except exceptions.NotFound as exc:
+            return JsonResponse({"detail": str(exc.detail)}, status=404)
+        data = await sync_to_async(
+            lambda: serializers.MediaSerializer(rows, context={"request": request}, many=True).data
+        )()
+        return JsonResponse(paginator.get_paginated_data(data))
@@ -0,0 +1,281 @@
+import json
+import random
+import re
+import time
+import tracemalloc
+from collections import Counter
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, reverse
+from django.utils import timezone
+
+from apps.artiste.models import Artiste, AudioMedia
+from profiles import profile_cache, ranking, rollups, search, urls
+from profiles.models import EngagementBucket, Media, MediaComment, Profile
+from users.constants import ACCOUNT_TYPE_ARTISTE, ACCOUNT_TYPE_FAN
+from users.models import Fan
+
+User = get_user_model()
+
+Follow = Artiste.followers.field.model
+
+SCALES = {
+    "small": {"fans": 200, "artistes": 20, "media": 500, "likes": 20, "comments": 1_000, "follows": 5},
+    "medium": {"fans": 2_000, "artistes": 200, "media": 5_000, "likes": 50, "comments": 20_000, "follows": 10},
+    "large": {"fans": 20_000, "artistes": 1_000, "media": 50_000, "likes": 100, "comments": 200_000, "follows": 20},
+}
+BATCH_SIZE = 2_000
+WORDS = "love night dance fire heart blue moon baby dream rain gold city summer sky angel wild river home".split()
+
+# routes that need external services (object storage multipart uploads, signed image tokens)
+SKIPPED = {"images/<str:token>/", "uploads/", "uploads/<uuid:uid>/", "uploads/<uuid:uid>/complete/", "metrics/"}
+# what the stream routes serve: a few KiB, so they measure the view rather than the disk
+SAMPLE_AUDIO = b"\xff\xfb\x90\x00" * 1024
+BODIES = {
+    "plays/": lambda data: {"events": [{"media": str(data["media_uid"]), "session": "bench"}]},
+    "reactions/": lambda data: {"kind": "media", "id": str(data["media_uid"]), "reaction": "like"},
+    "reactions/batch/": lambda data: {
+        "reactions": [{"kind": "media", "id": str(data["media_uid"]), "reaction": "dislike"}]
+    },
+}
+QUERIES = {
+    "search/": "search=love",
+    "async/search/": "search=love",
+    "search/suggest/": "q=lo",
+    "trending-songs": "window=week",
+    "async/trending-songs/": "window=week",
+}
+
+
+def _title(rng):
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 3))) + f" {rng.randint(0, 9999)}"
+
+
+def _m2m_rows(model, accessor, pairs):
+    field = model._meta.get_field(accessor)
+    through = field.remote_field.through
+    return [
+        through(**{f"{field.m2m_field_name()}_id": obj_id, f"{field.m2m_reverse_field_name()}_id": user_id})
+        for obj_id, user_id in pairs
+    ]
+
+
+def _sample_file(field_file, name):
+    """Give ``field_file`` a real SAMPLE_AUDIO file, replacing the one an earlier run left behind."""
+    field_file.storage.delete(field_file.field.generate_filename(field_file.instance, name))
+    field_file.save(name, ContentFile(SAMPLE_AUDIO))
+
+
+def generate(scale="small", seed=0):
+    """Fill the database with a synthetic catalogue of ``scale`` using ``bulk_create``.
+
+    Returns the sample objects the route runner needs (a fan, a media uid...).
+    """
+    sizes = SCALES[scale]
+    rng = random.Random(seed)
+    password = make_password("benchmark")
+    bulk = {"batch_size": BATCH_SIZE}
+
+    User.objects.bulk_create(
+        [
+            User(email=f"fan{i}@bench.local", password=password, first_name=f"Fan{i}", account_type=ACCOUNT_TYPE_FAN)
+            for i in range(sizes["fans"])
+        ],
+        **bulk,
+    )
+    User.objects.bulk_create(
+        [
+            User(
+                email=f"artiste{i}@bench.local",
+                password=password,
+                first_name=f"Artiste{i}",
+                account_type=ACCOUNT_TYPE_ARTISTE,
+            )
+            for i in range(sizes["artistes"])
+        ],
+        **bulk,
+    )
+    # not every backend returns primary keys from bulk_create
+    fans = list(User.objects.filter(email__endswith="@bench.local", account_type=ACCOUNT_TYPE_FAN).order_by("pk"))
+    owners = list(
+        User.objects.filter(email__endswith="@bench.local", account_type=ACCOUNT_TYPE_ARTISTE).order_by("pk")
+    )
+    Profile.objects.bulk_create([Profile(user=user, stage_name=user.first_name) for user in fans + owners], **bulk)
+    Fan.objects.bulk_create([Fan(user=user) for user in fans], **bulk)
+    Artiste.objects.bulk_create([Artiste(user=user, stage_name=f"{_title(rng)} band") for user in owners], **bulk)
+    artistes = list(Artiste.objects.filter(user__in=owners).order_by("pk"))
+
+    Media.objects.bulk_create(
+        [
+            Media(
+                owner=rng.choice(owners),
+                file=f"songs/bench-{i}.mp3",
+                song_name=_title(rng),
+                album_name=rng.choice(WORDS),
+                duration="03:30",
+                duration_ms=210_000,
+            )
+            for i in range(sizes["media"])
+        ],
+        **bulk,
+    )
+    AudioMedia.objects.bulk_create(
+        [AudioMedia(artiste=rng.choice(artistes), title=_title(rng)) for _ in range(sizes["media"] // 2)], **bulk
+    )
+    media_ids = list(Media.objects.filter(file__startswith="songs/bench-").values_list("pk", flat=True))
+    song_ids = list(AudioMedia.objects.filter(artiste__in=artistes).values_list("pk", flat=True))
+
+    # popularity is Zipf-like, so a few items get most of the engagement
+    def popular(ids, k):
+        return set(rng.choices(ids, weights=[1 / (rank + 1) for rank in range(len(ids))], k=k))
+
+    media_likes = [(media_id, fan.pk) for fan in fans for media_id in popular(media_ids, sizes["likes"])]
+    song_likes = [(song_id, fan.pk) for fan in fans for song_id in popular(song_ids, sizes["likes"] // 2)]
+    Media._meta.get_field("likes").remote_field.through.objects.bulk_create(
+        _m2m_rows(Media, "likes", media_likes), ignore_conflicts=True, **bulk
+    )
+    AudioMedia._meta.get_field("likes").remote_field.through.objects.bulk_create(
+        _m2m_rows(AudioMedia, "likes", song_likes), ignore_conflicts=True, **bulk
+    )
+    MediaComment.objects.bulk_create(
+        [
+            MediaComment(media_id=rng.choice(media_ids), commenter=rng.choice(fans), body=_title(rng))
+            for _ in range(sizes["comments"])
+        ],
+        **bulk,
+    )
+
+    follower = profile_cache.follower_field()
+    if follower is not None:
+        fan_profiles = dict(Fan.objects.filter(user__in=fans).values_list("user_id", "pk"))
+        Follow.objects.bulk_create(
+            [
+                Follow(
+                    **{
+                        Artiste.followers.field.attname: artiste.pk,
+                        follower.attname: fan.pk if follower.related_model is User else fan_profiles[fan.pk],
+                    }
+                )
+                for fan in fans
+                for artiste in rng.sample(artistes, min(sizes["follows"], len(artistes)))
+            ],
+            ignore_conflicts=True,
+            **bulk,
+        )
+
+    now = timezone.now()
+    rollups.upsert(
+        {
+            (EngagementBucket.KIND_MEDIA, media_id, EngagementBucket.HOUR, rollups.hour_start(now)): {
+                **dict.fromkeys(rollups.METRICS, 0),
+                "likes": likes,
+            }
+            for media_id, likes in Counter(media_id for media_id, _ in media_likes).items()
+        }
+    )
+    rollups.refresh_trending(now)
+    ranking.rebuild_counters()
+    ranking.refresh_all_boards()
+    search.rebuild()
+
+    # the catalogue rows point at files that were never written; the stream routes need real ones
+    media = Media.objects.get(pk=media_ids[0])
+    _sample_file(media.file, "bench.mp3")
+    _sample_file(Profile.objects.get(user=owners[0]).profile_song, "bench-profile.mp3")
+    return {"user": fans[0], "media_uid": media.uid, "profile_uid": owners[0].uid}
+
+
+def routes(data):
+    """``(route, method, path, body)`` for every route in ``profiles.urls``."""
+    prefix = reverse("search")[: -len("search/")]
+    for pattern in urls.urlpatterns:
+        if not isinstance(pattern, URLPattern):
+            continue
+        route = str(pattern.pattern)
+        if route in SKIPPED:
+            continue
+        if route.startswith("profile/"):
+            uid = data["profile_uid"]
+        else:
+            uid = data["media_uid"]
+        path = re.sub(r"<(?:\w+:)?uid>", str(uid), route)
+        query = QUERIES.get(route)
+        path = prefix + path + (f"?{query}" if query else "")
+        body = BODIES.get(route)
+        yield route, "post" if body else "get", path, body(data) if body else None
+
+
+def _percentile(values, p):
+    return values[min(int(len(values) * p), len(values) - 1)] * 1000 if values else 0.0
+
+
+def measure(client, method, path, body, repeat):
+    """Time ``repeat`` requests, then replay one under tracemalloc for query count and peak memory."""
+    call = getattr(client, method)
+    kwargs = {"data": body, "content_type": "application/json"} if body is not None else {}
+    call(path, **kwargs)  # warm caches and lazy imports
+    latencies = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        response = call(path, **kwargs)
+        latencies.append(time.perf_counter() - started)
+    latencies.sort()
+
+    tracemalloc.start()
+    with CaptureQueriesContext(connection) as queries:
+        call(path, **kwargs)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "status": response.status_code,
+        "p50_ms": _percentile(latencies, 0.5),
+        "p95_ms": _percentile(latencies, 0.95),
+        "p99_ms": _percentile(latencies, 0.99),
+        "queries": len(queries),
+        "peak_kib": peak // 1024,
+    }
+
+
+def run(data, repeat=20, only=None):
+    client = Client()
+    client.force_login(data["user"])
+    results = {}
+    for route, method, path, body in routes(data):
+        if only and route not in only:
+            continue
+        results[route] = measure(client, method, path, body, repeat)
+    return results
+
+
+def compare(results, baseline, tolerance=0.25, noise_ms=2.0):
+    """Regressions of ``results`` against ``baseline``: slower p50/p95, more queries or more memory."""
+    regressions = []
+    for route, current in results.items():
+        before = baseline.get(route)
+        if before is None:
+            continue
+        for metric in ("p50_ms", "p95_ms"):
+            if current[metric] > before[metric] * (1 + tolerance) and current[metric] - before[metric] > noise_ms:
+                regressions.append(f"{route}: {metric} {before[metric]:.1f} -> {current[metric]:.1f}")
+        if current["queries"] > before["queries"]:
+            regressions.append(f"{route}: queries {before['queries']} -> {current['queries']}")
+        if current["peak_kib"] > before["peak_kib"] * (1 + tolerance) + 64:
+            regressions.append(f"{route}: peak memory {before['peak_kib']} -> {current['peak_kib']} KiB")
+        if current["status"] != before["status"]:
+            regressions.append(f"{route}: status {before['status']} -> {current['status']}")
+    return regressions
+
+
+def load_baseline(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_baseline(path, report):
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
@@ -0,0 +1,251 @@
+import csv
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+from django.contrib.auth import get_user_model
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models, transaction
+
+from apps.artiste.models import Artiste, AudioMedia, Links
+from profiles import ingest, utils
+from profiles.models import Media
+
+User = get_user_model()
+
+KINDS = {"media": Media, "audiomedia": AudioMedia, "links": Links}
+FORMATS = ("jsonl", "csv")
+
+
+def natural_key(related_model):
+    """Field that identifies a related row in a catalogue file, or ``None`` to leave the relation out."""
+    if related_model is User:
+        return "email"
+    if related_model is Artiste:
+        return "user__email"
+    if any(field.name == "album_name" for field in related_model._meta.concrete_fields):
+        return "album_name"
+    return None
+
+
+class Spec:
+    """Which columns a model is exported/imported with.
+
+    Editable concrete fields only: derived data (durations, waveforms,
+    variants, counters) is regenerated after import. Relations are written
+    as natural keys (user email, album name) and files as storage names.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.plain, self.files, self.relations = [], [], []
+        for field in model._meta.concrete_fields:
+            if field.primary_key or (not field.editable and field.name != "uid"):
+                continue
+            if field.is_relation:
+                if natural_key(field.related_model):
+                    self.relations.append(field)
+            elif isinstance(field, models.FileField):
+                self.files.append(field)
+            else:
+                self.plain.append(field)
+
+    @property
+    def columns(self):
+        return [field.name for field in self.plain + self.files + self.relations]
+
+
+def export_rows(kind, batch_size=2000):
+    spec = Spec(KINDS[kind])
+    paths = {field.name: f"{field.name}__{natural_key(field.related_model)}" for field in spec.relations}
+    values = [field.name for field in spec.plain + spec.files] + list(paths.values())
+    queryset = spec.model.objects.order_by("pk").values(*values)
+    for row in queryset.iterator(chunk_size=batch_size):
+        yield {column: row[paths.get(column, column)] for column in spec.columns}
+
+
+def write(rows, f, fmt, columns):
+    count = 0
+    if fmt == "csv":
+        writer = csv.DictWriter(f, fieldnames=columns)
+        writer.writeheader()
+    for row in rows:
+        if fmt == "csv":
+            writer.writerow({key: "" if value is None else value for key, value in row.items()})
+        else:
+            f.write(json.dumps(row, cls=DjangoJSONEncoder))
+            f.write("\n")
+        count += 1
+    return count
+
+
+def read(f, fmt):
+    if fmt == "csv":
+        yield from csv.DictReader(f)
+    else:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+class Lookups:
+    """In-memory natural key -> pk maps, filled with one query per batch for the keys not seen yet."""
+
+    def __init__(self):
+        self.maps = {}
+
+    def resolve(self, related_model, key, values):
+        cache = self.maps.setdefault((related_model, key), {})
+        missing = {value for value in values if value not in cache}
+        if missing:
+            cache.update(related_model.objects.filter(**{f"{key}__in": missing}).values_list(key, "pk"))
+        return cache
+
+    def albums(self, album_model, rows, artiste_ids):
+        """Map each row's ``album`` name to a pk, creating missing albums with one insert.
+
+        Albums are matched per artiste when the album model belongs to one.
+        """
+        scoped = any(field.name == "artiste" for field in album_model._meta.concrete_fields)
+        cache = self.maps.setdefault(album_model, {})
+
+        def pair(row):
+            return (artiste_ids.get(row.get("artiste")) if scoped else None, row["album"])
+
+        wanted = {pair(row) for row in rows if row.get("album")} - set(cache)
+        if wanted:
+            queryset = album_model.objects.filter(album_name__in={name for _, name in wanted})
+            if scoped:
+                cache.update(((a, n), pk) for a, n, pk in queryset.values_list("artiste_id", "album_name", "pk"))
+            else:
+                cache.update(((None, n), pk) for n, pk in queryset.values_list("album_name", "pk"))
+            missing = [key for key in wanted if key not in cache]
+            created = album_model.objects.bulk_create(
+                [album_model(album_name=name, **({"artiste_id": a} if scoped else {})) for a, name in missing]
+            )
+            cache.update({key: album.pk for key, album in zip(missing, created)})
+        return lambda row: cache.get(pair(row)) if row.get("album") else None
+
+
+def prepare(spec, row, source_dir):
+    """Upload local files referenced by ``row`` and extract metadata. Runs in the worker pool."""
+    uploaded = 0
+    for field in spec.files:
+        name = row.get(field.name)
+        local = os.path.join(source_dir, name) if source_dir and name else None
+        if not local or not os.path.isfile(local):
+            continue
+        if spec.model is Media and field.name == "file":
+            row["duration"] = utils.song_duration(local)
+        with open(local, "rb") as f:
+            target = field.generate_filename(None, os.path.basename(name))
+            row[field.name] = default_storage.save(target, File(f))
+        uploaded += os.path.getsize(local)
+    return row, uploaded
+
+
+def _build(spec, row, resolvers):
+    values = {}
+    for field in spec.plain:
+        if field.name in row:
+            value = row[field.name]
+            if value == "" and field.has_default():
+                continue
+            values[field.name] = field.to_python(None if value == "" and field.null else value)
+    for field in spec.files:
+        if field.name in row:
+            values[field.name] = row[field.name] or ""
+    if spec.model is Media and "duration" in row:
+        values["duration"] = row["duration"]
+        values["duration_ms"] = utils.duration_text_ms(row["duration"])
+    for field in spec.relations:
+        values[field.attname] = resolvers[field.name](row)
+    return spec.model(**values)
+
+
+def _identity(model):
+    """How an imported row finds the existing row it should update, if any."""
+    if model is Links:
+        return ("artiste_id", "link_type")
+    if any(field.name == "uid" for field in model._meta.concrete_fields):
+        return ("uid",)
+    return None
+
+
+def _save(spec, objects, columns, batch_size):
+    """``bulk_update`` rows that already exist and ``bulk_create`` the rest; returns the created objects.
+
+    Updates only touch ``columns``, the ones every row of the batch carries.
+    """
+    identity = _identity(spec.model)
+    if identity:
+        first = identity[0]
+        existing = spec.model.objects.filter(**{f"{first}__in": {getattr(obj, first) for obj in objects}})
+        existing = {tuple(values[:-1]): values[-1] for values in existing.values_list(*identity, "pk")}
+        for obj in objects:
+            obj.pk = existing.get(tuple(getattr(obj, name) for name in identity))
+    updates = [obj for obj in objects if obj.pk is not None]
+    creates = [obj for obj in objects if obj.pk is None]
+    if updates:
+        fields = [field for field in spec.plain + spec.files + spec.relations if field.name in columns]
+        fields = [field.attname for field in fields if field.name != "uid"]
+        if spec.model is Media and "duration" in columns:
+            fields += ["duration", "duration_ms"]
+        spec.model.objects.bulk_update(updates, fields, batch_size=batch_size)
+    return spec.model.objects.bulk_create(creates, batch_size=batch_size)
+
+
+def import_rows(kind, rows, batch_size=500, workers=8, source_dir=None, start=0, enqueue_ingest=True):
+    """Import catalogue ``rows`` in batches, yielding progress after each committed batch.
+
+    Rows before ``start`` are skipped, so an interrupted import resumes from
+    the last reported ``position``. Rows matching an existing row (same uid,
+    or same artiste and link type for links) update it; others are created.
+    """
+    spec = Spec(KINDS[kind])
+    lookups = Lookups()
+    started = time.monotonic()
+    position, imported, uploaded = start, 0, 0
+    rows = islice(rows, start, None)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                break
+            prepared = list(pool.map(lambda row: prepare(spec, row, source_dir), batch))
+            batch = [row for row, _ in prepared]
+            uploaded += sum(size for _, size in prepared)
+
+            resolvers = {}
+            for field in spec.relations:
+                if field.name == "album":
+                    continue
+                values = {row[field.name] for row in batch if row.get(field.name)}
+                ids = lookups.resolve(field.related_model, natural_key(field.related_model), values)
+                resolvers[field.name] = lambda row, ids=ids, name=field.name: ids.get(row.get(name))
+            if any(field.name == "album" for field in spec.relations):
+                artiste_ids = lookups.maps.get((Artiste, "user__email"), {})
+                album_model = spec.model._meta.get_field("album").related_model
+                resolvers["album"] = lookups.albums(album_model, batch, artiste_ids)
+
+            objects = [_build(spec, row, resolvers) for row in batch]
+            with transaction.atomic():
+                columns = set.intersection(*(set(row) for row in batch))
+                created = _save(spec, objects, columns, batch_size)
+            if enqueue_ingest and spec.model is Media:
+                for media in created:
+                    ingest.enqueue_media(media)
+
+            position += len(batch)
+            imported += len(batch)
+            elapsed = max(time.monotonic() - started, 1e-9)
+            yield {
+                "position": position,
+                "imported": imported,
+                "rows_per_second": imported / elapsed,
+                "megabytes_per_second": uploaded / elapsed / 1024 / 1024,
+            }
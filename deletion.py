@@ -0,0 +1,265 @@
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Count, F, Q
+from django.db.models.functions import Greatest
+
+from apps.artiste.models import AudioMedia
+from profiles import profile_cache, ranking, tasks
+from profiles.models import (
+    Comment,
+    EngagementBucket,
+    ItemNeighbour,
+    Media,
+    MediaComment,
+    PlayEvent,
+    Profile,
+    Reaction,
+    TrendingScore,
+    UploadSession,
+    UserLikeDislikeCount,
+)
+
+User = get_user_model()
+
+QUEUE = "storage"
+BATCH_SIZE = getattr(settings, "PROFILES_DELETE_BATCH_SIZE", 1000)
+# S3 DeleteObjects takes at most 1000 keys per call
+STORAGE_BATCH = 1000
+
+FILE_FIELDS = {
+    Media: ("file", "cover_image", "stream_file"),
+    Profile: ("profile_picture", "profile_song"),
+}
+# reactions whose counters must come down with the account's through rows: media and
+# profiles keep ``<accessor>_count`` on the row, songs keep theirs in SongRanking
+COUNTED = [
+    (Media, "likes"),
+    (Media, "dislikes"),
+    (Profile, "likes"),
+    (Profile, "dislikes"),
+    (AudioMedia, "likes"),
+    (AudioMedia, "dislikes"),
+]
+
+_deleting = ContextVar("profiles_deleting_users", default=frozenset())
+
+
+def in_progress(user_id):
+    """Whether ``delete_account`` is already tearing down ``user_id`` (its own deletes must not recurse)."""
+    return user_id in _deleting.get()
+
+
+@contextmanager
+def _deleting_user(user_id):
+    token = _deleting.set(_deleting.get() | {user_id})
+    try:
+        yield
+    finally:
+        _deleting.reset(token)
+
+
+def _through(model, accessor):
+    field = model._meta.get_field(accessor)
+    return field.remote_field.through, f"{field.m2m_field_name()}_id", f"{field.m2m_reverse_field_name()}_id"
+
+
+def _uncounter(model, accessor):
+    """Callback taking a batch of through rows the account gave off the counters of what they point at."""
+    through, object_column, _ = _through(model, accessor)
+
+    def uncount(pks):
+        deltas = dict(
+            through.objects.filter(pk__in=pks)
+            .values_list(object_column)
+            .annotate(n=Count("pk"))
+            .values_list(object_column, "n")
+        )
+        if model is AudioMedia:
+            removed = {pk: -n for pk, n in deltas.items()}
+            ranking.adjust_song_reactions(*((removed, {}) if accessor == "likes" else ({}, removed)))
+        elif deltas:
+            counter = f"{accessor}_count"
+            model.objects.filter(pk__in=deltas).update(
+                **{counter: Greatest(F(counter) - ranking.delta_case("pk", deltas), 0)}
+            )
+
+    return uncount
+
+
+def steps(user_id):
+    """``(label, queryset, on_batch)`` for everything an account owns, children before parents.
+
+    Rows on the account's own media and profile go as well as the account's
+    activity elsewhere (likes, comments, plays). Loose ``object_id``
+    references (rollups, trending, neighbours, reactions) are included
+    since no foreign key cascades to them. ``on_batch``, when set, runs
+    with each batch's primary keys in the transaction that deletes them.
+    """
+    media = Media.objects.filter(owner_id=user_id).values("pk")
+    result = []
+    for model, accessor in COUNTED:
+        through, object_column, user_column = _through(model, accessor)
+        label = f"{model._meta.label}.{accessor}"
+        if model is not AudioMedia:
+            # the account's own songs go with its artiste, through rows and all
+            own = {f"{object_column}__in": media} if model is Media else {object_column: user_id}
+            result.append((f"{label} on own", through.objects.filter(**own), None))
+        result.append(
+            (f"{label} given", through.objects.filter(**{user_column: user_id}), _uncounter(model, accessor))
+        )
+    result += [
+        ("profiles.MediaComment", MediaComment.objects.filter(Q(media__in=media) | Q(commenter_id=user_id)), None),
+        ("profiles.Comment", Comment.objects.filter(Q(profile_id=user_id) | Q(commenter_id=user_id)), None),
+        ("profiles.PlayEvent", PlayEvent.objects.filter(Q(media__in=media) | Q(user_id=user_id)), None),
+        (
+            "profiles.UserLikeDislikeCount",
+            UserLikeDislikeCount.objects.filter(Q(song__in=media) | Q(user_id=user_id) | Q(profile_id=user_id)),
+            None,
+        ),
+        (
+            "profiles.Reaction",
+            Reaction.objects.filter(
+                Q(user_id=user_id)
+                | Q(kind=Reaction.KIND_MEDIA, object_id__in=media)
+                | Q(kind=Reaction.KIND_PROFILE, object_id=user_id)
+            ),
+            None,
+        ),
+        (
+            "profiles.EngagementBucket",
+            EngagementBucket.objects.filter(kind=EngagementBucket.KIND_MEDIA, object_id__in=media),
+            None,
+        ),
+        (
+            "profiles.TrendingScore",
+            TrendingScore.objects.filter(kind=EngagementBucket.KIND_MEDIA, object_id__in=media),
+            None,
+        ),
+        (
+            "profiles.ItemNeighbour",
+            ItemNeighbour.objects.filter(Q(item_id__in=media) | Q(neighbour_id__in=media)),
+            None,
+        ),
+        ("profiles.UploadSession", UploadSession.objects.filter(user_id=user_id), None),
+        ("profiles.Media", Media.objects.filter(owner_id=user_id), None),
+        ("profiles.Profile", Profile.objects.filter(user_id=user_id), None),
+    ]
+    return result
+
+
+def _variant_names(variants):
+    for value in (variants or {}).values():
+        if isinstance(value, dict):
+            yield from _variant_names(value)
+        elif isinstance(value, str) and value:
+            yield value
+
+
+def files(user_id):
+    """``{(model_label, field_name): [stored name, ...]}`` for every file the account's rows reference."""
+    result = defaultdict(list)
+    owned = {Media: Media.objects.filter(owner_id=user_id), Profile: Profile.objects.filter(user_id=user_id)}
+    for model, queryset in owned.items():
+        names = FILE_FIELDS[model]
+        variant_fields = [f"{name}_variants" for name in names if hasattr(model, f"{name}_variants")]
+        for row in queryset.values(*names, *variant_fields).iterator(chunk_size=BATCH_SIZE):
+            for name in names:
+                key = (model._meta.label, name)
+                if row[name]:
+                    result[key].append(row[name])
+                if f"{name}_variants" in row:
+                    # the "src" entry repeats the original
+                    result[key] += [n for n in _variant_names(row[f"{name}_variants"]) if n != row[name]]
+    return dict(result)
+
+
+def instance_files(instance):
+    """The same, for a single ``Media`` or ``Profile`` instance that is already gone from the database."""
+    result = {}
+    for name in FILE_FIELDS[type(instance)]:
+        names = [getattr(instance, name).name] if getattr(instance, name) else []
+        names += [n for n in _variant_names(getattr(instance, f"{name}_variants", None)) if n not in names]
+        if names:
+            result[(instance._meta.label, name)] = names
+    return result
+
+
+def plan(user_id):
+    """Dry run: how many rows each step would delete and how many files would be removed."""
+    report = {label: queryset.count() for label, queryset, _ in steps(user_id)}
+    report["files"] = sum(len(names) for names in files(user_id).values())
+    return report
+
+
+def _delete_in_batches(queryset, batch_size, on_batch=None):
+    model = queryset.model
+    deleted = 0
+    while True:
+        pks = list(queryset.values_list("pk", flat=True)[:batch_size])
+        if not pks:
+            return deleted
+        # a re-run after a failure only sees (and uncounts) what is still there
+        with transaction.atomic():
+            if on_batch is not None:
+                on_batch(pks)
+            model.objects.filter(pk__in=pks).delete()
+        deleted += len(pks)
+
+
+def queue_files(files_by_field):
+    """Hand stored files to the storage worker, STORAGE_BATCH names per task."""
+    for (model_label, field_name), names in files_by_field.items():
+        for start in range(0, len(names), STORAGE_BATCH):
+            tasks.enqueue(
+                "profiles.deletion.delete_files",
+                model_label,
+                field_name,
+                names[start : start + STORAGE_BATCH],
+                queue=QUEUE,
+            )
+
+
+def delete_account(user_id, batch_size=BATCH_SIZE, dry_run=False):
+    """Delete an account and everything it owns with set-based batched deletes; returns a report.
+
+    Each step deletes BATCH_SIZE primary keys per statement, children before
+    parents, so the ORM never has to walk the cascade row by row. Stored
+    files are removed afterwards by the storage worker.
+    """
+    if dry_run:
+        return plan(user_id)
+    stored = files(user_id)
+    report = {}
+    with _deleting_user(user_id):
+        for label, queryset, on_batch in steps(user_id):
+            report[label] = _delete_in_batches(queryset, batch_size, on_batch)
+        # what is left belongs to other apps (artiste, fan...) and cascades through their own signals
+        with transaction.atomic():
+            report["users.User"] = User.objects.filter(pk=user_id).delete()[0]
+            profile_cache.invalidate(user_id)
+    queue_files(stored)
+    report["files"] = sum(len(names) for names in stored.values())
+    return report
+
+
+def delete_files(model_label, field_name, names):
+    """Storage worker task: remove ``names`` from the field's storage, in one bulk call where supported."""
+    storage = apps.get_model(model_label)._meta.get_field(field_name).storage
+    if hasattr(storage, "delete_many"):
+        failed = storage.delete_many(names)
+    else:
+        failed = []
+        for name in names:
+            try:
+                storage.delete(name)
+            except OSError:
+                failed.append(name)
+    if failed:
+        # the task is retried; deleting an already deleted object is a no-op
+        raise RuntimeError(f"Could not delete {len(failed)} of {len(names)} files, e.g. {failed[0]}")
@@ -0,0 +1,135 @@
+import io
+import os
+import posixpath
+import tempfile
+
+from django.conf import settings
+from django.core import signing
+from django.core.files.base import ContentFile
+from django.urls import reverse
+from PIL import Image, ImageOps, features
+
+from profiles import tasks
+
+QUEUE = "images"
+WIDTHS = getattr(settings, "PROFILES_IMAGE_WIDTHS", (160, 320, 640, 1080))
+QUALITY = getattr(settings, "PROFILES_IMAGE_QUALITY", 75)
+CACHE_DIR = getattr(settings, "PROFILES_IMAGE_CACHE_DIR", os.path.join(tempfile.gettempdir(), "profiles-images"))
+FORMATS = tuple(fmt for fmt in ("webp", "avif") if features.check(fmt))
+CONTENT_TYPES = {"webp": "image/webp", "avif": "image/avif"}
+
+_SALT = "profiles.images"
+
+
+def derivative_name(name, width, fmt):
+    root, _ = posixpath.splitext(name)
+    return f"{root}__w{width}.{fmt}"
+
+
+def render(source, width, fmt):
+    """Return ``source`` (an open PIL image) scaled down to ``width`` and encoded as ``fmt``."""
+    image = source.copy()
+    image.thumbnail((width, width * 4), Image.LANCZOS)
+    if image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGBA" if "transparency" in image.info else "RGB")
+    buffer = io.BytesIO()
+    image.save(buffer, fmt.upper(), quality=QUALITY)
+    return buffer.getvalue()
+
+
+def open_source(storage, name):
+    with storage.open(name, "rb") as f:
+        image = Image.open(io.BytesIO(f.read()))
+    return ImageOps.exif_transpose(image)
+
+
+def generate(field_file):
+    """Write every derivative of ``field_file`` next to it and return the variants map."""
+    storage = field_file.storage
+    source = open_source(storage, field_file.name)
+    variants = {"src": field_file.name}
+    for fmt in FORMATS:
+        variants[fmt] = {}
+        for width in WIDTHS:
+            if width >= source.width:
+                continue
+            name = derivative_name(field_file.name, width, fmt)
+            if storage.exists(name):
+                storage.delete(name)
+            variants[fmt][str(width)] = storage.save(name, ContentFile(render(source, width, fmt)))
+    return variants
+
+
+def generate_for(model_label, pk, field_name):
+    from django.apps import apps
+
+    model = apps.get_model(model_label)
+    instance = model.objects.filter(pk=pk).first()
+    if instance is None:
+        return
+    field_file = getattr(instance, field_name)
+    variants = generate(field_file) if field_file else {}
+    model.objects.filter(pk=pk).update(**{f"{field_name}_variants": variants})
+
+
+def enqueue(instance, field_name):
+    field_file = getattr(instance, field_name)
+    variants = getattr(instance, f"{field_name}_variants") or {}
+    if (field_file.name or None) != variants.get("src"):
+        tasks.enqueue("profiles.images.generate_for", instance._meta.label, instance.pk, field_name, queue=QUEUE)
+
+
+def lazy_url(name, width, fmt):
+    token = signing.dumps({"n": name, "w": width, "f": fmt}, salt=_SALT, compress=True)
+    return reverse("image_derivative", kwargs={"token": token})
+
+
+def srcset(field_file, variants, request=None):
+    """``{"original": url, "webp": {"320": url, ...}, ...}`` for a serializer.
+
+    Images whose derivatives have not been generated yet point at the lazy
+    endpoint, which renders and disk-caches each size on first request.
+    """
+    if not field_file:
+        return None
+    storage = field_file.storage
+    result = {"original": field_file.url}
+    if variants and variants.get("src") == field_file.name:
+        for fmt in FORMATS:
+            result[fmt] = {width: storage.url(name) for width, name in variants.get(fmt, {}).items()}
+    else:
+        for fmt in FORMATS:
+            urls = {str(width): lazy_url(field_file.name, width, fmt) for width in WIDTHS}
+            if request is not None:
+                urls = {width: request.build_absolute_uri(url) for width, url in urls.items()}
+            result[fmt] = urls
+    return result
+
+
+def thumbnail(storage, name, variants, request=None):
+    """URL of the smallest derivative of image ``name``, for compact listings."""
+    if not name:
+        return None
+    if not FORMATS:
+        return storage.url(name)
+    fmt = FORMATS[0]
+    if variants and variants.get("src") == name and variants.get(fmt):
+        return storage.url(variants[fmt][min(variants[fmt], key=int)])
+    url = lazy_url(name, min(WIDTHS), fmt)
+    return request.build_absolute_uri(url) if request is not None else url
+
+
+def cached_derivative(token, storage):
+    """Return ``(path, content_type)`` for a lazy derivative, rendering it into CACHE_DIR on a miss."""
+    data = signing.loads(token, salt=_SALT)
+    name, width, fmt = data["n"], int(data["w"]), data["f"]
+    if fmt not in FORMATS or width not in WIDTHS:
+        raise signing.BadSignature("Unsupported derivative")
+    path = os.path.join(CACHE_DIR, derivative_name(name, width, fmt).lstrip("/"))
+    if not os.path.exists(path):
+        source = open_source(storage, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=os.path.dirname(path), delete=False) as tmp:
+            tmp.write(render(source, min(width, source.width), fmt))
+        os.replace(tmp.name, path)
+    return path, CONTENT_TYPES[fmt]
@@ -0,0 +1,193 @@
+import io
+import logging
+import math
+import shutil
+import subprocess
+import tempfile
+import urllib.error
+import urllib.request
+from array import array
+
+import mutagen
+from django.conf import settings
+from django.core.files import File
+
+from profiles import tasks
+from profiles.models import Media
+from profiles.utils import format_duration_ms
+
+logger = logging.getLogger(__name__)
+
+QUEUE = "ingest"
+WAVEFORM_POINTS = getattr(settings, "PROFILES_WAVEFORM_POINTS", 200)
+WAVEFORM_SAMPLE_RATE = 4000
+STREAM_BITRATE = getattr(settings, "PROFILES_STREAM_BITRATE", "96k")
+FFMPEG = getattr(settings, "PROFILES_FFMPEG", None) or shutil.which("ffmpeg")
+
+
+class RangeFile(io.RawIOBase):
+    """Read-only, seekable view of a remote file fetched block by block with HTTP ``Range`` requests.
+
+    mutagen only touches the headers (and sometimes a trailing tag), so this
+    avoids pulling the whole object from S3 to read a duration.
+    """
+
+    block_size = 64 * 1024
+
+    def __init__(self, url, name=""):
+        self.url = url
+        self.name = name
+        self.position = 0
+        self.size = None
+        self.blocks = {}
+
+    def _fetch(self, index):
+        if index not in self.blocks:
+            start = index * self.block_size
+            request = urllib.request.Request(self.url, headers={"Range": f"bytes={start}-{start + self.block_size - 1}"})
+            try:
+                with urllib.request.urlopen(request) as response:
+                    status, body = response.status, response.read()
+                    content_range = response.headers.get("Content-Range", "")
+            except urllib.error.HTTPError as exc:
+                if exc.code != 416:
+                    raise
+                # past the end of an object whose size the server never told us
+                status, body, content_range = exc.code, b"", ""
+            if status == 200:
+                # the server ignored the Range header and sent the whole object; keep all of it
+                self.size = len(body)
+                for offset in range(0, len(body), self.block_size):
+                    self.blocks[offset // self.block_size] = body[offset : offset + self.block_size]
+            else:
+                if self.size is None and "/" in content_range and not content_range.endswith("*"):
+                    self.size = int(content_range.rsplit("/", 1)[-1])
+                self.blocks[index] = body
+        return self.blocks.get(index, b"")
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_END:
+            if self.size is None:
+                self._fetch(0)
+            if self.size is None:
+                raise io.UnsupportedOperation(f"The server did not report the size of {self.url}")
+            offset += self.size
+        elif whence == io.SEEK_CUR:
+            offset += self.position
+        self.position = max(offset, 0)
+        return self.position
+
+    def readinto(self, buffer):
+        if self.size is None:
+            self._fetch(0)
+        view = memoryview(buffer)
+        written = 0
+        while written < len(view) and (self.size is None or self.position < self.size):
+            index, offset = divmod(self.position, self.block_size)
+            block = self._fetch(index)[offset:]
+            if not block:
+                break
+            chunk = block[: len(view) - written]
+            view[written : written + len(chunk)] = chunk
+            written += len(chunk)
+            self.position += len(chunk)
+        return written
+
+
+def local_path(field_file):
+    try:
+        return field_file.storage.path(field_file.name)
+    except NotImplementedError:
+        return None
+
+
+def open_headers(field_file):
+    path = local_path(field_file)
+    if path:
+        return open(path, "rb")
+    return io.BufferedReader(RangeFile(field_file.url, name=field_file.name), buffer_size=RangeFile.block_size)
+
+
+def read_duration_ms(field_file):
+    with open_headers(field_file) as f:
+        info = mutagen.File(f)
+    if info is None:
+        raise ValueError(f"Unrecognised audio file: {field_file.name}")
+    return int(round(info.info.length * 1000))
+
+
+def ffmpeg_input(field_file):
+    return local_path(field_file) or field_file.url
+
+
+def compute_waveform(field_file, duration_ms, points=WAVEFORM_POINTS):
+    """Return ``points`` peak amplitudes in 0..1, decoding a low-rate mono stream chunk by chunk."""
+    total = max(int(duration_ms / 1000 * WAVEFORM_SAMPLE_RATE), points)
+    per_point = math.ceil(total / points)
+    command = [
+        FFMPEG, "-v", "error", "-i", ffmpeg_input(field_file),
+        "-vn", "-ac", "1", "-ar", str(WAVEFORM_SAMPLE_RATE), "-f", "s16le", "-",
+    ]
+    peaks = []
+    pending = array("h")
+    with subprocess.Popen(command, stdout=subprocess.PIPE) as process:
+        while True:
+            data = process.stdout.read(per_point * 2 * 64)
+            if not data:
+                break
+            pending.frombytes(data[: len(data) - len(data) % 2])
+            while len(pending) >= per_point:
+                chunk = pending[:per_point]
+                peaks.append(max(max(chunk), -min(chunk)))
+                del pending[:per_point]
+        if pending:
+            peaks.append(max(max(pending), -min(pending)))
+    if process.returncode:
+        raise RuntimeError(f"ffmpeg exited with {process.returncode} while decoding {field_file.name}")
+    loudest = max(peaks, default=0) or 1
+    return [round(p / loudest, 3) for p in peaks[:points]]
+
+
+def transcode_stream(media):
+    with tempfile.NamedTemporaryFile(suffix=".m4a") as output:
+        subprocess.run(
+            [
+                FFMPEG, "-v", "error", "-y", "-i", ffmpeg_input(media.file),
+                "-vn", "-ac", "2", "-c:a", "aac", "-b:a", STREAM_BITRATE, "-movflags", "+faststart", output.name,
+            ],
+            check=True,
+        )
+        media.stream_file.save(f"{media.uid}.m4a", File(output), save=False)
+
+
+def ingest_media(media_id):
+    media = Media.objects.filter(pk=media_id).first()
+    if media is None or not media.file:
+        return
+    Media.objects.filter(pk=media_id).update(ingest_status=Media.INGEST_PROCESSING, ingest_error="")
+    try:
+        media.duration_ms = read_duration_ms(media.file)
+        media.duration = format_duration_ms(media.duration_ms)
+        if FFMPEG:
+            media.waveform = compute_waveform(media.file, media.duration_ms)
+            transcode_stream(media)
+        else:
+            logger.warning("ffmpeg not found; skipping waveform and stream rendition for media %s", media_id)
+    except Exception as exc:
+        Media.objects.filter(pk=media_id).update(ingest_status=Media.INGEST_FAILED, ingest_error=str(exc))
+        raise
+    media.ingest_status = Media.INGEST_READY
+    media.save(update_fields=["duration", "duration_ms", "waveform", "stream_file", "ingest_status"])
+
+
+def enqueue_media(media):
+    tasks.enqueue("profiles.ingest.ingest_media", media.pk, queue=QUEUE)
@@ -0,0 +1,342 @@
+import logging
+import re
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.core import mail
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import Http404, HttpResponse
+from django.utils.crypto import constant_time_compare
+from django.utils.decorators import sync_and_async_middleware
+
+logger = logging.getLogger(__name__)
+
+DUPLICATE_THRESHOLD = getattr(settings, "PROFILES_DUPLICATE_QUERY_THRESHOLD", 3)
+SERVER_TIMING = getattr(settings, "PROFILES_SERVER_TIMING", True)
+METRICS_TOKEN = getattr(settings, "PROFILES_METRICS_TOKEN", None)
+
+SECONDS_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+HISTOGRAMS = {
+    "queries": (1, 2, 5, 10, 20, 50, 100, 200, 500),
+    "db_seconds": SECONDS_BUCKETS,
+    "serialize_seconds": SECONDS_BUCKETS,
+    "duration_seconds": SECONDS_BUCKETS,
+    "response_bytes": (1024, 10240, 102400, 1048576, 10485760),
+}
+
+_stats = ContextVar("profiles_request_stats", default=None)
+_serializing = ContextVar("profiles_serializing", default=False)
+
+
+class QueryBudgetExceeded(AssertionError):
+    """A view ran more queries than its ``query_budget``; raised when budgets are strict (see ``strict()``)."""
+
+
+def strict():
+    """Whether an exceeded budget raises: PROFILES_QUERY_BUDGET_STRICT, else under DEBUG and the test runner."""
+    # setup_test_environment() installs mail.outbox for the duration of a test run
+    return getattr(settings, "PROFILES_QUERY_BUDGET_STRICT", settings.DEBUG or hasattr(mail, "outbox"))
+
+
+def _enforced(func, max_queries, label):
+    """Wrap a view callable so it checks its own budget when no instrumented request is counting already.
+
+    Tests call views directly, past the middleware; outside strict mode this
+    is a pass-through and the middleware's logging is all there is.
+    """
+
+    def check(stats):
+        if stats.queries > max_queries:
+            raise QueryBudgetExceeded(_exceeded(label, stats, max_queries))
+
+    if iscoroutinefunction(func):
+
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            if _stats.get() is not None or not strict():
+                return await func(*args, **kwargs)
+            stats = _counting()
+            token = _stats.set(stats)
+            try:
+                response = await func(*args, **kwargs)
+            finally:
+                _stats.reset(token)
+            check(stats)
+            return response
+
+    else:
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if _stats.get() is not None or not strict():
+                return func(*args, **kwargs)
+            stats = _counting()
+            token = _stats.set(stats)
+            try:
+                response = func(*args, **kwargs)
+            finally:
+                _stats.reset(token)
+            check(stats)
+            return response
+
+    return wrapper
+
+
+def query_budget(max_queries):
+    """Declare the most queries a view (class or function) may run per request."""
+
+    def decorate(view):
+        if isinstance(view, type):
+            view.dispatch = _enforced(view.dispatch, max_queries, view.__name__)
+        else:
+            view = _enforced(view, max_queries, view.__name__)
+        view.query_budget = max_queries
+        return view
+
+    return decorate
+
+
+def _budget(view):
+    for candidate in (view, getattr(view, "view_class", None), getattr(view, "cls", None)):
+        budget = getattr(candidate, "query_budget", None)
+        if budget is not None:
+            return budget
+    return None
+
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_LISTS = re.compile(r"\((?:\s*%s\s*,)+\s*%s\s*\)")
+
+
+def signature(sql):
+    """SQL with literals and ``IN (...)`` lists collapsed, so the queries of an N+1 loop share one signature."""
+    return _LISTS.sub("(%s, ...)", _LITERALS.sub("?", sql))
+
+
+class Stats:
+    """What one request spent: queries, DB time, serializer time."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.serialize_seconds = 0.0
+        self.signatures = Counter()
+        self.lock = threading.Lock()
+
+    def add_query(self, sql, seconds):
+        with self.lock:
+            self.queries += 1
+            self.db_seconds += seconds
+            self.signatures[signature(sql)] += 1
+
+    def add_serialize(self, seconds):
+        with self.lock:
+            self.serialize_seconds += seconds
+
+    def duplicates(self):
+        return [(sql, n) for sql, n in self.signatures.most_common() if n >= DUPLICATE_THRESHOLD]
+
+
+def _record(execute, sql, params, many, context):
+    stats = _stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.add_query(sql, time.perf_counter() - started)
+
+
+def install(connection, **kwargs):
+    """Attach the query recorder to a database connection; a no-op outside instrumented requests."""
+    if _record not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record)
+
+
+connection_created.connect(install)
+
+
+def _counting():
+    """A fresh ``Stats``, with the recorder on this thread's connections even if they opened before this import."""
+    for connection in connections.all():
+        install(connection)
+    return Stats()
+
+
+def _exceeded(label, stats, budget):
+    repeated = "; ".join(f"{n}x {sql[:200]}" for sql, n in stats.duplicates()[:3]) or "none"
+    return f"{label} ran {stats.queries} queries (budget {budget}); repeated: {repeated}"
+
+
+class TimedSerializerMixin:
+    """Count the time spent in ``to_representation`` towards the request's serializer time.
+
+    Nested serializers only count once, through the outermost one.
+    """
+
+    def to_representation(self, instance):
+        stats = _stats.get()
+        if stats is None or _serializing.get():
+            return super().to_representation(instance)
+        token = _serializing.set(True)
+        started = time.perf_counter()
+        try:
+            return super().to_representation(instance)
+        finally:
+            stats.add_serialize(time.perf_counter() - started)
+            _serializing.reset(token)
+
+
+class Metrics:
+    """Per-process request metrics by route, rendered in the Prometheus text format."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = Counter()
+        self.histograms = {}
+        self.totals = Counter()
+        self.gauges = {}
+
+    def inc(self, name, n=1):
+        """Add ``n`` to the unlabelled counter ``profiles_<name>``."""
+        with self.lock:
+            self.totals[name] += n
+
+    def gauge(self, name, value):
+        with self.lock:
+            self.gauges[name] = value
+
+    def observe(self, route, values, exceeded, duplicates):
+        with self.lock:
+            self.counters[("requests_total", route)] += 1
+            self.counters[("query_budget_exceeded_total", route)] += int(exceeded)
+            self.counters[("duplicate_queries_total", route)] += duplicates
+            for name, value in values.items():
+                buckets = HISTOGRAMS[name]
+                counts, total = self.histograms.get((name, route), ([0] * len(buckets), 0.0))
+                for i, bound in enumerate(buckets):
+                    if value <= bound:
+                        counts[i] += 1
+                self.histograms[(name, route)] = (counts, total + value)
+
+    def render(self):
+        lines = []
+        with self.lock:
+            for name in ("requests_total", "query_budget_exceeded_total", "duplicate_queries_total"):
+                lines.append(f"# TYPE profiles_{name} counter")
+                for (metric, route), value in sorted(self.counters.items()):
+                    if metric == name:
+                        lines.append(f'profiles_{name}{{route="{route}"}} {value}')
+            for name, buckets in HISTOGRAMS.items():
+                lines.append(f"# TYPE profiles_request_{name} histogram")
+                for (metric, route), (counts, total) in sorted(self.histograms.items()):
+                    if metric != name:
+                        continue
+                    count = self.counters[("requests_total", route)]
+                    for bound, n in zip(buckets, counts):
+                        lines.append(f'profiles_request_{name}_bucket{{route="{route}",le="{bound}"}} {n}')
+                    lines.append(f'profiles_request_{name}_bucket{{route="{route}",le="+Inf"}} {count}')
+                    lines.append(f'profiles_request_{name}_sum{{route="{route}"}} {total}')
+                    lines.append(f'profiles_request_{name}_count{{route="{route}"}} {count}')
+            for name, value in sorted(self.totals.items()):
+                lines.append(f"# TYPE profiles_{name} counter")
+                lines.append(f"profiles_{name} {value}")
+            for name, value in sorted(self.gauges.items()):
+                lines.append(f"# TYPE profiles_{name} gauge")
+                lines.append(f"profiles_{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+
+def _finish(request, response, stats):
+    duration = time.perf_counter() - stats.started
+    match = getattr(request, "resolver_match", None)
+    route = match.route if match else "unmatched"
+    budget = _budget(match.func) if match else None
+    duplicates = stats.duplicates()
+    exceeded = budget is not None and stats.queries > budget
+    size = 0 if response.streaming else len(response.content)
+    metrics.observe(
+        route,
+        {
+            "queries": stats.queries,
+            "db_seconds": stats.db_seconds,
+            "serialize_seconds": stats.serialize_seconds,
+            "duration_seconds": duration,
+            "response_bytes": size,
+        },
+        exceeded,
+        sum(n for _, n in duplicates),
+    )
+    if SERVER_TIMING:
+        response["Server-Timing"] = ", ".join(
+            [
+                f'db;dur={stats.db_seconds * 1000:.1f};desc="{stats.queries} queries"',
+                f"ser;dur={stats.serialize_seconds * 1000:.1f}",
+                f"total;dur={duration * 1000:.1f}",
+            ]
+        )
+    if exceeded:
+        message = _exceeded(f"{request.method} {route}", stats, budget)
+        if strict():
+            raise QueryBudgetExceeded(message)
+        logger.warning(message)
+    elif duplicates:
+        logger.info("%s %s repeated queries: %s", request.method, route, duplicates[:3])
+    return response
+
+
+@sync_and_async_middleware
+def instrumentation_middleware(get_response):
+    """Record queries, DB time, serializer time and response size per request.
+
+    Adds a ``Server-Timing`` header, feeds the ``/metrics`` counters, flags
+    repeated query signatures (N+1 loops) and enforces ``@query_budget``:
+    logging in production, raising ``QueryBudgetExceeded`` when budgets
+    are ``strict()`` (DEBUG and tests). Queries run on worker
+    threads through ``sync_to_async`` count towards the request too.
+    """
+    if iscoroutinefunction(get_response):
+
+        async def middleware(request):
+            stats = Stats()
+            token = _stats.set(stats)
+            try:
+                response = await get_response(request)
+            finally:
+                _stats.reset(token)
+            return _finish(request, response, stats)
+
+    else:
+
+        def middleware(request):
+            stats = Stats()
+            token = _stats.set(stats)
+            try:
+                response = get_response(request)
+            finally:
+                _stats.reset(token)
+            return _finish(request, response, stats)
+
+    return middleware
+
+
+def metrics_view(request):
+    """Prometheus scrape endpoint: bearer PROFILES_METRICS_TOKEN, or a staff session when no token is set."""
+    if METRICS_TOKEN:
+        allowed = constant_time_compare(request.headers.get("Authorization", ""), f"Bearer {METRICS_TOKEN}")
+    else:
+        allowed = request.user.is_staff
+    if not allowed:
+        raise Http404
+    return HttpResponse(metrics.render(), content_type="text/plain; version=0.0.4")
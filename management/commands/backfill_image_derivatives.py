@@ -0,0 +1,58 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from profiles import images
+from profiles.models import Media, Profile
+
+
+class _FieldFile:
+    """Picklable stand-in for a FieldFile; workers only touch storage, never the database."""
+
+    storage = default_storage
+
+    def __init__(self, name):
+        self.name = name
+
+
+class Command(BaseCommand):
+    help = "Generate WebP/AVIF derivatives for cover images and profile pictures that have none."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--processes", type=int, default=None)
+        parser.add_argument("--batch-size", type=int, default=200)
+
+    def handle(self, *args, **options):
+        targets = [
+            (Media, "cover_image", Media.objects.exclude(cover_image="")),
+            (Profile, "profile_picture", Profile.objects.exclude(profile_picture="")),
+        ]
+        for model, field_name, queryset in targets:
+            variants_field = f"{field_name}_variants"
+            pending = [
+                (pk, name)
+                for pk, name, variants in queryset.values_list("pk", field_name, variants_field).iterator()
+                if (variants or {}).get("src") != name
+            ]
+            self.stdout.write(f"{model.__name__}.{field_name}: {len(pending)} images to process")
+            # forked workers must not inherit open database connections
+            connections.close_all()
+            done = 0
+            for start in range(0, len(pending), options["batch_size"]):
+                batch = dict(pending[start : start + options["batch_size"]])
+                results = {}
+                with ProcessPoolExecutor(max_workers=options["processes"]) as pool:
+                    futures = {pool.submit(images.generate, _FieldFile(name)): pk for pk, name in batch.items()}
+                    for future in as_completed(futures):
+                        try:
+                            results[futures[future]] = future.result()
+                        except Exception as exc:
+                            self.stderr.write(f"{model.__name__} {futures[future]}: {exc}")
+                objects = [model(pk=pk, **{variants_field: variants}) for pk, variants in results.items()]
+                model.objects.bulk_update(objects, [variants_field])
+                connections.close_all()
+                done += len(results)
+                self.stdout.write(f"  {done}/{len(pending)}")
+        self.stdout.write(self.style.SUCCESS("Backfill complete."))
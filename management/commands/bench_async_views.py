@@ -0,0 +1,119 @@
+import asyncio
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.test import AsyncClient, Client
+from django.urls import reverse
+
+# endpoint -> (sync route, async route, query string)
+ENDPOINTS = {
+    "search": ("search", "async_search", "search=love"),
+    "suggestions": ("suggestions", "async_suggestions", ""),
+    "trending": ("trending_songs", "async_trending_songs", "window=week"),
+}
+
+
+def pct(values, p):
+    return values[min(int(len(values) * p), len(values) - 1)] * 1000 if values else 0.0
+
+
+class Command(BaseCommand):
+    help = (
+        "Load-test the sync and async read endpoints and report p50/p99 latency and throughput. "
+        "In-process by default (WSGI handler with a thread pool vs ASGI handler with asyncio); "
+        "with --base-url, over HTTP against running servers."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--endpoint", action="append", choices=sorted(ENDPOINTS))
+        parser.add_argument("--requests", type=int, default=500)
+        parser.add_argument("--concurrency", type=int, default=32)
+        parser.add_argument("--email", help="User to authenticate as (default: first active user).")
+        parser.add_argument("--base-url", help="Hit running servers instead, e.g. http://localhost:8000/api/profiles")
+        parser.add_argument("--async-base-url", help="Server for the async routes (default: --base-url).")
+        parser.add_argument("--header", action="append", default=[], help="Extra 'Name: value' header over HTTP.")
+
+    def handle(self, *args, **options):
+        self.options = options
+        user = None
+        if not options["base_url"]:
+            users = get_user_model().objects.filter(is_active=True)
+            user = users.filter(email=options["email"]).first() if options["email"] else users.order_by("pk").first()
+            if user is None:
+                raise CommandError("No user to authenticate as.")
+
+        self.stdout.write(f"{'endpoint':<12} {'path':<6} {'p50 ms':>9} {'p99 ms':>9} {'req/s':>9} {'errors':>7}")
+        for name in options["endpoint"] or sorted(ENDPOINTS):
+            sync_route, async_route, query = ENDPOINTS[name]
+            for path, route in (("sync", sync_route), ("async", async_route)):
+                url = reverse(route) + (f"?{query}" if query else "")
+                if options["base_url"]:
+                    base = options["base_url"] if path == "sync" else options["async_base_url"] or options["base_url"]
+                    result = self.run_http(base.rstrip("/") + url)
+                elif path == "sync":
+                    result = self.run_sync(url, user)
+                else:
+                    result = asyncio.run(self.run_async(url, user))
+                latencies, errors, elapsed = result
+                latencies.sort()
+                self.stdout.write(
+                    f"{name:<12} {path:<6} {pct(latencies, 0.5):>9.2f} {pct(latencies, 0.99):>9.2f} "
+                    f"{len(latencies) / elapsed:>9.1f} {errors:>7}"
+                )
+
+    def _timed(self, call):
+        started = time.perf_counter()
+        ok = call()
+        return time.perf_counter() - started, ok
+
+    def _pool(self, call):
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.options["concurrency"]) as pool:
+            results = list(pool.map(lambda _: self._timed(call), range(self.options["requests"])))
+        return [t for t, _ in results], sum(not ok for _, ok in results), time.perf_counter() - started
+
+    def run_sync(self, url, user):
+        cookies = Client()
+        cookies.force_login(user)
+        local = threading.local()
+
+        def call():
+            if not hasattr(local, "client"):
+                local.client = Client()
+                local.client.cookies = cookies.cookies
+            return local.client.get(url).status_code == 200
+
+        return self._pool(call)
+
+    def run_http(self, url):
+        headers = dict(header.split(":", 1) for header in self.options["header"])
+        headers = {key.strip(): value.strip() for key, value in headers.items()}
+
+        def call():
+            try:
+                with urllib.request.urlopen(urllib.request.Request(url, headers=headers), timeout=30) as response:
+                    response.read()
+                    return response.status == 200
+            except OSError:
+                return False
+
+        return self._pool(call)
+
+    async def run_async(self, url, user):
+        client = AsyncClient()
+        await asyncio.to_thread(client.force_login, user)
+        gate = asyncio.Semaphore(self.options["concurrency"])
+
+        async def call():
+            async with gate:
+                started = time.perf_counter()
+                response = await client.get(url)
+                return time.perf_counter() - started, response.status_code == 200
+
+        started = time.perf_counter()
+        results = await asyncio.gather(*(call() for _ in range(self.options["requests"])))
+        return [t for t, _ in results], sum(not ok for _, ok in results), time.perf_counter() - started
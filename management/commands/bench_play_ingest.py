@@ -0,0 +1,86 @@
+import random
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import override_settings
+
+from profiles import benchmarks, plays
+from profiles.models import Media, PlayEvent
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure sustained play-event ingestion (buffering, bulk writes, folding) in a throwaway test database. "
+        "Uses the shared buffer when PROFILES_PLAY_BUFFER_URL is set, otherwise a private in-memory one."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--events", type=int, default=200_000)
+        parser.add_argument("--batch", type=int, default=50, help="Events per client request.")
+        parser.add_argument("--threads", type=int, default=8, help="Concurrent producers.")
+        parser.add_argument("--duplicates", type=float, default=0.05, help="Share of events sent twice.")
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            with override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}):
+                self.run(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def run(self, options):
+        data = benchmarks.generate("small", options["seed"])
+        rng = random.Random(options["seed"])
+        uids = [str(uid) for uid in Media.objects.values_list("uid", flat=True)]
+        requests = []
+        for i in range(0, options["events"], options["batch"]):
+            events = [
+                {"media": rng.choice(uids), "session": f"s{i}-{j}", "duration_ms": 30_000}
+                for j in range(min(options["batch"], options["events"] - i))
+            ]
+            events += [dict(event) for event in events if rng.random() < options["duplicates"]]
+            requests.append(events)
+        # room for everything, so the run measures throughput rather than drops
+        buffer = plays.RedisBuffer(plays.BUFFER_URL) if plays.BUFFER_URL else plays.MemoryBuffer(options["events"])
+
+        totals = [0, 0, 0]
+        lock = threading.Lock()
+
+        def produce(chunk):
+            for events in chunk:
+                counts = plays.record(data["user"], events, buffer=buffer)
+                with lock:
+                    for i, n in enumerate(counts):
+                        totals[i] += n
+
+        started = time.perf_counter()
+        threads = [
+            threading.Thread(target=produce, args=(requests[i :: options["threads"]],))
+            for i in range(options["threads"])
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        offer_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        while plays.flush(buffer):
+            pass
+        write_seconds = time.perf_counter() - started
+        written = PlayEvent.objects.count()
+
+        started = time.perf_counter()
+        folded = plays.fold()
+        fold_seconds = time.perf_counter() - started
+
+        accepted, duplicates, dropped = totals
+        self.stdout.write(f"accepted/duplicate/dropped: {accepted} / {duplicates} / {dropped}")
+        self.stdout.write(f"buffering:  {accepted / offer_seconds:,.0f} events/s ({options['threads']} producers)")
+        self.stdout.write(f"bulk write: {written / write_seconds:,.0f} events/s ({written} rows)")
+        self.stdout.write(f"fold:       {folded / fold_seconds:,.0f} events/s")
+        total = offer_seconds + write_seconds + fold_seconds
+        self.stdout.write(self.style.SUCCESS(f"sustained:  {written / total:,.0f} events/s end to end"))
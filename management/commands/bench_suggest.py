@@ -0,0 +1,60 @@
+import random
+import resource
+import time
+
+from django.core.management.base import BaseCommand
+
+from profiles.search import normalize
+from profiles.suggest import KIND_SONG, SuggestIndex
+
+WORDS = (
+    "love night dance fire heart blue moon baby dream time rain gold city sun road summer sky angel crazy dark "
+    "sweet wild river home light girl boy party star money street queen king ghost desert ocean"
+).split()
+
+
+class Command(BaseCommand):
+    help = "Benchmark the typeahead index on a synthetic catalogue (no database access)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--size", type=int, default=1_000_000)
+        parser.add_argument("--queries", type=int, default=10_000)
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        rows = []
+        for i in range(options["size"]):
+            title = " ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 4))) + f" {rng.randint(0, 99999)}"
+            rows.append((KIND_SONG, i, title, int(rng.paretovariate(1.2)), normalize(title)))
+
+        rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        index = SuggestIndex(max_entries=options["size"])
+        start = time.perf_counter()
+        index.load(rows)
+        load_time = time.perf_counter() - start
+        rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+        queries = [rng.choice(WORDS)[: rng.randint(1, 6)] for _ in range(options["queries"])]
+        latencies = []
+        for query in queries:
+            start = time.perf_counter()
+            index.query(query)
+            latencies.append(time.perf_counter() - start)
+        latencies.sort()
+
+        updates = []
+        for i in range(1000):
+            start = time.perf_counter()
+            index.update(KIND_SONG, options["size"] + i, f"{rng.choice(WORDS)} new {i}", rng.randint(0, 1000))
+            updates.append(time.perf_counter() - start)
+        updates.sort()
+
+        def pct(values, p):
+            return values[min(int(len(values) * p), len(values) - 1)] * 1000
+
+        self.stdout.write(f"entries:        {len(index)}")
+        self.stdout.write(f"load:           {load_time:.2f}s")
+        self.stdout.write(f"peak rss delta: {(rss_after - rss_before) / 1024:.0f} MiB")
+        self.stdout.write(f"query p50/p99:  {pct(latencies, 0.5):.3f}ms / {pct(latencies, 0.99):.3f}ms")
+        self.stdout.write(f"update p50/p99: {pct(updates, 0.5):.3f}ms / {pct(updates, 0.99):.3f}ms")
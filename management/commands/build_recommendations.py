@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from profiles import recommend
+
+
+class Command(BaseCommand):
+    help = "Recompute the item-item neighbours behind the \"more of what you like\" feed."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--incremental",
+            action="store_true",
+            help="Only recompute items with engagement since the last run.",
+        )
+
+    def handle(self, *args, **options):
+        result = recommend.refresh() if options["incremental"] else recommend.build()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Stored neighbours for {result['items']} items "
+                f"from {result['interactions']} interactions in {result['seconds']:.1f}s."
+            )
+        )
@@ -0,0 +1,30 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from profiles import deletion
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete an account and everything it owns with batched set-based deletes, "
+        "queueing its stored files for the storage worker. --dry-run only reports what would go."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("email")
+        parser.add_argument("--dry-run", action="store_true")
+        parser.add_argument("--batch-size", type=int, default=deletion.BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        user_id = User.objects.filter(email=options["email"]).values_list("pk", flat=True).first()
+        if user_id is None:
+            raise CommandError(f"No account with email {options['email']}.")
+        report = deletion.delete_account(user_id, batch_size=options["batch_size"], dry_run=options["dry_run"])
+        for label, count in report.items():
+            self.stdout.write(f"{label:<40} {count:>10}")
+        if options["dry_run"]:
+            self.stdout.write("Dry run: nothing was deleted.")
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Deleted {options['email']}; {report['files']} files queued."))
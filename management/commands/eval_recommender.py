@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from profiles import recommend
+
+
+class Command(BaseCommand):
+    help = "Offline evaluation of the recommender: precision@k and recall@k on held-out likes, plus latency."
+
+    def add_arguments(self, parser):
+        parser.add_argument("-k", type=int, default=10)
+        parser.add_argument("--holdout", type=float, default=0.2)
+        parser.add_argument("--users", type=int, default=1000)
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        report = recommend.evaluate(
+            k=options["k"], holdout=options["holdout"], users=options["users"], seed=options["seed"]
+        )
+        for name, value in report.items():
+            self.stdout.write(f"{name:>16}: {value:.4f}" if isinstance(value, float) else f"{name:>16}: {value}")
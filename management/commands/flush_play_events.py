@@ -0,0 +1,41 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from profiles import plays
+
+
+class Command(BaseCommand):
+    help = (
+        "Drain the shared (Redis) play buffer into PlayEvent rows and fold them into play counters. "
+        "With the in-process buffer each web process flushes itself; this then only folds."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="Run one drain and fold pass, then exit.")
+        parser.add_argument("--fold-interval", type=float, default=plays.FOLD_INTERVAL)
+
+    def handle(self, *args, **options):
+        buffer = plays.get_buffer() if plays.BUFFER_URL else None
+        last_fold = 0.0
+        while True:
+            written = 0
+            if buffer is not None:
+                while True:
+                    try:
+                        taken = plays.flush(buffer)
+                    except Exception as exc:
+                        # the batch is back in the buffer; retry it after FLUSH_INTERVAL
+                        self.stderr.write(f"Writing play events failed: {exc}")
+                        break
+                    written += taken
+                    if taken < plays.FLUSH_SIZE:
+                        break
+            if options["once"] or time.monotonic() - last_fold >= options["fold_interval"]:
+                last_fold = time.monotonic()
+                folded = plays.fold()
+                self.stdout.write(f"Wrote {written} play events, folded {folded}.")
+            if options["once"]:
+                return
+            if not written:
+                time.sleep(plays.FLUSH_INTERVAL)
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from profiles import artiste_links, schema
+
+
+class Command(BaseCommand):
+    help = "Fold the legacy Profile.*_link columns into artiste Links and remove duplicate links."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument("--clear", action="store_true", help="Blank the legacy columns once folded.")
+
+    def handle(self, *args, **options):
+        removed = artiste_links.dedupe()
+        self.stdout.write(f"Removed {removed} duplicate links.")
+        # the (artiste, link_type) unique index can only be built once the duplicates are gone
+        schema.ensure_indexes()
+        folded = artiste_links.fold_legacy(batch_size=options["batch_size"], clear=options["clear"])
+        self.stdout.write(self.style.SUCCESS(f"Folded {folded} legacy profile links into Links."))
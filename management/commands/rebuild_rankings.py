@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from profiles import ranking
+
+
+class Command(BaseCommand):
+    help = "Recompute song/artiste counters from scratch and rebuild every leaderboard."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument(
+            "--boards-only", action="store_true", help="Skip the counter recount and only rebuild the boards."
+        )
+
+    def handle(self, *args, **options):
+        if not options["boards_only"]:
+            ranking.rebuild_counters(batch_size=options["batch_size"])
+            self.stdout.write("Counters rebuilt.")
+        ranking.refresh_all_boards()
+        self.stdout.write(self.style.SUCCESS("Leaderboards rebuilt."))
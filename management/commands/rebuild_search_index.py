@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from profiles import search
+
+
+class Command(BaseCommand):
+    help = "Rebuild the song/artiste search documents and the database full-text index."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        search.rebuild(batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Search index rebuilt ({search.get_backend().__class__.__name__})."))
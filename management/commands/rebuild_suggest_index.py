@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from profiles import suggest
+
+
+class Command(BaseCommand):
+    help = "Rebuild the typeahead snapshot from the catalogue; running workers pick it up on their next reload check."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--output", help="Snapshot path (defaults to PROFILES_SUGGEST_SNAPSHOT).")
+
+    def handle(self, *args, **options):
+        path = options["output"] or suggest.SNAPSHOT_PATH
+        if not path:
+            raise CommandError("Set PROFILES_SUGGEST_SNAPSHOT or pass --output.")
+        start = time.perf_counter()
+        rows = list(suggest.build_rows())
+        suggest.save_snapshot(path, rows)
+        self.stdout.write(
+            self.style.SUCCESS(f"Wrote {len(rows)} entries to {path} in {time.perf_counter() - start:.1f}s.")
+        )
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from profiles import reactions, ranking
+from profiles.models import LeaderboardEntry
+
+
+class Command(BaseCommand):
+    help = (
+        "Recount likes/dislikes counters from the reactions table and repair any drift. "
+        "migrate runs the legacy M2M import once by itself; --import-m2m repeats it by hand."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--import-m2m",
+            action="store_true",
+            help="First copy reactions from the legacy likes/dislikes M2M tables (likes win over dislikes).",
+        )
+        parser.add_argument("--batch-size", type=int, default=5000)
+
+    def handle(self, *args, **options):
+        if options["import_m2m"]:
+            reactions.import_legacy(options["batch_size"])
+            self.stdout.write("Imported legacy reactions.")
+        for kind, repaired in reactions.reconcile().items():
+            self.stdout.write(f"{kind}: repaired {repaired} counters.")
+        ranking.refresh_board(LeaderboardEntry.BOARD_MOST_LIKED_SONGS)
+        self.stdout.write(self.style.SUCCESS("Reaction counters reconciled."))
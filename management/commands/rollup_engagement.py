@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from profiles import rollups
+
+
+class Command(BaseCommand):
+    help = "Compact hourly engagement buckets into daily ones and recompute trending scores."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--import-legacy",
+            action="store_true",
+            help="First fold UserLikeDislikeCount rows into daily buckets (run once).",
+        )
+        parser.add_argument("--skip-compact", action="store_true")
+
+    def handle(self, *args, **options):
+        if options["import_legacy"]:
+            imported = rollups.import_legacy()
+            self.stdout.write(f"Imported {imported} legacy daily buckets.")
+        if not options["skip_compact"]:
+            folded = rollups.compact()
+            self.stdout.write(f"Folded {folded} hourly buckets into daily ones.")
+        rollups.refresh_trending()
+        self.stdout.write(self.style.SUCCESS("Trending scores refreshed."))
@@ -0,0 +1,61 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+
+from profiles import benchmarks
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark every profiles route against a synthetic catalogue in a throwaway test database "
+        "and compare with a stored baseline. Runs on whatever backend the default database uses "
+        "(SQLite locally; point DATABASES at a local PostgreSQL to benchmark that)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--scale", choices=sorted(benchmarks.SCALES), default="small")
+        parser.add_argument("--repeat", type=int, default=20)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--route", action="append", help="Only these routes (as written in urls.py).")
+        parser.add_argument("--baseline", help="Compare against this baseline JSON file.")
+        parser.add_argument("--save-baseline", help="Write the results to this baseline JSON file.")
+        parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown before flagging.")
+
+    def handle(self, *args, **options):
+        vendor = connection.vendor
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=False)
+        try:
+            # a private in-memory cache keeps runs independent of (and from polluting) the shared one
+            with override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}):
+                started = time.perf_counter()
+                data = benchmarks.generate(options["scale"], options["seed"])
+                self.stdout.write(f"Generated {options['scale']} catalogue in {time.perf_counter() - started:.1f}s")
+                results = benchmarks.run(data, repeat=options["repeat"], only=options["route"])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=False)
+
+        self.stdout.write(
+            f"{'route':<36} {'status':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'queries':>8} {'peak KiB':>9}"
+        )
+        for route, row in results.items():
+            self.stdout.write(
+                f"{route:<36} {row['status']:>6} {row['p50_ms']:>8.2f} {row['p95_ms']:>8.2f} "
+                f"{row['p99_ms']:>8.2f} {row['queries']:>8} {row['peak_kib']:>9}"
+            )
+
+        report = {"scale": options["scale"], "vendor": vendor, "repeat": options["repeat"], "routes": results}
+        if options["save_baseline"]:
+            benchmarks.save_baseline(options["save_baseline"], report)
+            self.stdout.write(f"Baseline written to {options['save_baseline']}.")
+        if options["baseline"]:
+            baseline = benchmarks.load_baseline(options["baseline"])
+            if (baseline["scale"], baseline["vendor"]) != (options["scale"], vendor):
+                raise CommandError(
+                    f"Baseline is for {baseline['scale']} on {baseline['vendor']}, not {options['scale']} on {vendor}."
+                )
+            regressions = benchmarks.compare(results, baseline["routes"], tolerance=options["tolerance"])
+            if regressions:
+                raise CommandError("Regressions against baseline:\n" + "\n".join(regressions))
+            self.stdout.write(self.style.SUCCESS("No regressions against baseline."))
@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from profiles.tasks import Worker
+
+
+class Command(BaseCommand):
+    help = "Run background tasks from the database queue."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--queue",
+            action="append",
+            dest="queues",
+            help="Only run tasks from this queue (repeatable). By default every queue is served.",
+        )
+        parser.add_argument("--concurrency", type=int, default=2, help="Tasks run at once by this worker.")
+        parser.add_argument("--interval", type=float, default=1.0, help="Seconds to sleep when the queue is empty.")
+        parser.add_argument("--once", action="store_true", help="Drain the queue and exit.")
+
+    def handle(self, *args, **options):
+        worker = Worker(options["queues"], options["concurrency"])
+        queues = ", ".join(options["queues"]) if options["queues"] else "every queue"
+        self.stdout.write(f"Worker on {queues} with concurrency {options['concurrency']}.")
+        try:
+            while True:
+                claimed = worker.poll()
+                if options["once"] and not claimed and not worker.running:
+                    break
+                if not claimed:
+                    time.sleep(options["interval"])
+        except KeyboardInterrupt:
+            pass
+        finally:
+            worker.shutdown()
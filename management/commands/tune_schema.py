@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from profiles import schema
+
+
+class Command(BaseCommand):
+    help = "Create the backend-specific profiles indexes and backfill numeric Media durations."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--database", default="default")
+        parser.add_argument("--dry-run", action="store_true", help="Print the index DDL without running it.")
+        parser.add_argument("--skip-backfill", action="store_true")
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        for sql in schema.ensure_indexes(options["database"], dry_run=options["dry_run"]):
+            self.stdout.write(sql)
+        if options["dry_run"] or options["skip_backfill"]:
+            return
+        updated = schema.backfill_durations(batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Backfilled duration_ms on {updated} media."))
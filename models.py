@@ -4,6 +4,9 @@ from django.contrib.auth import get_user_model
 from django.db import models
 from django.db.models.signals import post_delete
 from django.dispatch import receiver
+from django.utils import timezone
+
+from apps.artiste.models import Artiste, AudioMedia
 
 User = get_user_model()
 
@@ -12,6 +15,7 @@ class Profile(models.Model):
     user = models.OneToOneField(User, primary_key=True, on_delete=models.CASCADE, related_name="profile")
     arts = models.CharField(max_length=256, blank=True)
     profile_picture = models.ImageField(blank=True)
+    profile_picture_variants = models.JSONField(default=dict, blank=True, editable=False)
     song_name = models.CharField(max_length=250, null=True, blank=True)
     profile_song = models.FileField(blank=True)
     stage_name = models.CharField(max_length=256, blank=True)
@@ -25,6 +29,8 @@ class Profile(models.Model):
     genius_link = models.URLField(blank=True)
     likes = models.ManyToManyField(User, blank=True, related_name="liked_profiles")
     dislikes = models.ManyToManyField(User, blank=True, related_name="disliked_profiles")
+    likes_count = models.PositiveIntegerField(default=0, editable=False)
+    dislikes_count = models.PositiveIntegerField(default=0, editable=False)
 
     def __str__(self):
         return self.user.get_full_name()
@@ -37,21 +43,49 @@ class Comment(models.Model):
 
 
 class Media(models.Model):
+    INGEST_PENDING = "pending"
+    INGEST_PROCESSING = "processing"
+    INGEST_READY = "ready"
+    INGEST_FAILED = "failed"
+    INGEST_STATUSES = [
+        (INGEST_PENDING, "Pending"),
+        (INGEST_PROCESSING, "Processing"),
+        (INGEST_READY, "Ready"),
+        (INGEST_FAILED, "Failed"),
+    ]
+
     uid = models.UUIDField(default=uuid.uuid4, editable=False, unique=True)
     owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name="uploads")
     file = models.FileField()
     cover_image = models.ImageField(upload_to="cover-images", blank=True)
+    cover_image_variants = models.JSONField(default=dict, blank=True, editable=False)
     song_name = models.CharField(max_length=512, blank=False, null=True)
     album_name = models.CharField(max_length=512, blank=False, null=True)
     duration = models.CharField(max_length=15, blank=True, editable=False)
+    duration_ms = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    waveform = models.JSONField(default=list, blank=True, editable=False)
+    stream_file = models.FileField(upload_to="renditions", blank=True, editable=False)
+    ingest_status = models.CharField(
+        max_length=16, choices=INGEST_STATUSES, default=INGEST_PENDING, editable=False
+    )
+    ingest_error = models.TextField(blank=True, editable=False)
     likes = models.ManyToManyField(User, blank=True, related_name="liked_media")
     dislikes = models.ManyToManyField(User, blank=True, related_name="disliked_media")
+    likes_count = models.PositiveIntegerField(default=0, editable=False)
+    dislikes_count = models.PositiveIntegerField(default=0, editable=False)
+    plays_count = models.PositiveBigIntegerField(default=0, editable=False)
 
     def __str__(self):
         return self.song_name
 
     class Meta:
         verbose_name_plural = "Media Uploads"
+        indexes = [
+            # an artiste's uploads, newest first (follow-based recommendations, rollups by owner)
+            models.Index(fields=["owner", "-id"], name="media_owner_id_idx"),
+            # legacy rows still waiting for a numeric duration backfill
+            models.Index(fields=["id"], condition=models.Q(duration_ms__isnull=True), name="media_no_duration_idx"),
+        ]
 
 
 class MediaComment(models.Model):
@@ -61,6 +95,9 @@ class MediaComment(models.Model):
 
     class Meta:
         ordering = ["-id"]
+        indexes = [
+            models.Index(fields=["media", "-id"], name="mediacomment_media_id_idx"),
+        ]
 
 
 class Artist(Profile):
@@ -94,10 +131,327 @@ class UserLikeDislikeCount(models.Model):
         null=True,
     )
 
+    class Meta:
+        indexes = [
+            # "this user's counter for this song today" lookups
+            models.Index(fields=["user", "song", "created"], name="likecount_user_song_day_idx"),
+            # per-song daily totals (rollups.import_legacy)
+            models.Index(
+                fields=["song", "created"], condition=models.Q(song__isnull=False), name="likecount_song_day_idx"
+            ),
+        ]
+
     def __str__(self):
         return str(self.user)
 
 
+class SongRanking(models.Model):
+    song = models.OneToOneField(AudioMedia, primary_key=True, on_delete=models.CASCADE, related_name="ranking")
+    likes_count = models.PositiveIntegerField(default=0)
+    dislikes_count = models.PositiveIntegerField(default=0)
+    comments_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["-likes_count"], name="songranking_likes_idx"),
+            models.Index(fields=["-comments_count"], name="songranking_comments_idx"),
+        ]
+
+    def __str__(self):
+        return str(self.song_id)
+
+
+class ArtisteRanking(models.Model):
+    artiste = models.OneToOneField(Artiste, primary_key=True, on_delete=models.CASCADE, related_name="ranking")
+    followers_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["-followers_count"], name="artisteranking_followers_idx"),
+        ]
+
+    def __str__(self):
+        return str(self.artiste_id)
+
+
+class LeaderboardEntry(models.Model):
+    BOARD_MOST_LIKED_SONGS = "most_liked_songs"
+    BOARD_MOST_LIKED_ARTISTS = "most_liked_artists"
+    BOARD_TOP_TRENDING_SONGS = "top_trending_songs"
+    BOARDS = [
+        (BOARD_MOST_LIKED_SONGS, "Most liked songs"),
+        (BOARD_MOST_LIKED_ARTISTS, "Most liked artists"),
+        (BOARD_TOP_TRENDING_SONGS, "Top trending songs"),
+    ]
+
+    board = models.CharField(max_length=32, choices=BOARDS)
+    position = models.PositiveSmallIntegerField()
+    object_id = models.PositiveIntegerField()
+    score = models.PositiveIntegerField(default=0)
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ["board", "position"]
+        constraints = [
+            models.UniqueConstraint(fields=["board", "position"], name="leaderboard_board_position_uniq"),
+        ]
+        verbose_name_plural = "Leaderboard entries"
+
+    def __str__(self):
+        return f"{self.board} #{self.position}"
+
+
+class Reaction(models.Model):
+    KIND_MEDIA = "media"
+    KIND_PROFILE = "profile"
+    KIND_SONG = "song"
+    KINDS = [
+        (KIND_MEDIA, "Media"),
+        (KIND_PROFILE, "Profile"),
+        (KIND_SONG, "Song"),
+    ]
+    LIKE = 1
+    DISLIKE = -1
+    VALUES = [
+        (LIKE, "Like"),
+        (DISLIKE, "Dislike"),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="reactions")
+    kind = models.CharField(max_length=16, choices=KINDS)
+    object_id = models.PositiveIntegerField()
+    value = models.SmallIntegerField(choices=VALUES)
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user", "kind", "object_id"], name="reaction_user_target_uniq"),
+        ]
+        indexes = [
+            models.Index(fields=["kind", "object_id", "value"], name="reaction_target_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} {self.get_value_display()} {self.kind}:{self.object_id}"
+
+
+class PlayEvent(models.Model):
+    """One client-reported play, unique per (user, media, client session)."""
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="play_events")
+    media = models.ForeignKey(Media, on_delete=models.CASCADE, related_name="play_events")
+    session = models.CharField(max_length=64)
+    played_at = models.DateTimeField()
+    duration_ms = models.PositiveIntegerField(default=0)
+    # folded into Media.plays_count and the engagement buckets
+    counted = models.BooleanField(default=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user", "media", "session"], name="playevent_uniq"),
+        ]
+        indexes = [
+            models.Index(fields=["id"], condition=models.Q(counted=False), name="playevent_uncounted_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} played {self.media_id} at {self.played_at:%Y-%m-%d %H:%M}"
+
+
+class EngagementBucket(models.Model):
+    KIND_MEDIA = "media"
+    KIND_SONG = "song"
+    KIND_ARTISTE = "artiste"
+    KINDS = [
+        (KIND_MEDIA, "Media"),
+        (KIND_SONG, "Song"),
+        (KIND_ARTISTE, "Artiste"),
+    ]
+    HOUR = "hour"
+    DAY = "day"
+    GRANULARITIES = [
+        (HOUR, "Hourly"),
+        (DAY, "Daily"),
+    ]
+
+    kind = models.CharField(max_length=16, choices=KINDS)
+    object_id = models.PositiveIntegerField()
+    granularity = models.CharField(max_length=8, choices=GRANULARITIES)
+    start = models.DateTimeField()
+    likes = models.IntegerField(default=0)
+    dislikes = models.IntegerField(default=0)
+    comments = models.IntegerField(default=0)
+    plays = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["kind", "object_id", "granularity", "start"], name="engagementbucket_uniq"
+            ),
+        ]
+        indexes = [
+            models.Index(fields=["kind", "granularity", "start"], name="engagementbucket_window_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.kind}:{self.object_id} {self.granularity} {self.start:%Y-%m-%d %H:00}"
+
+
+class TrendingScore(models.Model):
+    kind = models.CharField(max_length=16, choices=EngagementBucket.KINDS)
+    window = models.CharField(max_length=16)
+    object_id = models.PositiveIntegerField()
+    score = models.FloatField()
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["kind", "window", "object_id"], name="trendingscore_uniq"),
+        ]
+        indexes = [
+            models.Index(fields=["kind", "window", "-score"], name="trendingscore_rank_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.kind}:{self.object_id} {self.window} {self.score:.2f}"
+
+
+class ItemNeighbour(models.Model):
+    item_id = models.PositiveIntegerField()
+    neighbour_id = models.PositiveIntegerField()
+    score = models.FloatField()
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["item_id", "neighbour_id"], name="itemneighbour_uniq"),
+        ]
+        indexes = [
+            models.Index(fields=["updated"], name="itemneighbour_updated_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.item_id} -> {self.neighbour_id} ({self.score:.3f})"
+
+
+class SearchDocument(models.Model):
+    KIND_SONG = "song"
+    KIND_ARTISTE = "artiste"
+    KINDS = [
+        (KIND_SONG, "Song"),
+        (KIND_ARTISTE, "Artiste"),
+    ]
+
+    kind = models.CharField(max_length=16, choices=KINDS)
+    object_id = models.PositiveIntegerField()
+    document = models.TextField()
+    popularity = models.FloatField(default=0)
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["kind", "object_id"], name="searchdocument_kind_object_uniq"),
+        ]
+
+    def __str__(self):
+        return f"{self.kind}:{self.object_id}"
+
+
+class TermsVersion(models.Model):
+    user_type = models.CharField(max_length=32)
+    version = models.CharField(max_length=16)
+    body = models.TextField()
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user_type", "version"], name="termsversion_uniq"),
+        ]
+
+    def __str__(self):
+        return f"{self.user_type} {self.version}"
+
+
+class UploadSession(models.Model):
+    KIND_MEDIA = "media"
+    KIND_PROFILE_SONG = "profile_song"
+    KIND_PROFILE_PICTURE = "profile_picture"
+    KINDS = [
+        (KIND_MEDIA, "Media upload"),
+        (KIND_PROFILE_SONG, "Profile song"),
+        (KIND_PROFILE_PICTURE, "Profile picture"),
+    ]
+    STATUS_OPEN = "open"
+    STATUS_COMPLETING = "completing"
+    STATUS_COMPLETED = "completed"
+    STATUS_ABORTED = "aborted"
+    STATUSES = [
+        (STATUS_OPEN, "Open"),
+        (STATUS_COMPLETING, "Completing"),
+        (STATUS_COMPLETED, "Completed"),
+        (STATUS_ABORTED, "Aborted"),
+    ]
+
+    uid = models.UUIDField(default=uuid.uuid4, editable=False, unique=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="upload_sessions")
+    kind = models.CharField(max_length=32, choices=KINDS)
+    name = models.CharField(max_length=512)
+    upload_id = models.CharField(max_length=1024)
+    filename = models.CharField(max_length=255)
+    content_type = models.CharField(max_length=128)
+    size = models.PositiveBigIntegerField()
+    part_size = models.PositiveIntegerField()
+    metadata = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=16, choices=STATUSES, default=STATUS_OPEN)
+    media = models.ForeignKey(Media, on_delete=models.SET_NULL, null=True, blank=True, related_name="+")
+    created = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.kind}:{self.filename}"
+
+    @property
+    def part_count(self):
+        return max(-(-self.size // self.part_size), 1)
+
+
+class Task(models.Model):
+    STATUS_QUEUED = "queued"
+    STATUS_RUNNING = "running"
+    STATUS_DONE = "done"
+    STATUS_FAILED = "failed"
+    STATUSES = [
+        (STATUS_QUEUED, "Queued"),
+        (STATUS_RUNNING, "Running"),
+        (STATUS_DONE, "Done"),
+        (STATUS_FAILED, "Failed"),
+    ]
+
+    queue = models.CharField(max_length=32, default="default")
+    path = models.CharField(max_length=255)
+    args = models.JSONField(default=list, blank=True)
+    status = models.CharField(max_length=16, choices=STATUSES, default=STATUS_QUEUED)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=3)
+    run_after = models.DateTimeField(default=timezone.now)
+    error = models.TextField(blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["queue", "status", "run_after"], name="task_queue_status_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.queue}:{self.path}"
+
+
 @receiver(post_delete, sender=Profile)
 def delete_image_hook(sender, instance, using, **kwargs):
-    instance.user.delete()
+    # deleting a profile deletes the account, through the batched deletion service
+    from profiles import deletion
+
+    if not deletion.in_progress(instance.user_id):
+        deletion.queue_files(deletion.instance_files(instance))
+        deletion.delete_account(instance.user_id)
@@ -0,0 +1,215 @@
+import base64
+import json
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+# results the planner expects to be at least this large are not counted exactly
+EXACT_COUNT_BELOW = getattr(settings, "PROFILES_ADMIN_EXACT_COUNT_BELOW", 10_000)
+
+
+class KeysetPagination(BasePagination):
+    """Cursor pagination over a composite, indexed ordering key.
+
+    Each page is fetched with ``WHERE key < last_key ORDER BY key LIMIT n``
+    instead of an OFFSET, so deep pages cost the same as the first one and
+    rows inserted meanwhile never shift or repeat items. The cursor is an
+    opaque token holding the boundary row's key. The last ordering field
+    must be unique (normally the primary key). Views can override the
+    ordering with a ``keyset_ordering`` attribute. ``?count=1`` adds the
+    total, which otherwise is never computed.
+    """
+
+    ordering = ("-pk",)
+    page_size = 20
+    max_page_size = 100
+    cursor_query_param = "cursor"
+    page_size_query_param = "page_size"
+    count_query_param = "count"
+
+    def get_ordering(self, view):
+        return tuple(getattr(view, "keyset_ordering", self.ordering))
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(size, 1), self.max_page_size)
+
+    def encode_cursor(self, key, reverse):
+        payload = json.dumps({"k": key, "r": int(reverse)}, cls=DjangoJSONEncoder, separators=(",", ":"))
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+    def decode_cursor(self, request, queryset=None):
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return None, False
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+            key, reverse = payload["k"], bool(payload["r"])
+            if not isinstance(key, list) or len(key) != len(self.fields):
+                raise ValueError(key)
+            if queryset is not None:
+                # a tampered value must not reach the database as e.g. a string compared with an integer column
+                key = [
+                    self._output_field(queryset, field).to_python(value)
+                    for (field, _), value in zip(self.fields, key)
+                ]
+        except (TypeError, ValueError, KeyError, ValidationError):
+            raise NotFound("Invalid cursor.")
+        return key, reverse
+
+    @staticmethod
+    def _output_field(queryset, path):
+        """The model field (or annotation's output field) an ordering path compares against."""
+        if path in queryset.query.annotations:
+            return queryset.query.annotations[path].output_field
+        model, *parents, name = [queryset.model, *path.split("__")]
+        for parent in parents:
+            model = model._meta.get_field(parent).related_model
+        return model._meta.pk if name == "pk" else model._meta.get_field(name)
+
+    @staticmethod
+    def _parse(ordering):
+        return [(field.lstrip("-"), field.startswith("-")) for field in ordering]
+
+    def after(self, key, reverse):
+        """``Q`` for rows strictly after ``key`` in the ordering (before it when ``reverse``)."""
+        clauses = []
+        for i, (field, descending) in enumerate(self.fields):
+            lookup = "lt" if descending != reverse else "gt"
+            equal = {prior: key[j] for j, (prior, _) in enumerate(self.fields[:i])}
+            clauses.append(Q(**equal, **{f"{field}__{lookup}": key[i]}))
+        return reduce(or_, clauses)
+
+    def row_key(self, row):
+        key = []
+        for field, _ in self.fields:
+            value = row
+            for attr in field.split("__"):
+                value = getattr(value, attr)
+            key.append(value)
+        return json.loads(json.dumps(key, cls=DjangoJSONEncoder))
+
+    def _page(self, queryset, request, view):
+        self.request = request
+        self.fields = self._parse(self.get_ordering(view))
+        self.page_size_value = self.get_page_size(request)
+        self.key, self.reverse = self.decode_cursor(request, queryset)
+        order = [f"-{f}" if descending != self.reverse else f for f, descending in self.fields]
+        page = queryset.order_by(*order)
+        if self.key is not None:
+            page = page.filter(self.after(self.key, self.reverse))
+        return page[: self.page_size_value + 1]
+
+    def _wants_count(self, request):
+        return request.query_params.get(self.count_query_param) in ("1", "true")
+
+    def _finish(self, rows):
+        has_more = len(rows) > self.page_size_value
+        rows = rows[: self.page_size_value]
+        if self.reverse:
+            rows.reverse()
+            self.has_next, self.has_previous = self.key is not None, has_more
+        else:
+            self.has_next, self.has_previous = has_more, self.key is not None
+        self.first_key = self.row_key(rows[0]) if rows else None
+        self.last_key = self.row_key(rows[-1]) if rows else None
+        return rows
+
+    def paginate_queryset(self, queryset, request, view=None):
+        page = self._page(queryset, request, view)
+        self.count = queryset.count() if self._wants_count(request) else None
+        return self._finish(list(page))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """``paginate_queryset`` for async views, on the async ORM."""
+        page = self._page(queryset, request, view)
+        self.count = await queryset.acount() if self._wants_count(request) else None
+        return self._finish([row async for row in page])
+
+    def get_next_link(self):
+        if not self.has_next or self.last_key is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.last_key, False))
+
+    def get_previous_link(self):
+        if not self.has_previous or self.first_key is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.first_key, True))
+
+    def get_paginated_data(self, data):
+        body = {"next": self.get_next_link(), "previous": self.get_previous_link(), "results": data}
+        if self.count is not None:
+            body = {"count": self.count, **body}
+        return body
+
+    def get_paginated_response(self, data):
+        return Response(self.get_paginated_data(data))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "properties": {
+                "count": {"type": "integer", "nullable": True},
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "previous": {"type": "string", "nullable": True, "format": "uri"},
+                "results": schema,
+            },
+        }
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {"name": self.cursor_query_param, "required": False, "in": "query", "schema": {"type": "string"}},
+            {"name": self.page_size_query_param, "required": False, "in": "query", "schema": {"type": "integer"}},
+            {"name": self.count_query_param, "required": False, "in": "query", "schema": {"type": "integer"}},
+        ]
+
+
+def estimated_count(queryset):
+    """The planner's row estimate for ``queryset`` on PostgreSQL; None elsewhere, or for a never-analyzed table."""
+    connection = connections[queryset.db]
+    if connection.vendor != "postgresql":
+        return None
+    with connection.cursor() as cursor:
+        if not queryset.query.where:
+            # the whole table: the statistics' row count, without planning a query
+            cursor.execute("SELECT reltuples FROM pg_class WHERE oid = %s::regclass", [queryset.model._meta.db_table])
+            rows = cursor.fetchone()[0]
+        else:
+            sql, params = queryset.order_by().query.sql_with_params()
+            cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+            plan = cursor.fetchone()[0]
+            # the driver may or may not decode the json column
+            rows = (json.loads(plan) if isinstance(plan, str) else plan)[0]["Plan"]["Plan Rows"]
+    return int(rows) if rows >= 0 else None
+
+
+class EstimatedCountPaginator(Paginator):
+    """Admin paginator that skips the full ``COUNT(*)`` of large changelists.
+
+    Small results are still counted exactly; past EXACT_COUNT_BELOW rows the
+    planner's estimate is shown instead. Pair with
+    ``show_full_result_count = False``.
+    """
+
+    @cached_property
+    def count(self):
+        estimate = estimated_count(self.object_list)
+        if estimate is None or estimate < EXACT_COUNT_BELOW:
+            return super().count
+        return estimate
@@ -0,0 +1,270 @@
+import atexit
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict, defaultdict, deque
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from profiles import ranking, rollups
+from profiles.instrumentation import metrics
+from profiles.models import EngagementBucket, Media, PlayEvent
+
+logger = logging.getLogger(__name__)
+
+# redis://host:6379/0 (or any Redis-compatible server) shares one buffer between processes
+BUFFER_URL = getattr(settings, "PROFILES_PLAY_BUFFER_URL", None)
+BUFFER_SIZE = getattr(settings, "PROFILES_PLAY_BUFFER_SIZE", 100_000)
+FLUSH_SIZE = getattr(settings, "PROFILES_PLAY_FLUSH_SIZE", 5_000)
+FLUSH_INTERVAL = getattr(settings, "PROFILES_PLAY_FLUSH_INTERVAL", 1.0)
+FOLD_INTERVAL = getattr(settings, "PROFILES_PLAY_FOLD_INTERVAL", 60)
+FOLD_BATCH = 10_000
+# how long a (user, media, session) key is remembered for deduplication in the buffer
+DEDUPE_SECONDS = getattr(settings, "PROFILES_PLAY_DEDUPE_SECONDS", 6 * 3600)
+
+REDIS_QUEUE = "profiles:plays:queue"
+REDIS_SEEN = "profiles:plays:seen:"
+
+
+def event_key(event):
+    return f"{event['user']}:{event['media']}:{event['session']}"
+
+
+class MemoryBuffer:
+    """Bounded in-process buffer, with a recently-seen key set for deduplication."""
+
+    def __init__(self, maxsize=BUFFER_SIZE):
+        self.maxsize = maxsize
+        self.events = deque()
+        self.seen = OrderedDict()
+        self.lock = threading.Lock()
+        self.ready = threading.Event()
+
+    def offer(self, events):
+        """Queue ``events``; returns ``(accepted, duplicates, dropped)``. Drops whatever does not fit."""
+        accepted = duplicates = dropped = 0
+        now = time.monotonic()
+        with self.lock:
+            while self.seen and (
+                next(iter(self.seen.values())) < now - DEDUPE_SECONDS or len(self.seen) > self.maxsize * 10
+            ):
+                self.seen.popitem(last=False)
+            for event in events:
+                key = event_key(event)
+                if key in self.seen:
+                    duplicates += 1
+                elif len(self.events) >= self.maxsize:
+                    dropped += 1
+                else:
+                    self.seen[key] = now
+                    self.events.append(event)
+                    accepted += 1
+            depth = len(self.events)
+        if depth >= FLUSH_SIZE:
+            self.ready.set()
+        return accepted, duplicates, dropped
+
+    def take(self, n):
+        with self.lock:
+            return [self.events.popleft() for _ in range(min(n, len(self.events)))]
+
+    def requeue(self, events):
+        """Put taken ``events`` back at the front; returns how many no longer fit and were dropped."""
+        with self.lock:
+            room = max(self.maxsize - len(self.events), 0)
+            self.events.extendleft(reversed(events[:room]))
+            for event in events[room:]:
+                self.seen.pop(event_key(event), None)
+        return len(events[room:])
+
+    def depth(self):
+        return len(self.events)
+
+
+class RedisBuffer:
+    """The same buffer on a Redis-compatible server, shared by every web process."""
+
+    def __init__(self, url, maxsize=BUFFER_SIZE):
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+        self.maxsize = maxsize
+
+    def offer(self, events):
+        pipe = self.client.pipeline(transaction=False)
+        for event in events:
+            pipe.set(REDIS_SEEN + event_key(event), 1, nx=True, ex=DEDUPE_SECONDS)
+        pipe.llen(REDIS_QUEUE)
+        *fresh, depth = pipe.execute()
+        new = [event for event, is_new in zip(events, fresh) if is_new]
+        room = max(self.maxsize - depth, 0)
+        if new[:room]:
+            self.client.rpush(REDIS_QUEUE, *(json.dumps(event) for event in new[:room]))
+        if new[room:]:
+            # forget dropped events so a client retry is not mistaken for a duplicate
+            self.client.delete(*(REDIS_SEEN + event_key(event) for event in new[room:]))
+        return len(new[:room]), len(events) - len(new), len(new[room:])
+
+    def take(self, n):
+        return [json.loads(raw) for raw in self.client.lpop(REDIS_QUEUE, n) or []]
+
+    def requeue(self, events):
+        room = max(self.maxsize - self.client.llen(REDIS_QUEUE), 0)
+        if events[:room]:
+            # LPUSH prepends one value at a time, so push the batch back last event first
+            self.client.lpush(REDIS_QUEUE, *(json.dumps(event) for event in reversed(events[:room])))
+        if events[room:]:
+            self.client.delete(*(REDIS_SEEN + event_key(event) for event in events[room:]))
+        return len(events[room:])
+
+    def depth(self):
+        return self.client.llen(REDIS_QUEUE)
+
+
+def flush(buffer, limit=FLUSH_SIZE):
+    """Write up to ``limit`` buffered events with one ``bulk_create``; returns how many were taken.
+
+    If the write fails the events go back to the front of the buffer (those
+    that no longer fit are counted as dropped) and the error is re-raised.
+    """
+    events = buffer.take(limit)
+    if not events:
+        return 0
+    try:
+        attempted = _write(events)
+    except Exception:
+        dropped = buffer.requeue(events)
+        metrics.inc("play_events_requeued_total", len(events) - dropped)
+        metrics.inc("play_events_dropped_total", dropped)
+        raise
+    metrics.inc("play_events_attempted_total", attempted)
+    metrics.gauge("play_buffer_depth", buffer.depth())
+    return len(events)
+
+
+def _write(events):
+    """Insert the events of known media; returns how many rows were sent, including any the unique key skipped."""
+    uids = Media.objects.filter(uid__in={event["media"] for event in events}).values_list("uid", "pk")
+    media_ids = {str(uid): pk for uid, pk in uids}
+    rows = []
+    for event in events:
+        media_id = media_ids.get(event["media"])
+        if media_id is None:
+            metrics.inc("play_events_unknown_media_total")
+            continue
+        rows.append(
+            PlayEvent(
+                user_id=event["user"],
+                media_id=media_id,
+                session=event["session"],
+                played_at=parse_datetime(event["played_at"]),
+                duration_ms=event["duration_ms"],
+            )
+        )
+    PlayEvent.objects.bulk_create(rows, batch_size=FLUSH_SIZE, ignore_conflicts=True)
+    return len(rows)
+
+
+def fold(batch_size=FOLD_BATCH):
+    """Fold uncounted play events into ``Media.plays_count`` and hourly engagement buckets."""
+    folded = 0
+    while True:
+        with transaction.atomic():
+            events = list(
+                PlayEvent.objects.select_for_update(skip_locked=True)
+                .filter(counted=False)
+                .order_by("pk")
+                .values_list("pk", "media_id", "played_at")[:batch_size]
+            )
+            if not events:
+                break
+            plays = defaultdict(int)
+            with rollups.batch():
+                for _, media_id, played_at in events:
+                    plays[media_id] += 1
+                    rollups.record(EngagementBucket.KIND_MEDIA, media_id, played_at, plays=1)
+            Media.objects.filter(pk__in=plays).update(plays_count=F("plays_count") + ranking.delta_case("pk", plays))
+            PlayEvent.objects.filter(pk__in=[pk for pk, _, _ in events]).update(counted=True)
+        folded += len(events)
+    metrics.inc("play_events_folded_total", folded)
+    return folded
+
+
+class Flusher(threading.Thread):
+    """Background thread draining a ``MemoryBuffer``: every FLUSH_INTERVAL, or sooner once FLUSH_SIZE events wait."""
+
+    def __init__(self, buffer):
+        super().__init__(name="profiles-plays-flusher", daemon=True)
+        self.buffer = buffer
+        self.stopping = threading.Event()
+        self.last_fold = time.monotonic()
+
+    def run(self):
+        while not self.stopping.is_set():
+            self.buffer.ready.wait(FLUSH_INTERVAL)
+            self.buffer.ready.clear()
+            self.drain()
+
+    def drain(self):
+        close_old_connections()
+        try:
+            while flush(self.buffer) >= FLUSH_SIZE:
+                pass
+            if time.monotonic() - self.last_fold >= FOLD_INTERVAL:
+                self.last_fold = time.monotonic()
+                fold()
+        except Exception:
+            logger.exception("Flushing play events failed")
+        finally:
+            close_old_connections()
+
+    def stop(self):
+        self.stopping.set()
+        self.buffer.ready.set()
+        self.join(timeout=FLUSH_INTERVAL * 5)
+        self.drain()
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_buffer():
+    """The process-wide buffer; an in-memory one also gets its flusher thread, stopped (and drained) at exit."""
+    global _buffer
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                if BUFFER_URL:
+                    _buffer = RedisBuffer(BUFFER_URL)
+                else:
+                    _buffer = MemoryBuffer()
+                    flusher = Flusher(_buffer)
+                    flusher.start()
+                    atexit.register(flusher.stop)
+    return _buffer
+
+
+def record(user, events, buffer=None):
+    """Buffer validated play ``events`` of ``user``; returns ``(accepted, duplicates, dropped)``."""
+    now = timezone.now()
+    events = [
+        {
+            "user": user.pk,
+            "media": str(event["media"]),
+            "session": event["session"],
+            "played_at": min(event.get("played_at") or now, now).isoformat(),
+            "duration_ms": event.get("duration_ms", 0),
+        }
+        for event in events
+    ]
+    accepted, duplicates, dropped = (buffer or get_buffer()).offer(events)
+    metrics.inc("play_events_accepted_total", accepted)
+    metrics.inc("play_events_duplicate_total", duplicates)
+    metrics.inc("play_events_dropped_total", dropped)
+    return accepted, duplicates, dropped
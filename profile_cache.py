@@ -0,0 +1,153 @@
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils.http import quote_etag
+
+from apps.artiste.models import Artiste
+from profiles import tasks
+from users.models import Fan
+
+User = get_user_model()
+
+Follow = Artiste.followers.field.model
+
+QUEUE = "cache"
+CACHE_ALIAS = getattr(settings, "PROFILES_PROFILE_CACHE", "default")
+TIMEOUT = getattr(settings, "PROFILES_PROFILE_CACHE_TIMEOUT", 300)
+LOCK_TIMEOUT = 10
+LOCK_WAIT = 2.0
+LOCK_POLL = 0.05
+FANOUT_BATCH = 1000
+
+
+def get_cache():
+    return caches[CACHE_ALIAS]
+
+
+def _generation_key(user_id):
+    return f"profiles:profile:gen:{user_id}"
+
+
+def _generation(cache, user_id):
+    key = _generation_key(user_id)
+    generation = cache.get(key)
+    if generation is None:
+        # a time-based start keeps an evicted counter from coming back at an old value
+        cache.add(key, time.time_ns(), None)
+        generation = cache.get(key)
+    return generation
+
+
+def get_or_build(user, build, variant=""):
+    """Return ``(etag, payload)`` for ``user``'s profile screen, calling ``build()`` on a miss.
+
+    Entries are keyed by user, account type and a per-user generation that
+    ``invalidate`` bumps, so a rebuild racing an invalidation can never
+    store stale data under the current key. Only one process rebuilds a
+    missing entry; the others wait briefly for its result. ``variant``
+    separates differently shaped payloads (``?expand=``) of the same user.
+    """
+    cache = get_cache()
+    key = f"profiles:profile:{user.pk}:{user.account_type}:{variant}:{_generation(cache, user.pk)}"
+    entry = cache.get(key)
+    if entry is not None:
+        return entry
+    lock = f"{key}:lock"
+    if not cache.add(lock, True, LOCK_TIMEOUT):
+        deadline = time.monotonic() + LOCK_WAIT
+        while time.monotonic() < deadline:
+            time.sleep(LOCK_POLL)
+            entry = cache.get(key)
+            if entry is not None:
+                return entry
+        return _entry(build())
+    try:
+        entry = _entry(build())
+        cache.set(key, entry, TIMEOUT)
+    finally:
+        cache.delete(lock)
+    return entry
+
+
+def _entry(payload):
+    body = json.dumps(payload, cls=DjangoJSONEncoder, sort_keys=True)
+    return quote_etag(hashlib.md5(body.encode()).hexdigest()), json.loads(body)
+
+
+def _bump(user_ids):
+    cache = get_cache()
+    for user_id in set(user_ids):
+        try:
+            cache.incr(_generation_key(user_id))
+        except ValueError:
+            cache.set(_generation_key(user_id), time.time_ns(), None)
+
+
+def invalidate(*user_ids):
+    """Drop the cached profile of ``user_ids`` once the current transaction commits."""
+    user_ids = [user_id for user_id in user_ids if user_id is not None]
+    if user_ids:
+        transaction.on_commit(lambda: _bump(user_ids))
+
+
+def invalidate_artiste(artiste_id, user_id=None):
+    """Drop an artiste's own profile and, in the background, those of the fans following them."""
+    if user_id is None:
+        user_id = Artiste.objects.filter(pk=artiste_id).values_list("user_id", flat=True).first()
+    invalidate(user_id)
+    tasks.enqueue("profiles.profile_cache.invalidate_followers", artiste_id, queue=QUEUE)
+
+
+def follower_field():
+    """The follow row's link to the follower, whether it points at the user or at their Fan profile."""
+    for field in Follow._meta.concrete_fields:
+        if field.is_relation and field.name != Artiste.followers.field.name and field.related_model in (User, Fan):
+            return field
+    return None
+
+
+def follower_user_id(follow):
+    field = follower_field()
+    if field is None:
+        return None
+    if field.related_model is User:
+        return getattr(follow, field.attname)
+    return Fan.objects.filter(pk=getattr(follow, field.attname)).values_list("user_id", flat=True).first()
+
+
+def follower_path():
+    """Lookup from a follow row to the follower's user id, for ``values_list``."""
+    field = follower_field()
+    if field is None:
+        return None
+    return field.attname if field.related_model is User else f"{field.name}__user_id"
+
+
+def followed_by(user_id):
+    """The follow rows of ``user_id``'s account."""
+    path = follower_path()
+    if path is None:
+        return Follow.objects.none()
+    return Follow.objects.filter(**{path: user_id})
+
+
+def invalidate_followers(artiste_id):
+    """Fans embed the artistes they follow, so a change to an artiste drops their profiles too."""
+    path = follower_path()
+    if path is None:
+        return
+    follows = Follow.objects.filter(**{Artiste.followers.field.attname: artiste_id}).order_by()
+    user_ids = follows.values_list(path, flat=True).iterator(chunk_size=FANOUT_BATCH)
+    batch = []
+    for user_id in user_ids:
+        batch.append(user_id)
+        if len(batch) >= FANOUT_BATCH:
+            _bump(batch)
+            batch = []
+    _bump(batch)
@@ -0,0 +1,161 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Case, Count, F, IntegerField, Value, When
+from django.db.models.functions import Greatest
+
+from apps.artiste.models import Artiste, AudioMedia
+from profiles import tasks
+from profiles.models import ArtisteRanking, LeaderboardEntry, SongRanking
+
+LEADERBOARD_SIZE = 20
+QUEUE = "rankings"
+# a scheduled rebuild whose transaction rolled back stops blocking new ones after this long
+PENDING_TIMEOUT = getattr(settings, "PROFILES_BOARD_REFRESH_PENDING_TIMEOUT", 30)
+
+# board -> (ranking model, counter field, key field)
+BOARDS = {
+    LeaderboardEntry.BOARD_MOST_LIKED_SONGS: (SongRanking, "likes_count", "song_id"),
+    LeaderboardEntry.BOARD_MOST_LIKED_ARTISTS: (ArtisteRanking, "followers_count", "artiste_id"),
+    LeaderboardEntry.BOARD_TOP_TRENDING_SONGS: (SongRanking, "comments_count", "song_id"),
+}
+
+
+def _boards_for(model, field):
+    return [board for board, (m, f, _) in BOARDS.items() if m is model and f == field]
+
+
+def _adjust(model, key_field, key, field, delta):
+    model.objects.get_or_create(**{key_field: key})
+    model.objects.filter(**{key_field: key}).update(**{field: Greatest(F(field) + delta, 0)})
+    for board in _boards_for(model, field):
+        refresh_board_for(board, key)
+
+
+def delta_case(key_field, deltas):
+    """``CASE`` expression mapping each ``key_field`` value in ``deltas`` to its delta, for one set-based UPDATE."""
+    return Case(
+        *[When(**{key_field: key, "then": Value(delta)}) for key, delta in deltas.items()],
+        default=Value(0),
+        output_field=IntegerField(),
+    )
+
+
+def adjust_song_reactions(likes, dislikes):
+    """Apply ``{song_id: delta}`` maps of like and dislike changes with a single UPDATE."""
+    song_ids = set(likes) | set(dislikes)
+    if not song_ids:
+        return
+    SongRanking.objects.bulk_create([SongRanking(song_id=pk) for pk in song_ids], ignore_conflicts=True)
+    SongRanking.objects.filter(song_id__in=song_ids).update(
+        likes_count=Greatest(F("likes_count") + delta_case("song_id", likes), 0),
+        dislikes_count=Greatest(F("dislikes_count") + delta_case("song_id", dislikes), 0),
+    )
+    for song_id, delta in likes.items():
+        if delta:
+            refresh_board_for(LeaderboardEntry.BOARD_MOST_LIKED_SONGS, song_id)
+
+
+def adjust_song_likes(song_id, delta):
+    _adjust(SongRanking, "song_id", song_id, "likes_count", delta)
+
+
+def adjust_song_comments(song_id, delta):
+    _adjust(SongRanking, "song_id", song_id, "comments_count", delta)
+
+
+def adjust_artiste_followers(artiste_id, delta):
+    _adjust(ArtisteRanking, "artiste_id", artiste_id, "followers_count", delta)
+
+
+def refresh_board_for(board, object_id):
+    """Rebuild ``board`` only when ``object_id`` is, or could now be, on it."""
+    model, field, key_field = BOARDS[board]
+    entries = list(LeaderboardEntry.objects.filter(board=board).values_list("object_id", "score"))
+    if len(entries) >= LEADERBOARD_SIZE and object_id not in {oid for oid, _ in entries}:
+        score = model.objects.filter(**{key_field: object_id}).values_list(field, flat=True).first() or 0
+        if score <= min(s for _, s in entries):
+            return
+    schedule_refresh(board)
+
+
+def _pending_key(board):
+    return f"profiles:board:refresh:{board}"
+
+
+def schedule_refresh(board):
+    """Rebuild ``board`` on a worker after commit; requests made before the rebuild starts collapse into one."""
+    if cache.add(_pending_key(board), True, PENDING_TIMEOUT):
+        transaction.on_commit(
+            lambda: tasks.enqueue("profiles.ranking.run_scheduled_refresh", board, queue=QUEUE, max_attempts=1)
+        )
+
+
+def run_scheduled_refresh(board):
+    # cleared before reading, so changes committed during the rebuild schedule another one
+    cache.delete(_pending_key(board))
+    refresh_board(board)
+
+
+def refresh_board(board):
+    model, field, key_field = BOARDS[board]
+    top = model.objects.filter(**{f"{field}__gt": 0}).order_by(f"-{field}", key_field)
+    rows = top.values_list(key_field, field)[:LEADERBOARD_SIZE]
+    entries = [
+        LeaderboardEntry(board=board, position=position, object_id=object_id, score=score)
+        for position, (object_id, score) in enumerate(rows, start=1)
+    ]
+    # an upsert by position, so concurrent rebuilds overwrite each other instead of colliding
+    with transaction.atomic():
+        LeaderboardEntry.objects.bulk_create(
+            entries,
+            update_conflicts=True,
+            unique_fields=["board", "position"],
+            update_fields=["object_id", "score", "updated"],
+        )
+        LeaderboardEntry.objects.filter(board=board, position__gt=len(entries)).delete()
+
+
+def refresh_all_boards():
+    for board in BOARDS:
+        refresh_board(board)
+
+
+def rebuild_counters(batch_size=1000):
+    songs = AudioMedia.objects.annotate(
+        n_likes=Count("likes", distinct=True),
+        n_dislikes=Count("dislikes", distinct=True),
+        n_comments=Count("comments", distinct=True),
+    ).values_list("pk", "n_likes", "n_dislikes", "n_comments")
+    artistes = Artiste.objects.annotate(n_followers=Count("followers", distinct=True)).values_list(
+        "pk", "n_followers"
+    )
+    with transaction.atomic():
+        SongRanking.objects.all().delete()
+        SongRanking.objects.bulk_create(
+            (
+                SongRanking(song_id=pk, likes_count=likes, dislikes_count=dislikes, comments_count=comments)
+                for pk, likes, dislikes, comments in songs.iterator()
+            ),
+            batch_size=batch_size,
+        )
+        ArtisteRanking.objects.all().delete()
+        ArtisteRanking.objects.bulk_create(
+            (ArtisteRanking(artiste_id=pk, followers_count=followers) for pk, followers in artistes.iterator()),
+            batch_size=batch_size,
+        )
+
+
+def get_leaderboards():
+    """Return ``{board: [object_id, ...]}`` for every board, read in one query."""
+    boards = {board: [] for board in BOARDS}
+    for board, object_id in LeaderboardEntry.objects.values_list("board", "object_id"):
+        boards[board].append(object_id)
+    return boards
+
+
+async def aget_leaderboards():
+    boards = {board: [] for board in BOARDS}
+    async for board, object_id in LeaderboardEntry.objects.values_list("board", "object_id"):
+        boards[board].append(object_id)
+    return boards
@@ -0,0 +1,258 @@
+import uuid
+from collections import defaultdict
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Count, Exists, F, IntegerField, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce, Greatest
+from rest_framework.exceptions import NotFound
+
+from apps.artiste.models import AudioMedia
+from profiles import ranking, rollups
+from profiles.models import EngagementBucket, LeaderboardEntry, Media, Profile, Reaction, SongRanking
+
+User = get_user_model()
+
+NONE = 0
+VALUES = {"like": Reaction.LIKE, "dislike": Reaction.DISLIKE, "none": NONE}
+NAMES = {value: name for name, value in VALUES.items()}
+
+TARGETS = {
+    Reaction.KIND_MEDIA: Media,
+    Reaction.KIND_PROFILE: Profile,
+    Reaction.KIND_SONG: AudioMedia,
+}
+
+
+# the legacy M2M tables, dislikes first so a target in both reads as liked
+LEGACY = ((Reaction.DISLIKE, "dislikes"), (Reaction.LIKE, "likes"))
+
+
+def _legacy_table(kind, accessor):
+    """``(through, object_column, user_column)`` of a target's legacy likes/dislikes M2M."""
+    field = TARGETS[kind]._meta.get_field(accessor)
+    return field.remote_field.through, f"{field.m2m_field_name()}_id", f"{field.m2m_reverse_field_name()}_id"
+
+
+def _legacy(kind, user_id, object_ids):
+    """``{object_id: value}`` of ``user_id``'s reactions that so far only exist in the legacy M2M tables."""
+    result = {}
+    for value, accessor in LEGACY:
+        through, source, target = _legacy_table(kind, accessor)
+        rows = through.objects.filter(**{f"{source}__in": object_ids, target: user_id}).values_list(source, flat=True)
+        result.update(dict.fromkeys(rows, value))
+    return result
+
+
+def _mirror(kind, user_id, changes):
+    """Keep the legacy likes/dislikes M2M tables in step with ``changes`` of ``{object_id: (old, new)}``."""
+    for value, accessor in ((Reaction.LIKE, "likes"), (Reaction.DISLIKE, "dislikes")):
+        through, source, target = _legacy_table(kind, accessor)
+        removed = [pk for pk, (old, new) in changes.items() if old == value]
+        added = [pk for pk, (old, new) in changes.items() if new == value]
+        if removed:
+            through.objects.filter(**{f"{source}__in": removed, target: user_id}).delete()
+        if added:
+            through.objects.bulk_create(
+                [through(**{source: pk, target: user_id}) for pk in added], ignore_conflicts=True
+            )
+
+
+ROLLUP_KINDS = {Reaction.KIND_MEDIA: EngagementBucket.KIND_MEDIA, Reaction.KIND_SONG: EngagementBucket.KIND_SONG}
+
+
+def _apply_counters(kind, changes):
+    likes, dislikes = defaultdict(int), defaultdict(int)
+    for pk, (old, new) in changes.items():
+        likes[pk] += (new == Reaction.LIKE) - (old == Reaction.LIKE)
+        dislikes[pk] += (new == Reaction.DISLIKE) - (old == Reaction.DISLIKE)
+    if kind in ROLLUP_KINDS:
+        for pk in changes:
+            rollups.record(ROLLUP_KINDS[kind], pk, likes=likes[pk], dislikes=dislikes[pk])
+    if kind == Reaction.KIND_SONG:
+        ranking.adjust_song_reactions(likes, dislikes)
+        return
+    model = TARGETS[kind]
+    key = model._meta.pk.attname
+    model.objects.filter(pk__in=changes).update(
+        likes_count=Greatest(F("likes_count") + ranking.delta_case(key, likes), 0),
+        dislikes_count=Greatest(F("dislikes_count") + ranking.delta_case(key, dislikes), 0),
+    )
+
+
+def react_many(user, reactions):
+    """Set ``user``'s reaction on many targets in one transaction.
+
+    ``reactions`` is a list of ``(kind, object_id, value)`` where value is
+    ``Reaction.LIKE``, ``Reaction.DISLIKE`` or ``NONE``. Setting the reaction a
+    target already has is a no-op, so retried requests never double count.
+    Returns ``{(kind, object_id): value}`` for every target.
+    """
+    wanted = {(kind, object_id): value for kind, object_id, value in reactions}
+    if not wanted:
+        return {}
+    for kind in {kind for kind, _ in wanted}:
+        ids = {object_id for k, object_id in wanted if k == kind}
+        if TARGETS[kind].objects.filter(pk__in=ids).count() != len(ids):
+            raise NotFound(f"Unknown {kind} in reactions.")
+
+    targets = Q()
+    for kind, object_id in wanted:
+        targets |= Q(kind=kind, object_id=object_id)
+    with transaction.atomic(), rollups.batch():
+        # Reaction rows only lock once they exist; the user row always does, so two
+        # concurrent first reactions of one user can't both read NONE and both count
+        list(User.objects.select_for_update().filter(pk=user.pk).values_list("pk"))
+        current = {
+            (kind, object_id): value
+            for kind, object_id, value in Reaction.objects.select_for_update()
+            .filter(targets, user=user)
+            .values_list("kind", "object_id", "value")
+        }
+        # a like from before the reactions table has only its M2M row until the backfill reaches it
+        for kind in {kind for kind, _ in wanted}:
+            unseen = [object_id for k, object_id in wanted if k == kind and (k, object_id) not in current]
+            if unseen:
+                current.update({(kind, pk): value for pk, value in _legacy(kind, user.pk, unseen).items()})
+        changes = defaultdict(dict)
+        for target, value in wanted.items():
+            old = current.get(target, NONE)
+            if old != value:
+                changes[target[0]][target[1]] = (old, value)
+        if not changes:
+            return wanted
+
+        upserts = [
+            Reaction(user=user, kind=kind, object_id=pk, value=new)
+            for kind, kind_changes in changes.items()
+            for pk, (old, new) in kind_changes.items()
+            if new != NONE
+        ]
+        if upserts:
+            Reaction.objects.bulk_create(
+                upserts,
+                update_conflicts=True,
+                unique_fields=["user", "kind", "object_id"],
+                update_fields=["value", "updated"],
+            )
+        removed = Q()
+        for kind, kind_changes in changes.items():
+            ids = [pk for pk, (old, new) in kind_changes.items() if new == NONE]
+            if ids:
+                removed |= Q(kind=kind, object_id__in=ids)
+        if removed:
+            Reaction.objects.filter(removed, user=user).delete()
+
+        for kind, kind_changes in changes.items():
+            _apply_counters(kind, kind_changes)
+            _mirror(kind, user.pk, kind_changes)
+    return wanted
+
+
+def react(user, kind, object_id, value):
+    return react_many(user, [(kind, object_id, value)])[(kind, object_id)]
+
+
+def missing_legacy():
+    """Whether any legacy M2M like or dislike has no Reaction row yet."""
+    for kind in TARGETS:
+        for value, accessor in LEGACY:
+            through, source, target = _legacy_table(kind, accessor)
+            reacted = Reaction.objects.filter(kind=kind, object_id=OuterRef(source), user_id=OuterRef(target))
+            if through.objects.filter(~Exists(reacted)).exists():
+                return True
+    return False
+
+
+def import_legacy(batch_size=5000):
+    """Copy the legacy M2M likes and dislikes into Reaction rows; likes win, existing rows are kept."""
+    for kind in TARGETS:
+        for value, accessor in reversed(LEGACY):
+            through, source, target = _legacy_table(kind, accessor)
+            rows = through.objects.values_list(source, target)
+            Reaction.objects.bulk_create(
+                (
+                    Reaction(kind=kind, object_id=object_id, user_id=user_id, value=value)
+                    for object_id, user_id in rows.iterator(chunk_size=batch_size)
+                ),
+                batch_size=batch_size,
+                ignore_conflicts=True,
+            )
+
+
+def _count(kind, value, key):
+    rows = (
+        Reaction.objects.filter(kind=kind, value=value, object_id=OuterRef(key))
+        .order_by()
+        .values("object_id")
+        .annotate(n=Count("pk"))
+        .values("n")
+    )
+    return Coalesce(Subquery(rows, output_field=IntegerField()), 0)
+
+
+def reconcile():
+    """Recount every likes/dislikes counter from the reactions table; returns ``{kind: counters repaired}``."""
+    targets = [
+        (TARGETS[Reaction.KIND_MEDIA], Reaction.KIND_MEDIA, "pk"),
+        (TARGETS[Reaction.KIND_PROFILE], Reaction.KIND_PROFILE, "pk"),
+        (SongRanking, Reaction.KIND_SONG, "song_id"),
+    ]
+    repaired = {}
+    for model, kind, key in targets:
+        expected_likes = _count(kind, Reaction.LIKE, key)
+        expected_dislikes = _count(kind, Reaction.DISLIKE, key)
+        with transaction.atomic():
+            drifted = model.objects.annotate(
+                expected_likes=expected_likes, expected_dislikes=expected_dislikes
+            ).filter(~Q(likes_count=F("expected_likes")) | ~Q(dislikes_count=F("expected_dislikes")))
+            ids = list(drifted.values_list("pk", flat=True))
+            if ids:
+                model.objects.filter(pk__in=ids).update(
+                    likes_count=expected_likes, dislikes_count=expected_dislikes
+                )
+        repaired[kind] = len(ids)
+    return repaired
+
+
+def backfill(batch_size=5000):
+    """Bring the reactions table and counters up to the legacy M2M likes, once; a no-op after that."""
+    if not missing_legacy():
+        return False
+    import_legacy(batch_size)
+    reconcile()
+    ranking.refresh_board(LeaderboardEntry.BOARD_MOST_LIKED_SONGS)
+    return True
+
+
+def counts(kind, object_ids):
+    """Return ``{object_id: (likes, dislikes)}`` from the denormalized counters."""
+    if kind == Reaction.KIND_SONG:
+        rows = SongRanking.objects.filter(song_id__in=object_ids).values_list("song_id", "likes_count", "dislikes_count")
+    else:
+        rows = TARGETS[kind].objects.filter(pk__in=object_ids).values_list("pk", "likes_count", "dislikes_count")
+    result = {pk: (0, 0) for pk in object_ids}
+    result.update({pk: (likes, dislikes) for pk, likes, dislikes in rows})
+    return result
+
+
+def _valid_uuids(values):
+    result = []
+    for value in values:
+        try:
+            result.append(uuid.UUID(str(value)))
+        except ValueError:
+            pass
+    return result
+
+
+def resolve_ids(kind, public_ids):
+    """Map the ids clients see (media uid, profile user uid, song pk) to primary keys."""
+    if kind == Reaction.KIND_MEDIA:
+        rows = Media.objects.filter(uid__in=_valid_uuids(public_ids)).values_list("uid", "pk")
+    elif kind == Reaction.KIND_PROFILE:
+        rows = Profile.objects.filter(user__uid__in=_valid_uuids(public_ids)).values_list("user__uid", "pk")
+    else:
+        ids = [int(public_id) for public_id in public_ids if str(public_id).isdigit()]
+        rows = AudioMedia.objects.filter(pk__in=ids).values_list("pk", "pk")
+    return {str(public_id): pk for public_id, pk in rows}
@@ -0,0 +1,281 @@
+import random
+import time
+from array import array
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max, Sum
+from django.utils import timezone
+
+from apps.artiste.models import Artiste
+from profiles import profile_cache, ranking, rollups
+from profiles.models import EngagementBucket, ItemNeighbour, Media, MediaComment
+
+TOP_K = getattr(settings, "PROFILES_RECOMMEND_TOP_K", 50)
+RESULTS = getattr(settings, "PROFILES_RECOMMEND_RESULTS", 100)
+MEMORY_BUDGET = getattr(settings, "PROFILES_RECOMMEND_MEMORY_MB", 256) * 1024 * 1024
+WEIGHTS = getattr(settings, "PROFILES_RECOMMEND_WEIGHTS", {"like": 1.0, "comment": 0.5, "follow": 0.25})
+# a follow counts as a weak interaction with the artiste's newest uploads only
+FOLLOW_ITEMS = 20
+CHUNK_SIZE = 50_000
+STORE_BATCH = 1000
+
+Follow = Artiste.followers.field.model
+
+
+def _m2m_pairs(accessor):
+    field = Media._meta.get_field(accessor)
+    through = field.remote_field.through
+    return through.objects.values_list(f"{field.m2m_reverse_field_name()}_id", f"{field.m2m_field_name()}_id")
+
+
+def interactions():
+    """Yield ``(user_id, media_id, weight)`` from likes, media comments and follows."""
+    for user_id, media_id in _m2m_pairs("likes").iterator(chunk_size=CHUNK_SIZE):
+        yield user_id, media_id, WEIGHTS["like"]
+    for user_id, media_id in MediaComment.objects.values_list("commenter_id", "media_id").iterator(
+        chunk_size=CHUNK_SIZE
+    ):
+        yield user_id, media_id, WEIGHTS["comment"]
+
+    follower = profile_cache.follower_path()
+    if follower is None:
+        return
+    newest = defaultdict(list)
+    for media_id, owner_id in Media.objects.order_by("owner_id", "-pk").values_list("pk", "owner_id").iterator(
+        chunk_size=CHUNK_SIZE
+    ):
+        if len(newest[owner_id]) < FOLLOW_ITEMS:
+            newest[owner_id].append(media_id)
+    artiste_user = f"{Artiste.followers.field.name}__user_id"
+    for user_id, owner_id in Follow.objects.values_list(follower, artiste_user).iterator(chunk_size=CHUNK_SIZE):
+        for media_id in newest.get(owner_id, ()):
+            yield user_id, media_id, WEIGHTS["follow"]
+
+
+def collect(rows):
+    """Pack ``(user_id, item_id, weight)`` rows into NumPy arrays of dense indices.
+
+    Returns ``(user_index, item_index, weights, user_ids, item_ids)`` with one
+    entry per distinct (user, item) pair, keeping the strongest interaction.
+    """
+    import numpy as np
+
+    users, items, weights = array("q"), array("q"), array("f")
+    for user_id, item_id, weight in rows:
+        users.append(user_id)
+        items.append(item_id)
+        weights.append(weight)
+    user_ids, user_index = np.unique(np.frombuffer(users, dtype=np.int64), return_inverse=True)
+    item_ids, item_index = np.unique(np.frombuffer(items, dtype=np.int64), return_inverse=True)
+    weights = np.frombuffer(weights, dtype=np.float32)
+    del users, items
+
+    keys = user_index.astype(np.int64) * len(item_ids) + item_index
+    order = np.argsort(keys, kind="stable")
+    keys = keys[order]
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]]) if len(keys) else np.array([], dtype=np.int64)
+    weights = np.maximum.reduceat(weights[order], starts) if len(keys) else weights
+    keys = keys[starts]
+    return keys // len(item_ids), keys % len(item_ids), weights, user_ids, item_ids
+
+
+def matrix(user_index, item_index, weights, n_users, n_items):
+    from scipy import sparse
+
+    return sparse.csr_matrix((weights, (user_index, item_index)), shape=(n_users, n_items), dtype="float32")
+
+
+def neighbours(interactions_matrix, item_ids, columns=None, top_k=TOP_K):
+    """Yield ``(item_id, [(neighbour_id, cosine), ...])`` for each item column in ``columns``.
+
+    Similarities are computed a block of columns at a time, sized so that a
+    fully dense block still fits in MEMORY_BUDGET.
+    """
+    import numpy as np
+    from scipy import sparse
+
+    csc = interactions_matrix.tocsc()
+    norms = np.sqrt(np.asarray(csc.multiply(csc).sum(axis=0)).ravel())
+    norms[norms == 0] = 1
+    normalized = (csc @ sparse.diags(1 / norms)).tocsc()
+    transposed = normalized.T.tocsr()
+
+    n_items = normalized.shape[1]
+    columns = np.arange(n_items) if columns is None else np.asarray(columns)
+    block = max(1, MEMORY_BUDGET // max(n_items * 12, 1))
+    for start in range(0, len(columns), block):
+        cols = columns[start : start + block]
+        similarity = (transposed @ normalized[:, cols]).tocsc()
+        for j, col in enumerate(cols):
+            lo, hi = similarity.indptr[j], similarity.indptr[j + 1]
+            idx, values = similarity.indices[lo:hi], similarity.data[lo:hi]
+            keep = idx != col
+            idx, values = idx[keep], values[keep]
+            if len(values) > top_k:
+                top = np.argpartition(-values, top_k)[:top_k]
+                idx, values = idx[top], values[top]
+            order = np.argsort(-values)
+            yield int(item_ids[col]), list(zip(item_ids[idx[order]].tolist(), values[order].tolist()))
+
+
+def store(neighbour_lists):
+    """Replace the stored neighbour lists of every item in ``neighbour_lists``."""
+    stored = 0
+    batch = []
+
+    def flush(batch):
+        with transaction.atomic():
+            ItemNeighbour.objects.filter(item_id__in=[item_id for item_id, _ in batch]).delete()
+            ItemNeighbour.objects.bulk_create(
+                [
+                    ItemNeighbour(item_id=item_id, neighbour_id=neighbour_id, score=score)
+                    for item_id, pairs in batch
+                    for neighbour_id, score in pairs
+                    if score > 0
+                ]
+            )
+
+    for item_id, pairs in neighbour_lists:
+        batch.append((item_id, pairs))
+        if len(batch) >= STORE_BATCH:
+            flush(batch)
+            stored += len(batch)
+            batch = []
+    if batch:
+        flush(batch)
+        stored += len(batch)
+    return stored
+
+
+def build(since=None):
+    """Recompute item neighbours; with ``since``, only for items that saw engagement after it.
+
+    An incremental run rewrites the lists of the changed items but leaves
+    other items' lists that mention them alone, so run a full build
+    periodically as well.
+    """
+    import numpy as np
+
+    started = time.time()
+    user_index, item_index, weights, user_ids, item_ids = collect(interactions())
+    interactions_matrix = matrix(user_index, item_index, weights, len(user_ids), len(item_ids))
+    columns = None
+    if since is not None:
+        changed = EngagementBucket.objects.filter(
+            kind=EngagementBucket.KIND_MEDIA, start__gte=rollups.hour_start(since)
+        ).values_list("object_id", flat=True)
+        columns = np.flatnonzero(np.isin(item_ids, np.fromiter(set(changed), dtype=np.int64)))
+    cutoff = timezone.now()
+    stored = store(neighbours(interactions_matrix, item_ids, columns))
+    if since is None:
+        ItemNeighbour.objects.filter(updated__lt=cutoff).delete()
+    return {"items": stored, "interactions": len(weights), "seconds": time.time() - started}
+
+
+def refresh():
+    """Incremental build from the last run, or a full one when nothing is stored yet."""
+    since = ItemNeighbour.objects.aggregate(last=Max("updated"))["last"]
+    return build(since)
+
+
+def _reacted_ids(accessor, user_id):
+    field = Media._meta.get_field(accessor)
+    rows = field.remote_field.through.objects.filter(**{f"{field.m2m_reverse_field_name()}_id": user_id})
+    return rows.values_list(f"{field.m2m_field_name()}_id", flat=True)
+
+
+def recommend_ids(user_id, limit=RESULTS):
+    """Media ids for a user: the neighbours of everything they liked, summed, in one query."""
+    liked_ids = _reacted_ids("likes", user_id)
+    disliked_ids = _reacted_ids("dislikes", user_id)
+    rows = (
+        ItemNeighbour.objects.filter(item_id__in=liked_ids)
+        .exclude(neighbour_id__in=liked_ids)
+        .exclude(neighbour_id__in=disliked_ids)
+        .values("neighbour_id")
+        .annotate(total=Sum("score"))
+        .order_by("-total", "neighbour_id")[:limit]
+    )
+    return [row["neighbour_id"] for row in rows]
+
+
+def rank(ids):
+    """Order expression for ``ids`` in order; anything else ranks 0 with the first (filter it out for a keyset page)."""
+    return ranking.delta_case("pk", {pk: position for position, pk in enumerate(ids)})
+
+
+def evaluate(k=10, holdout=0.2, users=1000, seed=0):
+    """Offline precision@k / recall@k with held-out likes, plus build and serving latency.
+
+    For a sample of users with at least two likes, ``holdout`` of their likes
+    are hidden, neighbours are computed from the rest for the items those
+    users still have, and their top-k recommendations are scored against the
+    hidden likes. ``latency`` times the in-memory merge; ``serving`` times
+    ``recommend_ids`` against the stored neighbours.
+    """
+    import numpy as np
+
+    rng = random.Random(seed)
+    user_index, item_index, weights, user_ids, item_ids = collect(interactions())
+    liked = defaultdict(list)
+    for position in np.flatnonzero(weights >= WEIGHTS["like"]):
+        liked[int(user_index[position])].append(position)
+    candidates = [user for user, positions in liked.items() if len(positions) >= 2]
+    sample = rng.sample(candidates, min(users, len(candidates)))
+
+    hidden = {}
+    mask = np.ones(len(weights), dtype=bool)
+    for user in sample:
+        positions = liked[user]
+        held = rng.sample(positions, max(1, int(len(positions) * holdout)))
+        mask[held] = False
+        hidden[user] = {int(item_index[p]) for p in held}
+
+    started = time.time()
+    train = matrix(user_index[mask], item_index[mask], weights[mask], len(user_ids), len(item_ids))
+    seeds = {int(item_index[p]) for user in sample for p in liked[user] if mask[p]}
+    index_of = {int(item_id): position for position, item_id in enumerate(item_ids)}
+    model = {
+        index_of[item_id]: [(index_of[n], score) for n, score in pairs]
+        for item_id, pairs in neighbours(train, item_ids, sorted(seeds))
+    }
+    build_seconds = time.time() - started
+
+    precisions, recalls, latencies = [], [], []
+    for user in sample:
+        started = time.perf_counter()
+        seen = set(train[user].indices.tolist())
+        scores = defaultdict(float)
+        for item in seen:
+            for neighbour, score in model.get(item, ()):
+                if neighbour not in seen:
+                    scores[neighbour] += score
+        top = sorted(scores, key=scores.get, reverse=True)[:k]
+        latencies.append(time.perf_counter() - started)
+        hits = len(hidden[user].intersection(top))
+        precisions.append(hits / k)
+        recalls.append(hits / len(hidden[user]))
+
+    # serving latency of the stored model, as the feed sees it
+    serving = []
+    for user in sample[:100]:
+        started = time.perf_counter()
+        recommend_ids(int(user_ids[user]))
+        serving.append(time.perf_counter() - started)
+
+    latencies.sort()
+    serving.sort()
+    return {
+        "users": len(sample),
+        "interactions": int(len(weights)),
+        "items": int(len(item_ids)),
+        f"precision@{k}": float(np.mean(precisions)) if precisions else 0.0,
+        f"recall@{k}": float(np.mean(recalls)) if recalls else 0.0,
+        "build_seconds": build_seconds,
+        "latency_p50_ms": latencies[len(latencies) // 2] * 1000 if latencies else 0.0,
+        "latency_p95_ms": latencies[int(len(latencies) * 0.95)] * 1000 if latencies else 0.0,
+        "serving_p50_ms": serving[len(serving) // 2] * 1000 if serving else 0.0,
+        "serving_p95_ms": serving[int(len(serving) * 0.95)] * 1000 if serving else 0.0,
+    }
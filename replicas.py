@@ -0,0 +1,220 @@
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core import checks
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from django.utils.decorators import sync_and_async_middleware
+from rest_framework.permissions import SAFE_METHODS
+
+from profiles.instrumentation import metrics
+
+ROUTER = "profiles.replicas.ReplicaRouter"
+# only aliases listed explicitly: another database may be an analytics or legacy one rather than a copy of the primary
+REPLICAS = getattr(settings, "PROFILES_READ_REPLICAS", [])
+CACHE_ALIAS = getattr(settings, "PROFILES_REPLICA_CACHE", "default")
+# how long a user's reads stay on the primary after one of their writes; cover the worst replication lag
+STICKY_SECONDS = getattr(settings, "PROFILES_REPLICA_STICKY_SECONDS", 10)
+# how long a replica that failed to connect is left out
+DOWN_SECONDS = getattr(settings, "PROFILES_REPLICA_DOWN_SECONDS", 30)
+
+_replica = ContextVar("profiles_read_replica", default=None)
+_down = {}
+
+
+def _sticky_key(user_id):
+    return f"profiles:replica:sticky:{user_id}"
+
+
+def mark_sticky(user_id):
+    """Read ``user_id``'s requests from the primary for STICKY_SECONDS, so they see their own writes."""
+    caches[CACHE_ALIAS].set(_sticky_key(user_id), 1, STICKY_SECONDS)
+
+
+def is_sticky(user_id):
+    return caches[CACHE_ALIAS].get(_sticky_key(user_id)) is not None
+
+
+def choose(user=None):
+    """A healthy replica alias for ``user``'s reads, or None for the primary."""
+    if not REPLICAS:
+        return None
+    if user is not None and user.is_authenticated and is_sticky(user.pk):
+        metrics.inc("replica_sticky_total")
+        return None
+    now = time.monotonic()
+    for alias in random.sample(REPLICAS, len(REPLICAS)):
+        if _down.get(alias, 0) > now:
+            continue
+        try:
+            # a persistent connection is only re-checked here when CONN_HEALTH_CHECKS is on
+            connections[alias].ensure_connection()
+        except DatabaseError:
+            _down[alias] = now + DOWN_SECONDS
+            metrics.inc("replica_unavailable_total")
+            continue
+        metrics.inc("replica_reads_total")
+        return alias
+    return None
+
+
+@contextmanager
+def reading(alias):
+    """Route the reads in this block (and the threads it hands off to) to ``alias``; None means the primary."""
+    token = _replica.set(alias)
+    try:
+        yield
+    finally:
+        _replica.reset(token)
+
+
+class ReplicaRouter:
+    """Reads inside ``reading()`` go to its replica; all writes, and reads in a transaction, to the primary.
+
+    Add to DATABASE_ROUTERS. Replicas never get migrations: give them
+    ``"TEST": {"MIRROR": "default"}`` so tests read the primary's data.
+    """
+
+    def db_for_read(self, model, **hints):
+        alias = _replica.get()
+        if alias is None or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return alias
+
+    def db_for_write(self, model, **hints):
+        # instances read from a replica would otherwise be saved back to it
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        aliases = {DEFAULT_DB_ALIAS, *REPLICAS}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, **hints):
+        return False if db in REPLICAS else None
+
+
+def read_replica(view_class):
+    """Serve the safe requests of a DRF view from a replica, once the user is authenticated.
+
+    ``AsyncAPIView`` subclasses route in their own ``dispatch``.
+    """
+    view_class.read_replica = True
+    if not hasattr(view_class, "initial"):
+        return view_class
+    initial, finalize_response = view_class.initial, view_class.finalize_response
+
+    @wraps(initial)
+    def routed_initial(self, request, *args, **kwargs):
+        initial(self, request, *args, **kwargs)
+        if request.method in SAFE_METHODS:
+            self._replica_token = _replica.set(choose(request.user))
+
+    @wraps(finalize_response)
+    def routed_finalize_response(self, request, response, *args, **kwargs):
+        token = self.__dict__.pop("_replica_token", None)
+        if token is not None:
+            _replica.reset(token)
+        return finalize_response(self, request, response, *args, **kwargs)
+
+    view_class.initial = routed_initial
+    view_class.finalize_response = routed_finalize_response
+    return view_class
+
+
+def _after(request, response):
+    user = getattr(request, "user", None)
+    if request.method not in SAFE_METHODS and response.status_code < 400 and user and user.is_authenticated:
+        mark_sticky(user.pk)
+    return response
+
+
+@sync_and_async_middleware
+def replica_middleware(get_response):
+    """Make a user's reads sticky to the primary after any successful write request of theirs.
+
+    DRF hands the user it authenticated back to the Django request, so
+    token-authenticated writes count too.
+    """
+    if iscoroutinefunction(get_response):
+
+        async def middleware(request):
+            response = await get_response(request)
+            if REPLICAS and request.method not in SAFE_METHODS:
+                await sync_to_async(_after)(request, response)
+            return response
+
+    else:
+
+        def middleware(request):
+            response = get_response(request)
+            return _after(request, response) if REPLICAS else response
+
+    return middleware
+
+
+@checks.register()
+def check_connections(app_configs, **kwargs):
+    """Persistent, health-checked (and on PostgreSQL pooled) connections, and a complete replica setup."""
+    messages = []
+    for alias, config in settings.DATABASES.items():
+        engine = config.get("ENGINE", "")
+        pooled = bool(config.get("OPTIONS", {}).get("pool"))
+        # SQLite connections are cheap, and a pool replaces persistent connections
+        persistent = "sqlite" not in engine and not pooled
+        if persistent and config.get("CONN_MAX_AGE", 0) == 0:
+            messages.append(
+                checks.Warning(
+                    f"Database '{alias}' opens a new connection for every request.",
+                    hint="Set CONN_MAX_AGE (e.g. 60, or None for unlimited), or use a connection pool.",
+                    id="profiles.W001",
+                )
+            )
+        elif persistent and not config.get("CONN_HEALTH_CHECKS"):
+            messages.append(
+                checks.Warning(
+                    f"Database '{alias}' keeps connections open without health checks.",
+                    hint="Set CONN_HEALTH_CHECKS = True so a dropped connection is replaced, not reused.",
+                    id="profiles.W002",
+                )
+            )
+        if "postgresql" in engine and not pooled:
+            messages.append(
+                checks.Info(
+                    f"Database '{alias}' has no connection pool.",
+                    hint='Set OPTIONS = {"pool": True} (psycopg 3) or put PgBouncer in front of the server.',
+                    id="profiles.I001",
+                )
+            )
+        if alias in REPLICAS and config.get("TEST", {}).get("MIRROR") != DEFAULT_DB_ALIAS:
+            messages.append(
+                checks.Warning(
+                    f"Read replica '{alias}' does not mirror the primary in tests.",
+                    hint='Set "TEST": {"MIRROR": "default"} on the replica.',
+                    id="profiles.W003",
+                )
+            )
+    for alias in REPLICAS:
+        if alias not in settings.DATABASES:
+            messages.append(
+                checks.Error(
+                    f"Read replica '{alias}' is not in DATABASES.",
+                    hint="List only configured database aliases in PROFILES_READ_REPLICAS.",
+                    id="profiles.E001",
+                )
+            )
+    if REPLICAS and ROUTER not in settings.DATABASE_ROUTERS:
+        messages.append(
+            checks.Warning(
+                "Read replicas are configured but no reads are routed to them.",
+                hint=f"Add '{ROUTER}' to DATABASE_ROUTERS and replica_middleware to MIDDLEWARE.",
+                id="profiles.W004",
+            )
+        )
+    return messages
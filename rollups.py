@@ -0,0 +1,252 @@
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+from functools import partial
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Q, Sum
+from django.utils import timezone
+
+from apps.artiste.models import Artiste, AudioMedia
+from profiles import tasks
+from profiles.models import EngagementBucket, Media, TrendingScore, UserLikeDislikeCount
+
+QUEUE = "rollups"
+METRICS = ("likes", "dislikes", "comments", "plays")
+WEIGHTS = getattr(
+    settings, "PROFILES_TRENDING_WEIGHTS", {"likes": 3.0, "dislikes": -2.0, "comments": 4.0, "plays": 1.0}
+)
+# window -> (length, half-life) in hours
+WINDOWS = getattr(settings, "PROFILES_TRENDING_WINDOWS", {"day": (24, 6), "week": (168, 36), "month": (720, 168)})
+DEFAULT_WINDOW = "week"
+TRENDING_SIZE = getattr(settings, "PROFILES_TRENDING_SIZE", 100)
+HOURLY_RETENTION = timedelta(hours=getattr(settings, "PROFILES_ROLLUP_HOURLY_RETENTION", 48))
+REFRESH_INTERVAL = getattr(settings, "PROFILES_TRENDING_REFRESH_INTERVAL", 300)
+BATCH_SIZE = 500
+
+WIDTHS = {EngagementBucket.HOUR: timedelta(hours=1), EngagementBucket.DAY: timedelta(days=1)}
+
+_local = threading.local()
+
+
+def hour_start(when):
+    return when.astimezone(dt_timezone.utc).replace(minute=0, second=0, microsecond=0)
+
+
+def day_start(when):
+    return when.astimezone(dt_timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _empty():
+    return dict.fromkeys(METRICS, 0)
+
+
+def record(kind, object_id, when=None, **counts):
+    """Add ``counts`` (likes=1, plays=3, ...) to ``object_id``'s hourly bucket once the transaction commits.
+
+    Inside ``batch()`` the counts are merged in memory and written with the
+    rest of the batch; otherwise each call is its own upsert.
+    """
+    key = (kind, object_id, EngagementBucket.HOUR, hour_start(when or timezone.now()))
+    pending = getattr(_local, "pending", None)
+    if pending is not None:
+        row = pending[key]
+        for metric, n in counts.items():
+            row[metric] += n
+        return
+    row = _empty()
+    row.update(counts)
+    transaction.on_commit(partial(write, {key: row}))
+
+
+@contextmanager
+def batch():
+    """Collect every ``record()`` made inside the block into one batched upsert."""
+    if getattr(_local, "pending", None) is not None:
+        yield
+        return
+    _local.pending = defaultdict(_empty)
+    try:
+        yield
+        rows = _local.pending
+    finally:
+        _local.pending = None
+    if rows:
+        transaction.on_commit(partial(write, dict(rows)))
+
+
+def _artiste_rows(rows):
+    """Roll song and media buckets up to the artiste who owns them."""
+    songs = {object_id for kind, object_id, _, _ in rows if kind == EngagementBucket.KIND_SONG}
+    media = {object_id for kind, object_id, _, _ in rows if kind == EngagementBucket.KIND_MEDIA}
+    owners = {
+        EngagementBucket.KIND_SONG: dict(AudioMedia.objects.filter(pk__in=songs).values_list("pk", "artiste_id")),
+        EngagementBucket.KIND_MEDIA: {},
+    }
+    if media:
+        media_owners = dict(Media.objects.filter(pk__in=media).values_list("pk", "owner_id"))
+        artistes = dict(
+            Artiste.objects.filter(user_id__in=set(media_owners.values())).values_list("user_id", "pk")
+        )
+        owners[EngagementBucket.KIND_MEDIA] = {
+            pk: artistes[owner_id] for pk, owner_id in media_owners.items() if owner_id in artistes
+        }
+    result = defaultdict(_empty)
+    for (kind, object_id, granularity, start), counts in rows.items():
+        artiste_id = owners.get(kind, {}).get(object_id)
+        if artiste_id is None:
+            continue
+        row = result[(EngagementBucket.KIND_ARTISTE, artiste_id, granularity, start)]
+        for metric in METRICS:
+            row[metric] += counts[metric]
+    return result
+
+
+def upsert(rows):
+    """Add ``{(kind, object_id, granularity, start): counts}`` onto the stored buckets.
+
+    One ``INSERT ... ON CONFLICT DO UPDATE`` per BATCH_SIZE rows, incrementing
+    existing buckets in place (PostgreSQL and SQLite).
+    """
+    qn = connection.ops.quote_name
+    table = qn(EngagementBucket._meta.db_table)
+    keys = ["kind", "object_id", "granularity", "start"]
+    columns = ", ".join(qn(column) for column in keys + list(METRICS))
+    updates = ", ".join(f"{qn(m)} = {table}.{qn(m)} + EXCLUDED.{qn(m)}" for m in METRICS)
+    start_field = EngagementBucket._meta.get_field("start")
+    row_placeholder = "(" + ", ".join(["%s"] * (len(keys) + len(METRICS))) + ")"
+    items = list(rows.items())
+    with connection.cursor() as cursor:
+        for offset in range(0, len(items), BATCH_SIZE):
+            chunk = items[offset : offset + BATCH_SIZE]
+            params = []
+            for (kind, object_id, granularity, start), counts in chunk:
+                params += [kind, object_id, granularity, start_field.get_db_prep_value(start, connection)]
+                params += [counts[metric] for metric in METRICS]
+            cursor.execute(
+                f"INSERT INTO {table} ({columns}) VALUES {', '.join([row_placeholder] * len(chunk))} "
+                f"ON CONFLICT ({', '.join(qn(key) for key in keys)}) DO UPDATE SET {updates}",
+                params,
+            )
+
+
+def write(rows):
+    rows = {key: counts for key, counts in rows.items() if any(counts.values())}
+    if not rows:
+        return
+    rows.update(_artiste_rows(rows))
+    upsert(rows)
+    schedule_refresh()
+
+
+def schedule_refresh():
+    if cache.add("profiles:trending:refresh", True, REFRESH_INTERVAL):
+        tasks.enqueue("profiles.rollups.refresh_trending", queue=QUEUE, max_attempts=1)
+
+
+def compact(now=None):
+    """Fold hourly buckets older than HOURLY_RETENTION into daily ones, one whole day at a time."""
+    cutoff = day_start((now or timezone.now()) - HOURLY_RETENTION)
+    hourly = EngagementBucket.objects.filter(granularity=EngagementBucket.HOUR, start__lt=cutoff)
+    folded = 0
+    for day in hourly.datetimes("start", "day", tzinfo=dt_timezone.utc):
+        with transaction.atomic():
+            pks = list(
+                hourly.filter(start__gte=day, start__lt=day + WIDTHS[EngagementBucket.DAY])
+                .select_for_update()
+                .values_list("pk", flat=True)
+            )
+            totals = (
+                EngagementBucket.objects.filter(pk__in=pks)
+                .order_by()
+                .values("kind", "object_id")
+                .annotate(**{f"total_{metric}": Sum(metric) for metric in METRICS})
+            )
+            upsert(
+                {
+                    (row["kind"], row["object_id"], EngagementBucket.DAY, day): {
+                        metric: row[f"total_{metric}"] for metric in METRICS
+                    }
+                    for row in totals
+                }
+            )
+            EngagementBucket.objects.filter(pk__in=pks).delete()
+        folded += len(pks)
+    return folded
+
+
+def scores(kind, now=None):
+    """Return ``{window: {object_id: score}}`` for ``kind`` from a single pass over its buckets.
+
+    Each bucket contributes its weighted engagement, halved every half-life
+    hours of age (measured from the middle of the bucket).
+    """
+    now = now or timezone.now()
+    result = {window: defaultdict(float) for window in WINDOWS}
+    since = now - timedelta(hours=max(length for length, _ in WINDOWS.values()))
+    buckets = EngagementBucket.objects.filter(kind=kind).filter(
+        Q(granularity=EngagementBucket.HOUR, start__gte=since)
+        | Q(granularity=EngagementBucket.DAY, start__gt=since - WIDTHS[EngagementBucket.DAY])
+    )
+    for object_id, granularity, start, *counts in buckets.values_list(
+        "object_id", "granularity", "start", *METRICS
+    ).iterator():
+        end = start + WIDTHS[granularity]
+        weighted = sum(WEIGHTS.get(metric, 0) * n for metric, n in zip(METRICS, counts))
+        if not weighted:
+            continue
+        age = max((now - (start + WIDTHS[granularity] / 2)).total_seconds() / 3600, 0)
+        for window, (length, half_life) in WINDOWS.items():
+            if end > now - timedelta(hours=length):
+                result[window][object_id] += weighted * 0.5 ** (age / half_life)
+    return result
+
+
+def refresh_trending(now=None):
+    for kind, _ in EngagementBucket.KINDS:
+        for window, window_scores in scores(kind, now).items():
+            top = sorted(
+                ((score, object_id) for object_id, score in window_scores.items() if score > 0), reverse=True
+            )[:TRENDING_SIZE]
+            with transaction.atomic():
+                TrendingScore.objects.filter(kind=kind, window=window).delete()
+                TrendingScore.objects.bulk_create(
+                    [TrendingScore(kind=kind, window=window, object_id=pk, score=score) for score, pk in top]
+                )
+
+
+def _trending(kind, window):
+    return (
+        TrendingScore.objects.filter(kind=kind, window=window)
+        .order_by("-score", "object_id")
+        .values_list("object_id", flat=True)
+    )
+
+
+def trending_ids(kind, window):
+    return list(_trending(kind, window))
+
+
+async def atrending_ids(kind, window):
+    return [object_id async for object_id in _trending(kind, window)]
+
+
+def import_legacy(batch_size=1000):
+    """Fold the old per-user ``UserLikeDislikeCount`` rows into daily media buckets. Run once."""
+    totals = (
+        UserLikeDislikeCount.objects.filter(song__isnull=False)
+        .order_by()
+        .values("song_id", "created")
+        .annotate(total_likes=Sum("like_counter"), total_dislikes=Sum("dislike_counter"))
+    )
+    rows = {}
+    for row in totals.iterator(chunk_size=batch_size):
+        start = datetime.combine(row["created"], time.min, tzinfo=dt_timezone.utc)
+        counts = _empty()
+        counts.update(likes=row["total_likes"] or 0, dislikes=row["total_dislikes"] or 0)
+        rows[(EngagementBucket.KIND_MEDIA, row["song_id"], EngagementBucket.DAY, start)] = counts
+    write(rows)
+    return len(rows)
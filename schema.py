@@ -0,0 +1,99 @@
+import logging
+
+from django.contrib.auth import get_user_model
+from django.db import DatabaseError, connections
+
+from apps.artiste.models import Links
+from profiles import artiste_links, reactions, search, utils
+from profiles.models import Media
+from users.constants import VERIFICATION_PENDING
+
+logger = logging.getLogger(__name__)
+
+User = get_user_model()
+
+
+def statements(connection):
+    """Index DDL that model ``Meta.indexes`` can't express portably: other apps' tables and backend-only index types."""
+    qn = connection.ops.quote_name
+    # DDL takes no bind parameters; values are quoted the way the schema editor quotes index conditions
+    quote = connection.schema_editor().quote_value
+    result = []
+    if any(field.name == "user_type" for field in User._meta.concrete_fields):
+        # PopularArtistViewSet: Artiste.objects.filter(user__user_type="artist"); the filter is on user_type, so
+        # the earlier partial index over the primary key never drove that lookup
+        result += [
+            "DROP INDEX IF EXISTS profiles_user_artist_idx",
+            f"CREATE INDEX IF NOT EXISTS profiles_user_type_idx ON {qn(User._meta.db_table)} ({qn('user_type')})",
+        ]
+    # artiste_links.save_links upserts on it; Links lives in the artiste app, so its Meta can't carry the constraint
+    result.append(
+        f"CREATE UNIQUE INDEX IF NOT EXISTS artiste_links_type_uniq ON {qn(Links._meta.db_table)} "
+        f"({qn(Links.artiste.field.column)}, {qn('link_type')})"
+    )
+    if any(field.name == "verification_status" for field in User._meta.concrete_fields):
+        # the admin verification queue pages through pending users by primary key
+        result.append(
+            f"CREATE INDEX IF NOT EXISTS profiles_user_pending_idx ON {qn(User._meta.db_table)} "
+            f"({qn(User._meta.pk.column)}) WHERE {qn('verification_status')} = {quote(VERIFICATION_PENDING)}"
+        )
+    if connection.vendor == "postgresql":
+        # MediaFilter's song_name__icontains compiles to UPPER("song_name"::text) LIKE UPPER(%s)
+        concurrently = "" if connection.in_atomic_block else "CONCURRENTLY "
+        result += [
+            "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+            f"CREATE INDEX {concurrently}IF NOT EXISTS media_song_name_trgm_idx ON {qn(Media._meta.db_table)} "
+            f"USING gin ((UPPER({qn('song_name')}::text)) gin_trgm_ops)",
+            # admin search on email is email__icontains, the same UPPER(...) LIKE
+            f"CREATE INDEX {concurrently}IF NOT EXISTS profiles_user_email_trgm_idx ON {qn(User._meta.db_table)} "
+            f"USING gin ((UPPER({qn('email')}::text)) gin_trgm_ops)",
+        ]
+    return result
+
+
+def ensure_indexes(using="default", dry_run=False):
+    """Create the indexes from ``statements()`` that don't exist yet; returns the statements run."""
+    connection = connections[using]
+    ddl = statements(connection)
+    if dry_run:
+        return ddl
+    with connection.cursor() as cursor:
+        for sql in ddl:
+            try:
+                cursor.execute(sql)
+            except DatabaseError:
+                # e.g. no privilege to create the pg_trgm extension; the app works without these indexes
+                logger.warning("Could not apply %r", sql, exc_info=True)
+    return ddl
+
+
+def on_post_migrate(using="default", **kwargs):
+    # duplicate links would fail the unique index
+    artiste_links.dedupe()
+    ensure_indexes(using)
+    # the full-text index (and on SQLite its sync triggers) must exist before the first SearchDocument is saved
+    search.get_backend(using).ensure_index()
+    # counters and Reaction rows for likes made before the reactions table; a no-op once they exist
+    reactions.backfill()
+
+
+def backfill_durations(batch_size=1000):
+    """Fill ``Media.duration_ms`` from the legacy ``"MM:SS"`` text of rows ingested before it existed.
+
+    Rows whose text doesn't parse are left NULL (and re-ingesting them fills it).
+    """
+    updated, last_pk = 0, 0
+    while True:
+        batch = list(
+            Media.objects.filter(duration_ms__isnull=True, pk__gt=last_pk)
+            .order_by("pk")
+            .only("pk", "duration")[:batch_size]
+        )
+        if not batch:
+            return updated
+        last_pk = batch[-1].pk
+        for media in batch:
+            media.duration_ms = utils.duration_text_ms(media.duration)
+        parsed = [media for media in batch if media.duration_ms is not None]
+        Media.objects.bulk_update(parsed, ["duration_ms"])
+        updated += len(parsed)
@@ -0,0 +1,260 @@
+import math
+import re
+import unicodedata
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from apps.artiste.models import Artiste, AudioMedia
+from profiles.models import ArtisteRanking, SearchDocument, SongRanking
+
+POPULARITY_WEIGHT = getattr(settings, "PROFILES_SEARCH_POPULARITY_WEIGHT", 0.5)
+
+_TOKEN_RE = re.compile(r"\w+")
+
+
+def normalize(text):
+    text = unicodedata.normalize("NFKD", text or "")
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return " ".join(_TOKEN_RE.findall(text.lower()))
+
+
+def trigrams(token):
+    return {token[i : i + 3] for i in range(len(token) - 2)}
+
+
+def song_document(song):
+    album = song.album.album_name if song.album_id else ""
+    artiste = song.artiste.stage_name if song.artiste_id else ""
+    return normalize(" ".join([song.title or "", album or "", artiste or ""]))
+
+
+def artiste_document(artiste):
+    user = artiste.user
+    return normalize(" ".join([artiste.stage_name or "", user.first_name or "", user.last_name or ""]))
+
+
+def _popularity(kind, object_id):
+    if kind == SearchDocument.KIND_SONG:
+        count = SongRanking.objects.filter(song_id=object_id).values_list("likes_count", flat=True).first()
+    else:
+        count = ArtisteRanking.objects.filter(artiste_id=object_id).values_list("followers_count", flat=True).first()
+    return math.log1p(count or 0)
+
+
+def _save(kind, object_id, document):
+    SearchDocument.objects.update_or_create(
+        kind=kind,
+        object_id=object_id,
+        defaults={"document": document, "popularity": _popularity(kind, object_id)},
+    )
+
+
+def index_song(song):
+    _save(SearchDocument.KIND_SONG, song.pk, song_document(song))
+
+
+def index_artiste(artiste):
+    _save(SearchDocument.KIND_ARTISTE, artiste.pk, artiste_document(artiste))
+
+
+def remove(kind, object_id):
+    SearchDocument.objects.filter(kind=kind, object_id=object_id).delete()
+
+
+def update_popularity(kind, object_id):
+    SearchDocument.objects.filter(kind=kind, object_id=object_id).update(popularity=_popularity(kind, object_id))
+
+
+def rebuild(batch_size=1000):
+    backend = get_backend()
+    backend.ensure_index()
+    likes = dict(SongRanking.objects.values_list("song_id", "likes_count"))
+    followers = dict(ArtisteRanking.objects.values_list("artiste_id", "followers_count"))
+    SearchDocument.objects.all().delete()
+    songs = AudioMedia.objects.select_related("album", "artiste")
+    SearchDocument.objects.bulk_create(
+        (
+            SearchDocument(
+                kind=SearchDocument.KIND_SONG,
+                object_id=song.pk,
+                document=song_document(song),
+                popularity=math.log1p(likes.get(song.pk, 0)),
+            )
+            for song in songs.iterator(chunk_size=batch_size)
+        ),
+        batch_size=batch_size,
+    )
+    artistes = Artiste.objects.select_related("user")
+    SearchDocument.objects.bulk_create(
+        (
+            SearchDocument(
+                kind=SearchDocument.KIND_ARTISTE,
+                object_id=artiste.pk,
+                document=artiste_document(artiste),
+                popularity=math.log1p(followers.get(artiste.pk, 0)),
+            )
+            for artiste in artistes.iterator(chunk_size=batch_size)
+        ),
+        batch_size=batch_size,
+    )
+    backend.rebuild_index()
+
+
+class SearchBackend:
+    def __init__(self, connection):
+        self.connection = connection
+
+    def ensure_index(self):
+        """Create the index DDL; run at migrate time (and by ``rebuild``), never on the request path."""
+
+    def rebuild_index(self):
+        pass
+
+    def search(self, kind, query, limit, offset):
+        """Return object ids of ``kind`` matching ``query``, best first."""
+        raise NotImplementedError
+
+
+class SQLiteFTSBackend(SearchBackend):
+    """FTS5 word-prefix index plus a trigram index for substring/fuzzy matches.
+
+    Both are external-content tables over ``SearchDocument`` kept in sync by triggers.
+    """
+
+    def __init__(self, connection):
+        super().__init__(connection)
+        self.table = SearchDocument._meta.db_table
+        self.words = f"{self.table}_fts"
+        self.grams = f"{self.table}_trgm"
+
+    def ensure_index(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE name = %s", [self.grams])
+            if cursor.fetchone():
+                return
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {self.words} USING fts5("
+                f"document, content='{self.table}', content_rowid='id', "
+                f"tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+            )
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {self.grams} USING fts5("
+                f"document, content='{self.table}', content_rowid='id', tokenize='trigram')"
+            )
+            for fts in (self.words, self.grams):
+                cursor.execute(
+                    f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {self.table} BEGIN "
+                    f"INSERT INTO {fts}(rowid, document) VALUES (new.id, new.document); END"
+                )
+                cursor.execute(
+                    f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {self.table} BEGIN "
+                    f"INSERT INTO {fts}({fts}, rowid, document) VALUES ('delete', old.id, old.document); END"
+                )
+                cursor.execute(
+                    f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE ON {self.table} BEGIN "
+                    f"INSERT INTO {fts}({fts}, rowid, document) VALUES ('delete', old.id, old.document); "
+                    f"INSERT INTO {fts}(rowid, document) VALUES (new.id, new.document); END"
+                )
+
+    def rebuild_index(self):
+        with self.connection.cursor() as cursor:
+            for fts in (self.words, self.grams):
+                cursor.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+
+    def search(self, kind, query, limit, offset):
+        tokens = query.split()
+        selects = [
+            f"SELECT d.object_id, d.popularity, 10 - bm25({self.words}) AS relevance "
+            f"FROM {self.words} JOIN {self.table} d ON d.id = {self.words}.rowid "
+            f"WHERE {self.words} MATCH %s AND d.kind = %s"
+        ]
+        params = [" ".join(f'"{token}"*' for token in tokens), kind]
+        grams = set().union(*(trigrams(token) for token in tokens))
+        if grams:
+            selects.append(
+                f"SELECT d.object_id, d.popularity, -bm25({self.grams}) AS relevance "
+                f"FROM {self.grams} JOIN {self.table} d ON d.id = {self.grams}.rowid "
+                f"WHERE {self.grams} MATCH %s AND d.kind = %s"
+            )
+            params += [" OR ".join(f'"{gram}"' for gram in sorted(grams)), kind]
+        sql = (
+            f"SELECT object_id, MAX(relevance) + %s * popularity AS score "
+            f"FROM ({' UNION ALL '.join(selects)}) GROUP BY object_id "
+            f"ORDER BY score DESC, object_id LIMIT %s OFFSET %s"
+        )
+        with self.connection.cursor() as cursor:
+            cursor.execute(sql, [POPULARITY_WEIGHT, *params, limit, offset])
+            return [row[0] for row in cursor.fetchall()]
+
+
+class PostgresBackend(SearchBackend):
+    """``tsvector`` prefix matching plus ``pg_trgm`` similarity for fuzzy matches."""
+
+    def ensure_index(self):
+        table = SearchDocument._meta.db_table
+        # outside a transaction (migrate's post_migrate, the rebuild command) writes keep going meanwhile
+        concurrently = "" if self.connection.in_atomic_block else "CONCURRENTLY "
+        with self.connection.cursor() as cursor:
+            cursor.execute("SELECT to_regclass(%s)", [f"{table}_trgm_idx"])
+            if cursor.fetchone()[0]:
+                return
+            cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+            cursor.execute(
+                f"CREATE INDEX {concurrently}IF NOT EXISTS {table}_tsv_idx ON {table} "
+                f"USING gin (to_tsvector('simple'::regconfig, COALESCE(document, '')))"
+            )
+            cursor.execute(
+                f"CREATE INDEX {concurrently}IF NOT EXISTS {table}_trgm_idx ON {table} "
+                f"USING gin (document gin_trgm_ops)"
+            )
+
+    def search(self, kind, query, limit, offset):
+        from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector, TrigramSimilarity
+        from django.db.models import F, Q
+
+        vector = SearchVector("document", config="simple")
+        prefix = SearchQuery(" & ".join(f"{token}:*" for token in query.split()), search_type="raw", config="simple")
+        documents = (
+            SearchDocument.objects.filter(kind=kind)
+            .annotate(vector=vector)
+            .filter(Q(vector=prefix) | Q(document__trigram_similar=query))
+            .annotate(
+                score=SearchRank(vector, prefix)
+                + TrigramSimilarity("document", query)
+                + POPULARITY_WEIGHT * F("popularity")
+            )
+            .order_by("-score", "object_id")
+        )
+        return list(documents.values_list("object_id", flat=True)[offset : offset + limit])
+
+
+class ContainsBackend(SearchBackend):
+    """Fallback for other databases: every token must appear in the document."""
+
+    def search(self, kind, query, limit, offset):
+        documents = SearchDocument.objects.filter(kind=kind)
+        for token in query.split():
+            documents = documents.filter(document__contains=token)
+        documents = documents.order_by("-popularity", "object_id")
+        return list(documents.values_list("object_id", flat=True)[offset : offset + limit])
+
+
+BACKENDS = {
+    "sqlite": SQLiteFTSBackend,
+    "postgresql": PostgresBackend,
+}
+
+
+def get_backend(using=DEFAULT_DB_ALIAS):
+    connection = connections[using]
+    return BACKENDS.get(connection.vendor, ContainsBackend)(connection)
+
+
+def search(kind, text, page=1, page_size=20):
+    """Return ``(object_ids, has_more)`` for one page of ``kind`` results."""
+    query = normalize(text)
+    if not query:
+        return [], False
+    ids = get_backend().search(kind, query, page_size + 1, (page - 1) * page_size)
+    return ids[:page_size], len(ids) > page_size
@@ -1,18 +1,55 @@
 from dataclasses import field
 
 from attr import validate
+from django.conf import settings
+from django.db.models import Count, IntegerField, OuterRef, Prefetch, Subquery
+from django.db.models.functions import Coalesce
 from django.http import HttpRequest
+from django.urls import reverse
 from rest_framework import serializers
 from rest_framework.fields import CurrentUserDefault
+from rest_framework.utils.urls import replace_query_param
 
 from apps.artiste.api.v1.serializers import ArtisteSerializer, AudioMediaSerializer
 from apps.artiste.constants import PLATFORM_APPLE, PLATFORM_HIPHOP, PLATFORM_SPOTIFY, PLATFORM_TIKTOK, PLATFORM_YOUTUBE, \
     PLATFORM_INSTAGRAM, PLATFORM_TWITTER, PLATFORM_GENIUS, PLATFORM_LINKS
 from apps.artiste.models import Artiste, AudioMedia, Links
 from apps.lib.models import TermsAndConditions
+from profiles import artiste_links, images, uploads
+from profiles.instrumentation import TimedSerializerMixin
+from profiles.pagination import KeysetPagination
 from users.models import Fan, User
 
-from .models import Comment, Media, MediaComment, Profile, UserLikeDislikeCount
+from .models import Comment, Media, MediaComment, Profile, Reaction, UploadSession, UserLikeDislikeCount
+
+LINKS_ACCESSOR = Links.artiste.field.remote_field.get_accessor_name()
+COMMENTS_PREVIEW = getattr(settings, "PROFILES_COMMENTS_PREVIEW", 3)
+FOLLOWED_PREVIEW = getattr(settings, "PROFILES_FOLLOWED_PREVIEW", 20)
+EXPANDABLE = ("artiste_followed",)
+
+
+Album = AudioMedia.album.field.related_model
+# the foreign keys to Artiste behind its get_audio/albums/video/comments_count(), annotated as one
+# subquery each instead of a query per artiste; a renamed relation fails here, at import
+ARTISTE_COUNTS = {
+    "annotated_songs_count": AudioMedia.artiste.field,
+    "annotated_albums_count": Album.artiste.field,
+    "annotated_videos_count": Artiste.videos.field,
+    "annotated_comments_count": Artiste.comments.field,
+}
+
+
+def _count_subquery(field):
+    rows = field.model.objects.filter(**{field.name: OuterRef("pk")}).order_by().values(field.name)
+    return Coalesce(Subquery(rows.annotate(n=Count("pk")).values("n"), output_field=IntegerField()), 0)
+
+
+def expanded(request):
+    """Sorted names from ``?expand=a,b`` that a serializer can expand."""
+    if request is None:
+        return []
+    names = request.query_params.get("expand", "").split(",")
+    return sorted({name.strip() for name in names} & set(EXPANDABLE))
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -21,7 +58,7 @@ class UserSerializer(serializers.ModelSerializer):
         fields = ['first_name', 'last_name']
 
 
-class UserProfileSerializer(serializers.ModelSerializer):
+class UserProfileSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     user = serializers.HiddenField(default=CurrentUserDefault())
     artists_followed = serializers.SerializerMethodField()
     user_type = serializers.CharField(read_only=True, source="user.user_type")
@@ -30,10 +67,11 @@ class UserProfileSerializer(serializers.ModelSerializer):
     email_id = serializers.CharField(source="user.email", read_only=True)
     verification_status = serializers.CharField(source="user.verification_status", read_only=True)
     total_followers = serializers.SerializerMethodField()
+    profile_picture_srcset = serializers.SerializerMethodField()
 
     class Meta:
         model = Profile
-        exclude = "likes", "dislikes"
+        exclude = "likes", "dislikes", "profile_picture_variants"
 
     def get_artists_followed(self, obj):
         return obj.user.followed.all().count()
@@ -44,19 +82,27 @@ class UserProfileSerializer(serializers.ModelSerializer):
     def get_total_followers(self, obj):
         return obj.user.followers.all().count()
 
+    def get_profile_picture_srcset(self, obj):
+        return images.srcset(obj.profile_picture, obj.profile_picture_variants, self.context.get("request"))
+
 
-class ShortProfileSerializer(serializers.ModelSerializer):
+class ShortProfileSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     uid = serializers.SerializerMethodField()
     full_name = serializers.SerializerMethodField()
+    profile_picture_srcset = serializers.SerializerMethodField()
 
     class Meta:
         model = Profile
         fields = [
             "uid",
             "profile_picture",
+            "profile_picture_srcset",
             "full_name",
         ]
 
+    def get_profile_picture_srcset(self, obj):
+        return images.srcset(obj.profile_picture, obj.profile_picture_variants, self.context.get("request"))
+
     def get_uid(self, obj):
         return obj.user.uid
 
@@ -80,7 +126,7 @@ class ArtisteLinksSerializer(serializers.ModelSerializer):
         fields = ['link_url', 'link_type']
 
 
-class ArtisteProfileSerializer(serializers.ModelSerializer):
+class ArtisteProfileSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     user = UserSerializer()
     full_name = serializers.SerializerMethodField(source='user.get_full_name')
     user_type = serializers.CharField(source="user.user_type", read_only=True)
@@ -88,11 +134,11 @@ class ArtisteProfileSerializer(serializers.ModelSerializer):
     full_name = serializers.SerializerMethodField()
     verification_status = serializers.SerializerMethodField()
     profile_song = serializers.SerializerMethodField()
-    followers_count = serializers.IntegerField(source='followers.count')
-    songs_count = serializers.IntegerField(source='get_audio_count')
-    videos_count = serializers.IntegerField(source='get_video_count')
-    albums_count = serializers.IntegerField(source='get_albums_count')
-    artiste_comments_count = serializers.IntegerField(source='get_comments_count')
+    followers_count = serializers.SerializerMethodField()
+    songs_count = serializers.SerializerMethodField()
+    videos_count = serializers.SerializerMethodField()
+    albums_count = serializers.SerializerMethodField()
+    artiste_comments_count = serializers.SerializerMethodField()
     update_date = serializers.DateTimeField(source='user.last_login')
     share_links = serializers.SerializerMethodField()
 
@@ -100,6 +146,38 @@ class ArtisteProfileSerializer(serializers.ModelSerializer):
         model = Artiste
         fields = "__all__"
 
+    @staticmethod
+    def setup_eager_loading(queryset):
+        counts = {name: _count_subquery(field) for name, field in ARTISTE_COUNTS.items()}
+        return queryset.select_related("user", "profile_song").prefetch_related(
+            Prefetch(LINKS_ACCESSOR, queryset=Links.objects.all(), to_attr="prefetched_links")
+        ).annotate(annotated_followers_count=Count("followers", distinct=True), **counts)
+
+    def get_followers_count(self, obj):
+        if hasattr(obj, "annotated_followers_count"):
+            return obj.annotated_followers_count
+        return obj.followers.count()
+
+    def get_songs_count(self, obj):
+        if hasattr(obj, "annotated_songs_count"):
+            return obj.annotated_songs_count
+        return obj.get_audio_count()
+
+    def get_videos_count(self, obj):
+        if hasattr(obj, "annotated_videos_count"):
+            return obj.annotated_videos_count
+        return obj.get_video_count()
+
+    def get_albums_count(self, obj):
+        if hasattr(obj, "annotated_albums_count"):
+            return obj.annotated_albums_count
+        return obj.get_albums_count()
+
+    def get_artiste_comments_count(self, obj):
+        if hasattr(obj, "annotated_comments_count"):
+            return obj.annotated_comments_count
+        return obj.get_comments_count()
+
     def get_profile_song(self, obj):
         data = AudioMediaSerializer(obj.profile_song).data
 
@@ -115,9 +193,12 @@ class ArtisteProfileSerializer(serializers.ModelSerializer):
 
     def get_share_links(self, obj):
         result = {}
-        links = Links.objects.filter(artiste=obj)
-        artiste_links = ArtisteLinksSerializer(links, many=True).data
-        for link in artiste_links:
+        if hasattr(obj, "prefetched_links"):
+            links = obj.prefetched_links
+        else:
+            links = Links.objects.filter(artiste=obj)
+        serialized = ArtisteLinksSerializer(links, many=True).data
+        for link in serialized:
             link_type = link["link_type"]
             result[link_type] = link["link_url"]
         return result
@@ -129,12 +210,14 @@ class ArtisteProfileSerializer(serializers.ModelSerializer):
         return obj.get_verification_status_display()
 
     def update_links(self, instance, validated_data):
-        for link_type, platform in PLATFORM_LINKS.items():
-            if validated_data.get(link_type):
-                obj, created = Links.objects.update_or_create(
-                    artiste=instance, link_type=platform,
-                    defaults={'link_url': validated_data[link_type]},
-                )
+        artiste_links.save_links(
+            instance,
+            {
+                platform: validated_data[link_type]
+                for link_type, platform in PLATFORM_LINKS.items()
+                if validated_data.get(link_type)
+            },
+        )
 
     def update(self, instance: Artiste, validated_data):
         self.update_links(instance, self.initial_data)
@@ -158,44 +241,102 @@ class CommentSerializer(serializers.ModelSerializer):
         exclude = ("profile",)
 
     def get_user(self, obj):
-        return ShortProfileSerializer(instance=obj.commenter.profile).data
+        return ShortProfileSerializer(instance=obj.commenter.profile, context=self.context).data
 
 
 class EmptyBodySerializer(serializers.Serializer):
     pass
 
 
-class MediaSerializer(serializers.ModelSerializer):
+class ReactionSerializer(serializers.Serializer):
+    kind = serializers.ChoiceField(choices=Reaction.KINDS)
+    id = serializers.CharField(max_length=64)
+    reaction = serializers.ChoiceField(choices=["like", "dislike", "none"])
+
+
+class ReactionBatchSerializer(serializers.Serializer):
+    reactions = ReactionSerializer(many=True, allow_empty=False, max_length=100)
+
+
+class PlayEventSerializer(serializers.Serializer):
+    media = serializers.UUIDField()
+    session = serializers.CharField(max_length=64)
+    played_at = serializers.DateTimeField(required=False)
+    duration_ms = serializers.IntegerField(min_value=0, required=False, default=0)
+
+
+class PlayEventBatchSerializer(serializers.Serializer):
+    events = PlayEventSerializer(many=True, allow_empty=False, max_length=500)
+
+
+class UploadSessionCreateSerializer(serializers.Serializer):
+    kind = serializers.ChoiceField(choices=UploadSession.KINDS)
+    filename = serializers.CharField(max_length=255)
+    size = serializers.IntegerField(min_value=1)
+    content_type = serializers.CharField(max_length=128)
+    song_name = serializers.CharField(max_length=512, required=False)
+    album_name = serializers.CharField(max_length=512, required=False)
+
+    def validate_content_type(self, value):
+        # "audio/mpeg; charset=binary" and "Audio/MPEG" name the same type
+        return value.split(";", 1)[0].strip().lower()
+
+    def validate(self, attrs):
+        if attrs["kind"] == UploadSession.KIND_MEDIA and not attrs.get("song_name"):
+            raise serializers.ValidationError({"song_name": "This field is required for media uploads."})
+        errors = uploads.check_type(attrs["kind"], attrs["filename"], attrs["content_type"])
+        if errors:
+            raise serializers.ValidationError(errors)
+        return attrs
+
+
+class MediaSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     owner = serializers.HiddenField(default=CurrentUserDefault())
     artist = serializers.SerializerMethodField()
 
-    likes_count = serializers.SerializerMethodField()
-    dislikes_count = serializers.SerializerMethodField()
+    likes_count = serializers.IntegerField(read_only=True)
+    dislikes_count = serializers.IntegerField(read_only=True)
+    comments_count = serializers.IntegerField(source="annotated_comments_count", read_only=True)
     comments = serializers.SerializerMethodField()
+    cover_image_srcset = serializers.SerializerMethodField()
 
     class Meta:
         model = Media
-        exclude = ("id", "likes", "dislikes")
+        exclude = ("id", "likes", "dislikes", "cover_image_variants")
+
+    @staticmethod
+    def setup_eager_loading(queryset):
+        # only the newest few comments are embedded; the rest come from media/<uid>/comments/
+        comments = MediaComment.objects.select_related("commenter__profile")[:COMMENTS_PREVIEW]
+        return (
+            queryset.select_related("owner__profile")
+            .annotate(annotated_comments_count=Count("comments", distinct=True))
+            .prefetch_related(Prefetch("comments", queryset=comments, to_attr="preview_comments"))
+        )
 
     def get_artist(self, obj):
-        artist = {"stage_name": obj.owner.profile.stage_name, "artist_id": obj.owner.uid}
-        if obj.owner.profile.profile_picture:
-            artist["profile_picture"] = obj.owner.profile.profile_picture.url
-        if obj.owner.profile.profile_song:
-            artist["profile_song"] = obj.owner.profile.profile_song.url
+        profile = obj.owner.profile
+        artist = {"stage_name": profile.stage_name, "artist_id": obj.owner.uid}
+        if profile.profile_picture:
+            artist["profile_picture"] = profile.profile_picture.url
+            artist["profile_picture_srcset"] = images.srcset(
+                profile.profile_picture, profile.profile_picture_variants, self.context.get("request")
+            )
+        if profile.profile_song:
+            artist["profile_song"] = profile.profile_song.url
         return artist
 
-    def get_likes_count(self, obj):
-        return obj.likes.all().count()
-
-    def get_dislikes_count(self, obj):
-        return obj.dislikes.all().count()
-
     def get_comments(self, obj):
-        return CommentSerializer(instance=obj.comments.all(), many=True).data
+        comments = getattr(obj, "preview_comments", None)
+        if comments is None:
+            comments = obj.comments.select_related("commenter__profile")[:COMMENTS_PREVIEW]
+        return CommentSerializer(instance=comments, many=True, context=self.context).data
+
+    def get_cover_image_srcset(self, obj):
+        return images.srcset(obj.cover_image, obj.cover_image_variants, self.context.get("request"))
 
 
-class MediaCommentSerializer(serializers.ModelSerializer):
+class MediaCommentSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     commenter = serializers.HiddenField(default=CurrentUserDefault())
     user = serializers.SerializerMethodField()
 
@@ -204,14 +345,19 @@ class MediaCommentSerializer(serializers.ModelSerializer):
         exclude = ("media",)
 
     def get_user(self, obj):
-        return ShortProfileSerializer(instance=obj.commenter.profile).data
+        return ShortProfileSerializer(instance=obj.commenter.profile, context=self.context).data
 
 
 # Serializers define the API representation.
-class MoreOfWhatYouLikeSerializer(serializers.ModelSerializer):
+class MoreOfWhatYouLikeSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    cover_image_srcset = serializers.SerializerMethodField()
+
     class Meta:
         model = Media
-        fields = ['cover_image', 'song_name', 'album_name']
+        fields = ['cover_image', 'cover_image_srcset', 'song_name', 'album_name']
+
+    def get_cover_image_srcset(self, obj):
+        return images.srcset(obj.cover_image, obj.cover_image_variants, self.context.get("request"))
 
 
 class ProfileSearchSerializer(serializers.ModelSerializer):
@@ -226,7 +372,7 @@ class MediaSearchSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
-class SuggestionsSerializer(serializers.ModelSerializer):
+class SuggestionsSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     audio_media = serializers.SerializerMethodField()
     artist = serializers.SerializerMethodField()
     artiste = serializers.SerializerMethodField()
@@ -264,7 +410,7 @@ class TermsAndConditionsSerializer(serializers.ModelSerializer[TermsAndCondition
         }
 
 
-class FanProfileSerializer(serializers.ModelSerializer[Fan]):
+class FanProfileSerializer(TimedSerializerMixin, serializers.ModelSerializer[Fan]):
     user = UserSerializer()
     artiste_followed_count = serializers.CharField(source="get_followed_count", read_only=True)
     user_type = serializers.CharField(source="user.user_type", read_only=True)
@@ -272,16 +418,63 @@ class FanProfileSerializer(serializers.ModelSerializer[Fan]):
     email_id = serializers.CharField(source="user.email", read_only=True)
     verification_status = serializers.CharField(source="user.verification_status", read_only=True)
     artiste_followed = serializers.SerializerMethodField()
+    artiste_followed_next = serializers.SerializerMethodField()
 
     class Meta:
         model = Fan
         fields = '__all__'
 
+    def followed_preview(self, obj):
+        """The first FOLLOWED_PREVIEW followed artistes, in ``FollowedArtistsView`` order, plus whether more follow.
+
+        One query: id, stage name, picture and follower count.
+        """
+        if getattr(self, "_followed", (None,))[0] != obj.pk:
+            artistes = (
+                Artiste.objects.filter(pk__in=obj.get_followed().values("artiste_id"))
+                .values("pk", "stage_name", "user__profile__profile_picture", "user__profile__profile_picture_variants")
+                .annotate(followers_count=Count("followers"))
+                .order_by("pk")
+            )
+            rows = list(artistes[: FOLLOWED_PREVIEW + 1])
+            self._followed = (obj.pk, rows[:FOLLOWED_PREVIEW], len(rows) > FOLLOWED_PREVIEW)
+        return self._followed[1:]
+
     def get_artiste_followed(self, obj):
-        folows = obj.get_followed()
-        artiste_ids = [follow.artiste_id for follow in folows]
-        artiste = Artiste.objects.filter(id__in=artiste_ids)
-        return ArtisteProfileSerializer(artiste, many=True).data
+        request = self.context.get("request")
+        rows, _ = self.followed_preview(obj)
+        if "artiste_followed" in expanded(request):
+            artistes = ArtisteProfileSerializer.setup_eager_loading(
+                Artiste.objects.filter(pk__in=[row["pk"] for row in rows])
+            ).order_by("pk")
+            return ArtisteProfileSerializer(artistes, many=True, context=self.context).data
+        storage = Profile._meta.get_field("profile_picture").storage
+        return [
+            {
+                "id": row["pk"],
+                "stage_name": row["stage_name"],
+                "thumbnail": images.thumbnail(
+                    storage,
+                    row["user__profile__profile_picture"],
+                    row["user__profile__profile_picture_variants"],
+                    request,
+                ),
+                "followers_count": row["followers_count"],
+            }
+            for row in rows
+        ]
+
+    def get_artiste_followed_next(self, obj):
+        """Where the rest of the followed artistes continue, on the paginated ``FollowedArtistsView``."""
+        rows, has_more = self.followed_preview(obj)
+        if not has_more:
+            return None
+        url = reverse("followed_artists")
+        request = self.context.get("request")
+        if request is not None:
+            url = request.build_absolute_uri(url)
+        cursor = KeysetPagination().encode_cursor([rows[-1]["pk"]], False)
+        return replace_query_param(replace_query_param(url, "cursor", cursor), "page_size", FOLLOWED_PREVIEW)
 
     def update(self, instance, validated_data):
         user = instance.user
@@ -0,0 +1,167 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from django.contrib.auth import get_user_model
+
+from apps.artiste.models import Artiste, AudioMedia, Links
+from apps.lib.models import TermsAndConditions
+from profiles import images, ingest, profile_cache, ranking, rollups, search, suggest, terms
+from profiles.models import (
+    Artist,
+    EngagementBucket,
+    Fan,
+    Media,
+    MediaComment,
+    Profile,
+    SearchDocument,
+    VerificationRequests,
+)
+from users.models import Fan as FanAccount
+
+User = get_user_model()
+
+SongComment = AudioMedia.comments.field.model
+Follow = Artiste.followers.field.model
+
+
+@receiver(m2m_changed, sender=AudioMedia.likes.through)
+def song_likes_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ("post_add", "post_remove"):
+        return
+    delta = 1 if action == "post_add" else -1
+    if reverse:
+        for song_id in pk_set:
+            ranking.adjust_song_likes(song_id, delta)
+            search.update_popularity(SearchDocument.KIND_SONG, song_id)
+            rollups.record(EngagementBucket.KIND_SONG, song_id, likes=delta)
+    else:
+        ranking.adjust_song_likes(instance.pk, delta * len(pk_set))
+        search.update_popularity(SearchDocument.KIND_SONG, instance.pk)
+        rollups.record(EngagementBucket.KIND_SONG, instance.pk, likes=delta * len(pk_set))
+
+
+@receiver(post_save, sender=SongComment)
+def song_comment_created(sender, instance, created, **kwargs):
+    if created:
+        song_id = getattr(instance, AudioMedia.comments.field.attname)
+        ranking.adjust_song_comments(song_id, 1)
+        rollups.record(EngagementBucket.KIND_SONG, song_id, comments=1)
+
+
+@receiver(post_delete, sender=SongComment)
+def song_comment_deleted(sender, instance, **kwargs):
+    ranking.adjust_song_comments(getattr(instance, AudioMedia.comments.field.attname), -1)
+
+
+@receiver(post_save, sender=MediaComment)
+def media_comment_created(sender, instance, created, **kwargs):
+    if created:
+        rollups.record(EngagementBucket.KIND_MEDIA, instance.media_id, comments=1)
+
+
+@receiver(post_save, sender=Follow)
+def follow_created(sender, instance, created, **kwargs):
+    if created:
+        artiste_id = getattr(instance, Artiste.followers.field.attname)
+        ranking.adjust_artiste_followers(artiste_id, 1)
+        search.update_popularity(SearchDocument.KIND_ARTISTE, artiste_id)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    artiste_id = getattr(instance, Artiste.followers.field.attname)
+    ranking.adjust_artiste_followers(artiste_id, -1)
+    search.update_popularity(SearchDocument.KIND_ARTISTE, artiste_id)
+
+
+@receiver(post_save, sender=AudioMedia)
+def index_song(sender, instance, **kwargs):
+    search.index_song(instance)
+    suggest.update_song(instance)
+
+
+@receiver(post_delete, sender=AudioMedia)
+def unindex_song(sender, instance, **kwargs):
+    search.remove(SearchDocument.KIND_SONG, instance.pk)
+    suggest.index.remove(suggest.KIND_SONG, instance.pk)
+
+
+@receiver(post_save, sender=Artiste)
+def index_artiste(sender, instance, **kwargs):
+    search.index_artiste(instance)
+    suggest.update_artiste(instance)
+
+
+@receiver(post_delete, sender=Artiste)
+def unindex_artiste(sender, instance, **kwargs):
+    search.remove(SearchDocument.KIND_ARTISTE, instance.pk)
+    suggest.index.remove(suggest.KIND_ARTISTE, instance.pk)
+
+
+@receiver(post_save, sender=User)
+def reindex_user_artiste(sender, instance, created, **kwargs):
+    if created:
+        return
+    for artiste in Artiste.objects.filter(user=instance).select_related("user"):
+        search.index_artiste(artiste)
+
+
+@receiver(post_save, sender=Media)
+def ingest_uploaded_media(sender, instance, created, **kwargs):
+    if created and instance.file:
+        ingest.enqueue_media(instance)
+    images.enqueue(instance, "cover_image")
+
+
+def profile_picture_changed(sender, instance, **kwargs):
+    images.enqueue(instance, "profile_picture")
+
+
+def profile_changed(sender, instance, **kwargs):
+    profile_cache.invalidate(instance.user_id)
+
+
+# saving through a proxy sends post_save with the proxy as sender
+for profile_model in (Profile, Artist, Fan, VerificationRequests):
+    post_save.connect(profile_picture_changed, sender=profile_model, dispatch_uid=f"profile_picture_{profile_model}")
+    post_save.connect(profile_changed, sender=profile_model, dispatch_uid=f"profile_cache_{profile_model}")
+
+post_save.connect(profile_changed, sender=FanAccount, dispatch_uid="profile_cache_fan_account")
+
+
+@receiver(post_save, sender=Artiste)
+def artiste_profile_changed(sender, instance, **kwargs):
+    profile_cache.invalidate_artiste(instance.pk, instance.user_id)
+
+
+@receiver(post_save, sender=Links)
+@receiver(post_delete, sender=Links)
+def artiste_links_changed(sender, instance, **kwargs):
+    profile_cache.invalidate_artiste(instance.artiste_id)
+
+
+@receiver(post_save, sender=AudioMedia)
+@receiver(post_delete, sender=AudioMedia)
+def artiste_song_changed(sender, instance, **kwargs):
+    profile_cache.invalidate_artiste(instance.artiste_id)
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def follow_changed(sender, instance, **kwargs):
+    artiste_id = getattr(instance, Artiste.followers.field.attname)
+    user_id = Artiste.objects.filter(pk=artiste_id).values_list("user_id", flat=True).first()
+    profile_cache.invalidate(user_id, profile_cache.follower_user_id(instance))
+
+
+@receiver(post_save, sender=User)
+def user_changed(sender, instance, created, **kwargs):
+    if not created:
+        profile_cache.invalidate(instance.pk)
+
+
+@receiver(post_save, sender=TermsAndConditions)
+@receiver(post_delete, sender=TermsAndConditions)
+def terms_changed(sender, instance, **kwargs):
+    transaction.on_commit(terms.invalidate)
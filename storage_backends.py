@@ -1,7 +1,70 @@
 from django.conf import settings
 from storages.backends.s3boto3 import S3Boto3Storage
+from storages.utils import clean_name
 
 
 class MediaStorage(S3Boto3Storage):
     location = settings.AWS_MEDIA_LOCATION
     file_overwrite = False
+
+    def _key(self, name):
+        return self._normalize_name(clean_name(name))
+
+    @property
+    def client(self):
+        return self.connection.meta.client
+
+    def iter_range(self, name, start, end, chunk_size):
+        obj = self.bucket.Object(self._key(name))
+        body = obj.get(Range=f"bytes={start}-{end}")["Body"]
+        try:
+            yield from body.iter_chunks(chunk_size)
+        finally:
+            body.close()
+
+
+    def create_multipart_upload(self, name, content_type):
+        response = self.client.create_multipart_upload(
+            Bucket=self.bucket_name, Key=self._key(name), ContentType=content_type
+        )
+        return response["UploadId"]
+
+    def presign_upload_part(self, name, upload_id, part_number, expires_in=3600):
+        return self.client.generate_presigned_url(
+            "upload_part",
+            Params={"Bucket": self.bucket_name, "Key": self._key(name), "UploadId": upload_id, "PartNumber": part_number},
+            ExpiresIn=expires_in,
+        )
+
+    def list_uploaded_parts(self, name, upload_id):
+        parts = []
+        paginator = self.client.get_paginator("list_parts")
+        for page in paginator.paginate(Bucket=self.bucket_name, Key=self._key(name), UploadId=upload_id):
+            parts.extend(
+                {"PartNumber": p["PartNumber"], "ETag": p["ETag"], "Size": p["Size"]} for p in page.get("Parts", [])
+            )
+        return parts
+
+    def complete_multipart_upload(self, name, upload_id, parts):
+        self.client.complete_multipart_upload(
+            Bucket=self.bucket_name,
+            Key=self._key(name),
+            UploadId=upload_id,
+            MultipartUpload={"Parts": [{"PartNumber": p["PartNumber"], "ETag": p["ETag"]} for p in parts]},
+        )
+
+    def abort_multipart_upload(self, name, upload_id):
+        self.client.abort_multipart_upload(Bucket=self.bucket_name, Key=self._key(name), UploadId=upload_id)
+
+    def delete_many(self, names):
+        """Delete ``names`` with ``DeleteObjects``, 1000 keys per call; returns the names that failed."""
+        keys = {self._key(name): name for name in names}
+        batch = list(keys)
+        failed = []
+        for start in range(0, len(batch), 1000):
+            response = self.client.delete_objects(
+                Bucket=self.bucket_name,
+                Delete={"Objects": [{"Key": key} for key in batch[start : start + 1000]], "Quiet": True},
+            )
+            failed += [keys[error["Key"]] for error in response.get("Errors", [])]
+        return failed
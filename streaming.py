@@ -0,0 +1,145 @@
+import hashlib
+import mimetypes
+import mmap
+import re
+
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils.http import quote_etag
+
+from profiles.ingest import local_path
+
+try:
+    from botocore.exceptions import ClientError
+except ImportError:  # pragma: no cover
+    ClientError = None
+
+CHUNK_SIZE = getattr(settings, "PROFILES_STREAM_CHUNK_SIZE", 256 * 1024)
+ACCEL_REDIRECT_PREFIX = getattr(settings, "PROFILES_STREAM_ACCEL_REDIRECT_PREFIX", None)
+
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+# what S3 answers for a HEAD of a missing key
+_MISSING_CODES = {"404", "NoSuchKey", "NotFound"}
+
+
+def parse_range(header, size):
+    """Return ``(start, end)`` inclusive for a single ``bytes=`` range, ``None`` to serve the
+    whole file, or ``False`` when the range cannot be satisfied."""
+    match = _RANGE_RE.match(header.strip()) if header else None
+    if match is None:
+        return None
+    start, end = match.groups()
+    if not start and not end:
+        return None
+    if not start:
+        length = int(end)
+        if length == 0:
+            return False
+        return max(size - length, 0), size - 1
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+def stored_size(storage, name):
+    """``storage.size(name)``, raising ``Http404`` when the object is gone from the filesystem or bucket."""
+    try:
+        return storage.size(name)
+    except FileNotFoundError:
+        raise Http404
+    except Exception as exc:
+        if ClientError is not None and isinstance(exc, ClientError):
+            if exc.response.get("Error", {}).get("Code") in _MISSING_CODES:
+                raise Http404
+        raise
+
+
+def file_etag(field_file, size):
+    return quote_etag(hashlib.md5(f"{field_file.name}:{size}".encode()).hexdigest())
+
+
+def etag_matches(header, etag):
+    if not header:
+        return False
+    return header.strip() == "*" or etag in [tag.strip() for tag in header.split(",")]
+
+
+def iter_storage(storage, name, start, end):
+    """Yield bytes ``start..end`` of ``name``, letting the backend serve the range if it can."""
+    if hasattr(storage, "iter_range"):
+        yield from storage.iter_range(name, start, end, CHUNK_SIZE)
+        return
+    with storage.open(name, "rb") as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = f.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def iter_mmap(path, start, end):
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        view = memoryview(mapped)
+        try:
+            for offset in range(start, end + 1, CHUNK_SIZE):
+                yield bytes(view[offset : min(offset + CHUNK_SIZE, end + 1)])
+        finally:
+            view.release()
+
+
+def stream_file(request, field_file):
+    """Serve ``field_file`` honouring ``Range``, ``If-Range`` and ``If-None-Match``.
+
+    Local files go out through ``sendfile`` (whole file or tail) or ``mmap``;
+    remote ones are streamed chunk by chunk from the storage backend. With
+    ``PROFILES_STREAM_ACCEL_REDIRECT_PREFIX`` set, nginx serves the bytes instead.
+    """
+    storage = field_file.storage
+    size = stored_size(storage, field_file.name)
+    etag = file_etag(field_file, size)
+    content_type = mimetypes.guess_type(field_file.name)[0] or "application/octet-stream"
+
+    if etag_matches(request.headers.get("If-None-Match"), etag):
+        response = HttpResponse(status=304)
+        response["ETag"] = etag
+        return response
+
+    if ACCEL_REDIRECT_PREFIX:
+        response = HttpResponse(content_type=content_type)
+        response["X-Accel-Redirect"] = ACCEL_REDIRECT_PREFIX.rstrip("/") + "/" + field_file.name.lstrip("/")
+        response["ETag"] = etag
+        return response
+
+    byte_range = None
+    if_range = request.headers.get("If-Range")
+    if not if_range or if_range.strip() == etag:
+        byte_range = parse_range(request.headers.get("Range"), size)
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response["Content-Range"] = f"bytes */{size}"
+        return response
+
+    start, end = byte_range or (0, size - 1)
+    path = local_path(field_file)
+    if path and end == size - 1:
+        f = open(path, "rb")
+        f.seek(start)
+        response = FileResponse(f, content_type=content_type)
+    elif path:
+        response = StreamingHttpResponse(iter_mmap(path, start, end), content_type=content_type)
+    else:
+        response = StreamingHttpResponse(iter_storage(storage, field_file.name, start, end), content_type=content_type)
+
+    if byte_range:
+        response.status_code = 206
+        response["Content-Range"] = f"bytes {start}-{end}/{size}"
+    response["Content-Length"] = str(end - start + 1)
+    response["Accept-Ranges"] = "bytes"
+    response["ETag"] = etag
+    response["Cache-Control"] = "private, max-age=86400"
+    return response
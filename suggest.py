@@ -0,0 +1,349 @@
+import gc
+import heapq
+import json
+import os
+import threading
+import time
+from bisect import bisect_left, insort
+
+from django.conf import settings
+
+from apps.artiste.models import Artiste, AudioMedia
+from profiles.models import ArtisteRanking, SongRanking
+from profiles.search import normalize
+
+KIND_SONG = "song"
+KIND_ALBUM = "album"
+KIND_ARTISTE = "artiste"
+
+SNAPSHOT_PATH = getattr(settings, "PROFILES_SUGGEST_SNAPSHOT", None)
+MAX_ENTRIES = getattr(settings, "PROFILES_SUGGEST_MAX_ENTRIES", 2_000_000)
+RELOAD_INTERVAL = getattr(settings, "PROFILES_SUGGEST_RELOAD_INTERVAL", 60)
+
+_END = "\U0010ffff"
+
+
+class SuggestIndex:
+    """Sorted array of normalized keys plus a top-k list for every heavy prefix.
+
+    Every label is indexed from each of its first ``max_words`` word starts, so
+    "rhap" finds "Bohemian Rhapsody". A prefix is heavy when more than
+    ``scan_limit`` keys start with it; those are the trie nodes whose top-k is
+    kept precomputed, everything else is answered by scanning a short slice.
+    Updates move entries within those lists in place; a list that may have
+    lost its true k-th entry is marked stale and rescanned by a background
+    thread (``refresh_stale``) while queries keep using it.
+    """
+
+    def __init__(self, max_entries=MAX_ENTRIES, top_k=20, scan_limit=256, max_words=4, background=True):
+        self.max_entries = max_entries
+        self.top_k = top_k
+        self.scan_limit = scan_limit
+        self.max_words = max_words
+        self.background = background
+        self.loaded_at = 0
+        self._lock = threading.RLock()
+        self._refreshing = False
+        self._clear()
+
+    def _clear(self):
+        self._keys = []
+        self._items = {}
+        self._top = {}
+        # min-heap of (score, ref) for eviction; entries left behind by updates are skipped lazily
+        self._heap = []
+        self._floor = 0
+        self._stale = set()
+
+    def __len__(self):
+        return len(self._items)
+
+    def score(self, kind, object_id):
+        item = self._items.get((kind, object_id))
+        return item[1] if item else 0
+
+    def _index_keys(self, kind, object_id, text):
+        words = text.split()
+        ref = f"{kind}:{object_id}"
+        return [f"{' '.join(words[i:])}\x00{ref}" for i in range(min(len(words), self.max_words))]
+
+    def _range(self, prefix, lo=0, hi=None):
+        hi = len(self._keys) if hi is None else hi
+        lo = bisect_left(self._keys, prefix, lo, hi)
+        return lo, bisect_left(self._keys, prefix + _END, lo, hi)
+
+    def _heavy_prefixes(self):
+        heavy = set()
+        stack = [("", 0, len(self._keys))]
+        while stack:
+            prefix, lo, hi = stack.pop()
+            depth = len(prefix)
+            i = lo
+            while i < hi:
+                key = self._keys[i]
+                if len(key) <= depth or key[depth] == "\x00":
+                    i += 1
+                    continue
+                child = prefix + key[depth]
+                j = bisect_left(self._keys, child + _END, i, hi)
+                if j - i > self.scan_limit:
+                    heavy.add(child)
+                    stack.append((child, i, j))
+                i = j
+        return heavy
+
+    def load(self, rows):
+        """Replace the index with ``rows`` of ``(kind, object_id, label, score, normalized_label)``."""
+        rows = sorted(rows, key=lambda row: row[3], reverse=True)
+        # millions of small allocations; collector passes would dominate the load time
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            self._load(rows)
+        finally:
+            if gc_enabled:
+                gc.enable()
+
+    def _load(self, rows):
+        with self._lock:
+            self._clear()
+            if len(rows) > self.max_entries:
+                rows = rows[: self.max_entries]
+                self._floor = rows[-1][3]
+            for kind, object_id, label, score, text in rows:
+                keys = self._index_keys(kind, object_id, text)
+                self._items[(kind, object_id)] = (label, score, keys)
+                self._keys.extend(keys)
+            self._keys.sort()
+            self._heap = [(score, (kind, object_id)) for kind, object_id, _, score, _ in rows]
+            heapq.heapify(self._heap)
+            self._top = {prefix: [] for prefix in self._heavy_prefixes()}
+            # rows are in descending score order, so the first k refs seen under a prefix are its top-k
+            pending = len(self._top)
+            for kind, object_id, _, _, _ in rows:
+                if not pending:
+                    break
+                ref = (kind, object_id)
+                for key in self._items[ref][2]:
+                    text = key.split("\x00", 1)[0]
+                    for i in range(1, len(text) + 1):
+                        top = self._top.get(text[:i])
+                        if top is None:
+                            break
+                        if len(top) < self.top_k and ref not in top:
+                            top.append(ref)
+                            if len(top) == self.top_k:
+                                pending -= 1
+            self.loaded_at = time.time()
+
+    def _prefixes(self, keys):
+        for key in keys:
+            text = key.split("\x00", 1)[0]
+            for i in range(1, len(text) + 1):
+                if text[:i] in self._top:
+                    yield text[:i]
+
+    def _lowest(self):
+        while self._heap:
+            score, ref = self._heap[0]
+            item = self._items.get(ref)
+            if item is not None and item[1] == score:
+                return ref
+            heapq.heappop(self._heap)
+        return None
+
+    def _place(self, ref, keys, old_score):
+        """Move ``ref`` into, or within, the top-k lists of its heavy prefixes after it was added or rescored."""
+        score = self._items[ref][1]
+        for prefix in set(self._prefixes(keys)):
+            top = self._top[prefix]
+            if top is None:
+                continue
+            if ref in top:
+                top.sort(key=lambda r: self._items[r][1], reverse=True)
+                # sinking to the bottom of a full list, it may now rank below an entry that isn't listed
+                if old_score is not None and score < old_score and len(top) >= self.top_k and top[-1] == ref:
+                    self._stale.add(prefix)
+            elif len(top) < self.top_k or score > self._items[top[-1]][1]:
+                top.append(ref)
+                top.sort(key=lambda r: self._items[r][1], reverse=True)
+                del top[self.top_k :]
+
+    def update(self, kind, object_id, label, score):
+        with self._lock:
+            ref = (kind, object_id)
+            item = self._items.get(ref)
+            if item is None and len(self._items) >= self.max_entries and score <= self._floor:
+                return
+            keys = self._index_keys(kind, object_id, normalize(label))
+            if item is not None and item[2] == keys:
+                # a new score for the same label: the keys stay where they are
+                self._items[ref] = (label, score, keys)
+                old_score = item[1]
+            else:
+                self.remove(kind, object_id)
+                if not keys:
+                    return
+                for key in keys:
+                    insort(self._keys, key)
+                self._items[ref] = (label, score, keys)
+                old_score = None
+            heapq.heappush(self._heap, (score, ref))
+            if len(self._heap) > 2 * len(self._items) + 64:
+                self._heap = [(item[1], r) for r, item in self._items.items()]
+                heapq.heapify(self._heap)
+            self._place(ref, keys, old_score)
+            # max_entries is a cap: a newcomer above the floor pushes out the lowest-scored entry
+            if len(self._items) > self.max_entries:
+                self.remove(*self._lowest())
+            if len(self._items) >= self.max_entries:
+                self._floor = self._items[self._lowest()][1]
+            self._refresh_soon()
+
+    def remove(self, kind, object_id):
+        with self._lock:
+            ref = (kind, object_id)
+            item = self._items.get(ref)
+            if item is None:
+                return
+            for prefix in set(self._prefixes(item[2])):
+                top = self._top[prefix]
+                if top is not None and ref in top:
+                    top.remove(ref)
+                    # the entry that moves up into the freed place is found off the query path
+                    self._stale.add(prefix)
+            del self._items[ref]
+            for key in item[2]:
+                i = bisect_left(self._keys, key)
+                if i < len(self._keys) and self._keys[i] == key:
+                    del self._keys[i]
+            self._refresh_soon()
+
+    def _refresh_soon(self):
+        if self._stale and self.background and not self._refreshing:
+            self._refreshing = True
+            threading.Thread(target=self.refresh_stale, name="profiles-suggest-refresh", daemon=True).start()
+
+    def refresh_stale(self):
+        """Rescan the stale top-k lists; the scan runs outside the lock so queries are not held up by it."""
+        while True:
+            with self._lock:
+                if not self._stale:
+                    self._refreshing = False
+                    return
+                prefix = self._stale.pop()
+                loaded_at = self.loaded_at
+                lo, hi = self._range(prefix)
+                keys = self._keys[lo:hi]
+            refs = self._scan(keys)
+            with self._lock:
+                # skipped if the prefix went stale again meanwhile (it is queued) or the index was reloaded
+                if prefix not in self._stale and self.loaded_at == loaded_at and self._top.get(prefix) is not None:
+                    self._top[prefix] = [ref for ref in refs if ref in self._items]
+
+    def _scan(self, keys):
+        refs = set()
+        for key in keys:
+            kind, object_id = key.rsplit("\x00", 1)[1].split(":", 1)
+            refs.add((kind, int(object_id)))
+        # entries removed while a background refresh scans sort last
+        return heapq.nlargest(self.top_k, refs, key=lambda ref: self._items.get(ref, (None, -1))[1])
+
+    def query(self, text, limit=10):
+        prefix = normalize(text)
+        if not prefix:
+            return []
+        with self._lock:
+            refs = self._top.get(prefix)
+            if refs is None:
+                lo, hi = self._range(prefix)
+                refs = self._scan(self._keys[lo:hi])
+                if hi - lo > self.scan_limit:
+                    self._top[prefix] = refs
+            return [{"text": self._items[ref][0], "type": ref[0], "id": ref[1]} for ref in refs[:limit]]
+
+    def rows(self):
+        with self._lock:
+            return [
+                [kind, object_id, label, score, keys[0].split("\x00", 1)[0]]
+                for (kind, object_id), (label, score, keys) in self._items.items()
+            ]
+
+
+index = SuggestIndex()
+
+
+def song_rows(song, likes):
+    rows = []
+    if song.title:
+        rows.append((KIND_SONG, song.pk, song.title, likes, normalize(song.title)))
+    if song.album_id and song.album.album_name:
+        rows.append((KIND_ALBUM, song.album_id, song.album.album_name, likes, normalize(song.album.album_name)))
+    return rows
+
+
+def artiste_rows(artiste, followers):
+    if artiste.stage_name:
+        return [(KIND_ARTISTE, artiste.pk, artiste.stage_name, followers, normalize(artiste.stage_name))]
+    return []
+
+
+def build_rows():
+    likes = dict(SongRanking.objects.values_list("song_id", "likes_count"))
+    followers = dict(ArtisteRanking.objects.values_list("artiste_id", "followers_count"))
+    albums = {}
+    for song in AudioMedia.objects.select_related("album").iterator(chunk_size=2000):
+        for row in song_rows(song, likes.get(song.pk, 0)):
+            if row[0] == KIND_ALBUM:
+                if row[1] not in albums or row[3] > albums[row[1]][3]:
+                    albums[row[1]] = row
+            else:
+                yield row
+    yield from albums.values()
+    for artiste in Artiste.objects.iterator(chunk_size=2000):
+        yield from artiste_rows(artiste, followers.get(artiste.pk, 0))
+
+
+def save_snapshot(path=None, rows=None):
+    path = path or SNAPSHOT_PATH
+    rows = index.rows() if rows is None else rows
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(list(rows), f, separators=(",", ":"))
+    os.replace(tmp, path)
+
+
+def load_snapshot(path=None):
+    path = path or SNAPSHOT_PATH
+    if not path or not os.path.exists(path):
+        return False
+    with open(path) as f:
+        index.load(tuple(row) for row in json.load(f))
+    return True
+
+
+def maybe_reload():
+    """Pick up a snapshot rebuilt by another process, checking at most every RELOAD_INTERVAL seconds."""
+    now = time.time()
+    if not SNAPSHOT_PATH or now - getattr(maybe_reload, "checked_at", 0) < RELOAD_INTERVAL:
+        return
+    maybe_reload.checked_at = now
+    try:
+        if os.path.getmtime(SNAPSHOT_PATH) > index.loaded_at:
+            load_snapshot()
+    except OSError:
+        pass
+
+
+def update_song(song):
+    score = SongRanking.objects.filter(song_id=song.pk).values_list("likes_count", flat=True).first() or 0
+    for kind, object_id, label, row_score, _ in song_rows(song, score):
+        if kind == KIND_ALBUM:
+            row_score = max(row_score, index.score(kind, object_id))
+        index.update(kind, object_id, label, row_score)
+
+
+def update_artiste(artiste):
+    score = ArtisteRanking.objects.filter(artiste_id=artiste.pk).values_list("followers_count", flat=True).first()
+    for kind, object_id, label, row_score, _ in artiste_rows(artiste, score or 0):
+        index.update(kind, object_id, label, row_score)
@@ -0,0 +1,124 @@
+import logging
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from profiles.models import Task
+
+logger = logging.getLogger(__name__)
+
+BROKER_DATABASE = "database"
+BROKER_INLINE = "inline"
+
+BROKER = getattr(settings, "PROFILES_TASK_BROKER", BROKER_DATABASE)
+RETRY_DELAY = getattr(settings, "PROFILES_TASK_RETRY_DELAY", 30)
+# a running task whose worker stopped renewing its lease for this long is claimed again
+LEASE_SECONDS = getattr(settings, "PROFILES_TASK_LEASE_SECONDS", 300)
+
+
+def enqueue(path, *args, queue="default", max_attempts=3):
+    """Run the callable at dotted ``path`` with JSON-serializable ``args`` on a worker.
+
+    With the inline broker (tests, local development) the task runs immediately
+    in-process, retrying up to ``max_attempts`` times without waiting.
+    """
+    if BROKER == BROKER_INLINE:
+        for attempt in range(1, max_attempts + 1):
+            try:
+                return import_string(path)(*args)
+            except Exception:
+                if attempt == max_attempts:
+                    raise
+        return None
+    task = Task(queue=queue, path=path, args=list(args), max_attempts=max_attempts)
+    transaction.on_commit(task.save)
+    return task
+
+
+def claim(queues, limit):
+    """Lease up to ``limit`` due tasks from ``queues`` (every queue when empty).
+
+    A running task's ``run_after`` is its lease expiry. Tasks whose worker
+    died mid-run are claimed again once it passes, counting the lost run
+    as an attempt.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        due = Task.objects.select_for_update(skip_locked=True).filter(
+            Q(status=Task.STATUS_QUEUED) | Q(status=Task.STATUS_RUNNING), run_after__lte=now
+        )
+        if queues:
+            due = due.filter(queue__in=queues)
+        tasks = list(due.order_by("run_after", "pk")[:limit])
+        lost = [task for task in tasks if task.status == Task.STATUS_RUNNING]
+        for task in lost:
+            task.attempts += 1
+            logger.warning("Task %s (%s) lost its worker on attempt %s", task.pk, task.path, task.attempts)
+        dead = {task.pk for task in lost if task.attempts >= task.max_attempts}
+        Task.objects.filter(pk__in=[task.pk for task in lost]).update(attempts=F("attempts") + 1)
+        Task.objects.filter(pk__in=dead).update(status=Task.STATUS_FAILED, error="The worker stopped during the task.")
+        tasks = [task for task in tasks if task.pk not in dead]
+        Task.objects.filter(pk__in=[task.pk for task in tasks]).update(
+            status=Task.STATUS_RUNNING, run_after=now + timedelta(seconds=LEASE_SECONDS)
+        )
+    return tasks
+
+
+def run(task):
+    close_old_connections()
+    attempts = task.attempts + 1
+    try:
+        import_string(task.path)(*task.args)
+    except Exception:
+        logger.exception("Task %s (%s) failed on attempt %s", task.pk, task.path, attempts)
+        if attempts < task.max_attempts:
+            status, run_after = Task.STATUS_QUEUED, timezone.now() + timedelta(seconds=RETRY_DELAY * 2 ** attempts)
+        else:
+            status, run_after = Task.STATUS_FAILED, task.run_after
+        Task.objects.filter(pk=task.pk).update(
+            status=status, attempts=attempts, run_after=run_after, error=traceback.format_exc()
+        )
+    else:
+        Task.objects.filter(pk=task.pk).update(status=Task.STATUS_DONE, attempts=attempts, error="")
+    finally:
+        close_old_connections()
+
+
+class Worker:
+    """Polls ``queues`` (every queue when empty) and runs at most ``concurrency`` tasks at a time."""
+
+    def __init__(self, queues, concurrency):
+        self.queues = list(queues or [])
+        self.concurrency = concurrency
+        self.executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="tasks")
+        self.running = {}
+        self.renewed = time.monotonic()
+
+    def renew_leases(self):
+        """Heartbeat: push the lease of every task still running here another LEASE_SECONDS out."""
+        if self.running and time.monotonic() - self.renewed >= LEASE_SECONDS / 3:
+            Task.objects.filter(pk__in=self.running.values(), status=Task.STATUS_RUNNING).update(
+                run_after=timezone.now() + timedelta(seconds=LEASE_SECONDS)
+            )
+            self.renewed = time.monotonic()
+
+    def poll(self):
+        self.running = {future: pk for future, pk in self.running.items() if not future.done()}
+        self.renew_leases()
+        free = self.concurrency - len(self.running)
+        if free <= 0:
+            return 0
+        tasks = claim(self.queues, free)
+        for task in tasks:
+            self.running[self.executor.submit(run, task)] = task.pk
+        return len(tasks)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
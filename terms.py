@@ -0,0 +1,116 @@
+import difflib
+import gzip
+import hashlib
+import json
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.http import http_date, quote_etag
+
+from apps.lib.constants import USER_TYPE_ARTISTE, USER_TYPE_FAN
+from apps.lib.models import TermsAndConditions
+from profiles.models import TermsVersion
+from profiles.serializers import TermsAndConditionsSerializer
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+CHECK_INTERVAL = getattr(settings, "PROFILES_TERMS_CHECK_INTERVAL", 5)
+GENERATION_KEY = "profiles:terms:generation"
+
+
+class Entry:
+    """The active terms for one user type, rendered once with every encoding the clients accept."""
+
+    def __init__(self, user_type, terms):
+        self.user_type = user_type
+        self.body = terms.body if terms else None
+        self.version = hashlib.sha256((self.body or "").encode()).hexdigest()[:16] if terms else None
+        self.etag = quote_etag(self.version or "none")
+        self.last_modified = terms.updated_datetime if terms else None
+        if terms:
+            payload = {**TermsAndConditionsSerializer(terms).data, "version": self.version}
+        else:
+            payload = {"data": None, "version": None}
+        self.content = {"identity": json.dumps(payload, cls=DjangoJSONEncoder).encode()}
+        self.content["gzip"] = gzip.compress(self.content["identity"], mtime=0)
+        if brotli is not None:
+            self.content["br"] = brotli.compress(self.content["identity"])
+
+    def encoded(self, accept_encoding):
+        """Return ``(encoding, bytes)`` for the best encoding in ``accept_encoding``."""
+        accepted = {part.split(";")[0].strip() for part in (accept_encoding or "").split(",")}
+        for encoding in ("br", "gzip"):
+            if encoding in accepted and encoding in self.content:
+                return encoding, self.content[encoding]
+        return "identity", self.content["identity"]
+
+    @property
+    def last_modified_header(self):
+        return http_date(self.last_modified.timestamp()) if self.last_modified else None
+
+
+_lock = threading.Lock()
+_entries = {}
+_state = {"generation": None, "checked_at": 0.0}
+
+
+def user_type_for(user):
+    return USER_TYPE_ARTISTE if user.user_type == "artist" else USER_TYPE_FAN
+
+
+def _load(user_type):
+    terms = (
+        TermsAndConditions.objects.filter(is_active=True, user_type=user_type).order_by("-updated_datetime").first()
+    )
+    entry = Entry(user_type, terms)
+    if entry.version:
+        TermsVersion.objects.get_or_create(
+            user_type=user_type, version=entry.version, defaults={"body": entry.body}
+        )
+    return entry
+
+
+def _check_generation():
+    now = time.monotonic()
+    if now - _state["checked_at"] < CHECK_INTERVAL:
+        return
+    _state["checked_at"] = now
+    generation = cache.get(GENERATION_KEY)
+    if generation != _state["generation"]:
+        _entries.clear()
+        _state["generation"] = generation
+
+
+def get(user_type):
+    """The cached entry for ``user_type``, reloading after any process saved a TermsAndConditions."""
+    with _lock:
+        _check_generation()
+        entry = _entries.get(user_type)
+        if entry is None:
+            entry = _entries[user_type] = _load(user_type)
+        return entry
+
+
+def invalidate():
+    with _lock:
+        _entries.clear()
+        _state["generation"] = time.time_ns()
+        _state["checked_at"] = time.monotonic()
+    cache.set(GENERATION_KEY, _state["generation"], None)
+
+
+def diff(entry, since):
+    """Unified diff from version ``since`` to ``entry``, or ``None`` when that version is unknown."""
+    old = TermsVersion.objects.filter(user_type=entry.user_type, version=since).values_list("body", flat=True).first()
+    if old is None:
+        return None
+    lines = difflib.unified_diff(
+        old.splitlines(keepends=True), entry.body.splitlines(keepends=True), fromfile=since, tofile=entry.version
+    )
+    return "".join(lines)
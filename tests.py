@@ -1,3 +1,1113 @@
-from django.test import TestCase
+import gzip
+import io
+import json
+import math
+import re
+import shutil
+import tempfile
+import threading
+from datetime import datetime, timedelta, timezone as dt_timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock, skipIf
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.contrib import admin, messages
+from django.contrib.auth import get_user_model
+from django.core import signing
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.db import DatabaseError, connection, transaction
+from django.http import Http404, HttpResponse
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+from PIL import Image
+from rest_framework.exceptions import ValidationError
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from apps.artiste.models import Artiste, AudioMedia, Links
+from apps.lib.constants import USER_TYPE_FAN
+from apps.lib.models import TermsAndConditions
+from profiles import (
+    admin as profiles_admin,
+    artiste_links,
+    async_views,
+    catalogue,
+    deletion,
+    images,
+    ingest,
+    instrumentation,
+    plays,
+    profile_cache,
+    ranking,
+    reactions,
+    replicas,
+    rollups,
+    search,
+    serializers,
+    streaming,
+    suggest,
+    tasks,
+    terms,
+    uploads,
+    views,
+)
+from profiles.models import (
+    EngagementBucket,
+    ItemNeighbour,
+    LeaderboardEntry,
+    Media,
+    MediaComment,
+    Profile,
+    Reaction,
+    SearchDocument,
+    SongRanking,
+    Task,
+    TrendingScore,
+    UploadSession,
+    UserLikeDislikeCount,
+    VerificationRequests,
+)
+from profiles.pagination import EstimatedCountPaginator, KeysetPagination
+from profiles.storage_backends import MediaStorage
+from users.constants import ACCOUNT_TYPE_ARTISTE, ACCOUNT_TYPE_FAN, VERIFICATION_APPROVED, VERIFICATION_PENDING
+from users.models import Fan as FanAccount
+
+try:
+    from moto import mock_aws
+except ImportError:  # pragma: no cover
+    mock_aws = None
+
+User = get_user_model()
+
+Follow = Artiste.followers.field.model
+
+
+def follow(artiste, user):
+    """A follow of ``artiste`` by ``user``, whether the follow model points at the user or at their Fan profile."""
+    field = profile_cache.follower_field()
+    follower = user if field.related_model is User else FanAccount.objects.get_or_create(user=user)[0]
+    return Follow.objects.create(**{Artiste.followers.field.name: artiste, field.name: follower})
+
+
+class MediaListQueryCountTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.fan = User.objects.create_user(email="fan@example.com", password="password")
+        cls.artist = User.objects.create_user(email="artist@example.com", password="password")
+        Profile.objects.create(user=cls.fan)
+        Profile.objects.create(user=cls.artist, stage_name="Artist")
+
+    def add_songs(self, count):
+        for i in range(count):
+            media = Media.objects.create(owner=self.artist, file=f"songs/{i}.mp3", song_name=f"Song {i}")
+            media.likes.add(self.fan)
+            media.dislikes.add(self.artist)
+            MediaComment.objects.create(media=media, commenter=self.fan, body="Nice")
+            MediaComment.objects.create(media=media, commenter=self.artist, body="Thanks")
+
+    def get(self, view_class):
+        request = APIRequestFactory().get("/")
+        force_authenticate(request, user=self.fan)
+        response = view_class.as_view()(request)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def assertConstantQueries(self, view_class):
+        self.add_songs(2)
+        with CaptureQueriesContext(connection) as small_page:
+            self.get(view_class)
+        self.add_songs(8)
+        with self.assertNumQueries(len(small_page)):
+            self.get(view_class)
+
+    def test_liked_songs_query_count_is_constant(self):
+        self.assertConstantQueries(views.LikedSongsListView)
+
+    def test_trending_songs_query_count_is_constant(self):
+        self.assertConstantQueries(views.TrendingSongView)
+
+
+class FollowedArtistsQueryCountTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.fan = User.objects.create_user(email="fan@example.com", password="password")
+        # not followed, so never listed
+        other = User.objects.create_user(email="other@example.com", password="password")
+        Artiste.objects.create(user=other, stage_name="Other")
+
+    def follow(self, count):
+        for i in range(Artiste.objects.count(), Artiste.objects.count() + count):
+            user = User.objects.create_user(email=f"artist{i}@example.com", password="password")
+            artiste = Artiste.objects.create(user=user, stage_name=f"Band {i}")
+            AudioMedia.objects.create(artiste=artiste, title=f"Song {i}")
+            follow(artiste, self.fan)
+
+    def get(self):
+        request = APIRequestFactory().get("/")
+        force_authenticate(request, user=self.fan)
+        response = views.FollowedArtistsView.as_view()(request)
+        self.assertEqual(response.status_code, 200)
+        return response.data["results"]
+
+    def test_followed_artists_query_count_is_constant(self):
+        self.follow(2)
+        with CaptureQueriesContext(connection) as small_page:
+            self.get()
+        self.follow(8)
+        with self.assertNumQueries(len(small_page)):
+            self.assertEqual(len(self.get()), 10)
+
+
+@mock.patch.object(serializers, "FOLLOWED_PREVIEW", 3)
+class FollowedPreviewTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.fan = User.objects.create_user(email="fan@example.com", password="password", account_type=ACCOUNT_TYPE_FAN)
+        Profile.objects.create(user=cls.fan)
+        cls.artistes = []
+        for i in range(5):
+            user = User.objects.create_user(email=f"artist{i}@example.com", password="password")
+            cls.artistes.append(Artiste.objects.create(user=user, stage_name=f"Band {i}"))
+            follow(cls.artistes[-1], cls.fan)
+
+    def setUp(self):
+        profile_cache.get_cache().clear()
+
+    def get(self, view, query=""):
+        request = APIRequestFactory().get(f"/?{query}")
+        force_authenticate(request, user=self.fan)
+        response = view.as_view()(request)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_preview_is_capped_and_compact(self):
+        data = self.get(views.UserProfileView)
+        self.assertEqual([row["id"] for row in data["artiste_followed"]], [a.pk for a in self.artistes[:3]])
+        self.assertEqual(
+            data["artiste_followed"][0],
+            {"id": self.artistes[0].pk, "stage_name": "Band 0", "thumbnail": None, "followers_count": 1},
+        )
+
+    def test_next_cursor_continues_on_the_followed_artists_view(self):
+        data = self.get(views.UserProfileView)
+        query = data["artiste_followed_next"].split("?", 1)[1]
+        rest = self.get(views.FollowedArtistsView, query)
+        self.assertEqual([row["id"] for row in rest["results"]], [a.pk for a in self.artistes[3:]])
+        self.assertIsNone(rest["next"])
+
+    def test_no_cursor_when_everything_fits(self):
+        Follow.objects.filter(**{Artiste.followers.field.name: self.artistes[0]}).delete()
+        Follow.objects.filter(**{Artiste.followers.field.name: self.artistes[1]}).delete()
+        data = self.get(views.UserProfileView)
+        self.assertEqual(len(data["artiste_followed"]), 3)
+        self.assertIsNone(data["artiste_followed_next"])
+
+    def test_expand_embeds_the_full_artiste(self):
+        data = self.get(views.UserProfileView, "expand=artiste_followed")
+        self.assertEqual(len(data["artiste_followed"]), 3)
+        self.assertNotIn("thumbnail", data["artiste_followed"][0])
+        self.assertEqual(data["artiste_followed"][0]["stage_name"], "Band 0")
+
+
+class MediaCommentPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.fan = User.objects.create_user(email="fan@example.com", password="password")
+        Profile.objects.create(user=cls.fan)
+        cls.media = Media.objects.create(owner=cls.fan, file="songs/0.mp3", song_name="Song")
+        cls.comments = [
+            MediaComment.objects.create(media=cls.media, commenter=cls.fan, body=f"Comment {i}") for i in range(5)
+        ]
+
+    def get(self, url):
+        request = APIRequestFactory().get(url)
+        force_authenticate(request, user=self.fan)
+        response = views.MediaCommentListView.as_view()(request, uid=self.media.uid)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_cursor_survives_inserts(self):
+        first = self.get("/?page_size=2")
+        self.assertNotIn("count", first)
+        MediaComment.objects.create(media=self.media, commenter=self.fan, body="Late comment")
+        second = self.get(first["next"])
+        third = self.get(second["next"])
+        bodies = [comment["body"] for page in (first, second, third) for comment in page["results"]]
+        self.assertEqual(bodies, [f"Comment {i}" for i in range(4, -1, -1)])
+        self.assertIsNone(third["next"])
+        previous = self.get(second["previous"])
+        self.assertEqual(previous["results"], first["results"])
+
+    def test_count_is_opt_in(self):
+        self.assertEqual(self.get("/?count=1")["count"], 5)
+
+    def test_tampered_cursor_is_not_found(self):
+        for key in (["not-a-pk"], [{"pk": 1}], [1, 2]):
+            request = APIRequestFactory().get("/", {"cursor": KeysetPagination().encode_cursor(key, False)})
+            force_authenticate(request, user=self.fan)
+            response = views.MediaCommentListView.as_view()(request, uid=self.media.uid)
+            self.assertEqual(response.status_code, 404)
+
+
+@mock.patch.object(tasks, "BROKER", tasks.BROKER_INLINE)
+class ProfileCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.fan = User.objects.create_user(email="fan@example.com", password="password", account_type=ACCOUNT_TYPE_FAN)
+        cls.band = User.objects.create_user(
+            email="band@example.com", password="password", account_type=ACCOUNT_TYPE_ARTISTE
+        )
+        for user in (cls.fan, cls.band):
+            Profile.objects.create(user=user)
+            FanAccount.objects.create(user=user)
+        cls.artiste = Artiste.objects.create(user=cls.band, stage_name="Band")
+        cls.follow = follow(cls.artiste, cls.fan)
+
+    def setUp(self):
+        profile_cache.get_cache().clear()
+
+    def get(self, user, etag=None):
+        headers = {"HTTP_IF_NONE_MATCH": etag} if etag else {}
+        request = APIRequestFactory().get("/", **headers)
+        force_authenticate(request, user=user)
+        return views.UserProfileView.as_view()(request)
+
+    def assertRebuilds(self, user, change):
+        self.get(user)
+        with self.captureOnCommitCallbacks(execute=True):
+            change()
+        with CaptureQueriesContext(connection) as queries:
+            self.get(user)
+        self.assertTrue(queries, "the cached profile survived the change")
+
+    def test_etag_answers_not_modified_from_the_cache(self):
+        first = self.get(self.fan)
+        self.assertEqual(first.status_code, 200)
+        with self.assertNumQueries(0):
+            second = self.get(self.fan, etag=first["ETag"])
+        self.assertEqual((second.status_code, second["ETag"]), (304, first["ETag"]))
+        self.assertEqual(self.get(self.fan, etag='"stale"').status_code, 200)
+
+    def test_profile_and_fan_changes_invalidate(self):
+        self.assertRebuilds(self.fan, lambda: Profile.objects.get(user=self.fan).save())
+        self.assertRebuilds(self.fan, lambda: FanAccount.objects.get(user=self.fan).save())
+
+    def test_artiste_and_link_changes_reach_followers(self):
+        self.assertRebuilds(self.fan, lambda: Artiste.objects.get(pk=self.artiste.pk).save())
+        self.assertRebuilds(
+            self.band,
+            lambda: Links.objects.create(artiste=self.artiste, link_type="spotify", link_url="https://example.com"),
+        )
+
+    def test_follow_changes_invalidate_both_sides(self):
+        for user in (self.fan, self.band):
+            self.assertRebuilds(user, lambda: Follow.objects.filter(pk=self.follow.pk).first().delete())
+            self.follow = follow(self.artiste, self.fan)
+
+
+class TermsDeliveryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.fan = User.objects.create_user(email="fan@example.com", password="password")
+        cls.terms = TermsAndConditions.objects.create(
+            body="Line one\nLine two\n", is_active=True, user_type=USER_TYPE_FAN
+        )
+
+    def setUp(self):
+        terms.invalidate()
+
+    def get(self, since=None, **headers):
+        request = APIRequestFactory().get("/", {"since": since} if since else {}, **headers)
+        force_authenticate(request, user=self.fan)
+        return views.TermsAndConditionsAPIView.as_view()(request)
+
+    def test_etag_and_since_answer_not_modified(self):
+        first = self.get()
+        self.assertEqual(first.status_code, 200)
+        version = json.loads(first.content)["version"]
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get(HTTP_IF_NONE_MATCH=first["ETag"]).status_code, 304)
+            self.assertEqual(self.get(since=version).status_code, 304)
+
+    def test_since_an_older_version_gets_a_diff(self):
+        old = json.loads(self.get().content)["version"]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.terms.body = "Line one\nLine three\n"
+            self.terms.save()
+        response = self.get(since=old)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.data["version"], old)
+        self.assertIn("-Line two\n", response.data["diff"])
+        self.assertIn("+Line three\n", response.data["diff"])
+        # a version the server never served can't be diffed against, so the client gets the whole body
+        self.assertEqual(json.loads(self.get(since="unknown").content)["version"], response.data["version"])
+
+    def test_gzip_body_is_precompressed(self):
+        response = self.get(HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        identity = self.get()
+        self.assertNotIn("Content-Encoding", identity)
+        self.assertEqual(json.loads(gzip.decompress(response.content)), json.loads(identity.content))
+
+
+@mock.patch.object(async_views, "PARALLEL_QUERIES", False)
+class AsyncViewTests(TestCase):
+    """The async views answer exactly what their sync counterparts do."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.fan = User.objects.create_user(email="fan@example.com", password="password")
+        Profile.objects.create(user=cls.fan)
+        artiste = Artiste.objects.create(user=cls.fan, stage_name="Band")
+        for i, score in enumerate((1, 3, 2)):
+            media = Media.objects.create(owner=cls.fan, file=f"songs/{i}.mp3", song_name=f"Song {i}")
+            TrendingScore.objects.create(
+                kind=EngagementBucket.KIND_MEDIA, window="week", object_id=media.pk, score=score
+            )
+            song = AudioMedia.objects.create(artiste=artiste, title=f"Song {i}")
+            SongRanking.objects.update_or_create(song=song, defaults={"likes_count": score})
+        ranking.refresh_all_boards()
+
+    def call(self, view, **params):
+        request = APIRequestFactory().get("/", params)
+        with mock.patch.object(async_views, "_user", return_value=self.fan):
+            response = async_to_sync(view.as_view())(request)
+        return response.status_code, json.loads(response.content)
+
+    def call_sync(self, view, **params):
+        request = APIRequestFactory().get("/", params)
+        force_authenticate(request, user=self.fan)
+        response = view.as_view()(request)
+        return response.status_code, json.loads(json.dumps(response.data, cls=DjangoJSONEncoder))
+
+    def test_trending_matches_the_sync_view(self):
+        status_code, data = self.call(async_views.AsyncTrendingSongView, window="week")
+        self.assertEqual([row["song_name"] for row in data["results"]], ["Song 1", "Song 2", "Song 0"])
+        self.assertEqual((status_code, data), self.call_sync(views.TrendingSongView, window="week"))
+        self.assertEqual(self.call(async_views.AsyncTrendingSongView, window="decade")[0], 400)
+
+    def test_suggestions_match_the_sync_view(self):
+        status_code, data = self.call(async_views.AsyncSuggestionView)
+        self.assertEqual(len(data["most_liked_songs"]), 3)
+        self.assertEqual((status_code, data), self.call_sync(views.SuggestionView))
+
+    def test_search_returns_both_kinds(self):
+        search.rebuild()
+        status_code, data = self.call(async_views.AsyncSearchAPIView, search="song")
+        self.assertEqual(status_code, 200)
+        self.assertEqual(len(data["songs"]), 3)
+        self.assertEqual(self.call(async_views.AsyncSearchAPIView)[0], 400)
+
+    def test_anonymous_requests_are_refused(self):
+        response = async_to_sync(async_views.AsyncSuggestionView.as_view())(APIRequestFactory().get("/"))
+        self.assertIn(response.status_code, (401, 403))
+
+
+class RecommendationPageTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.fan = User.objects.create_user(email="fan@example.com", password="password")
+        Profile.objects.create(user=cls.fan)
+        cls.songs = [
+            Media.objects.create(owner=cls.fan, file=f"songs/{i}.mp3", song_name=f"Song {i}") for i in range(5)
+        ]
+
+    def get(self):
+        request = APIRequestFactory().get("/")
+        force_authenticate(request, user=self.fan)
+        response = views.MoreOfWhatYouLikeViewset.as_view({"get": "list"})(request)
+        self.assertEqual(response.status_code, 200)
+        return [song["song_name"] for song in response.data["results"]]
+
+    def test_without_likes_everything_is_served_newest_first(self):
+        self.assertEqual(self.get(), [song.song_name for song in reversed(self.songs)])
+
+    def test_only_recommendations_are_served_in_rank_order(self):
+        liked, weak, strong = self.songs[0], self.songs[1], self.songs[2]
+        liked.likes.add(self.fan)
+        ItemNeighbour.objects.create(item_id=liked.pk, neighbour_id=weak.pk, score=0.2)
+        ItemNeighbour.objects.create(item_id=liked.pk, neighbour_id=strong.pk, score=0.9)
+        self.assertEqual(self.get(), [strong.song_name, weak.song_name])
+
+
+class PlayFlushTests(SimpleTestCase):
+    def events(self, *sessions):
+        return [
+            {"user": 1, "media": "m", "session": session, "played_at": "2026-01-01T00:00:00+00:00", "duration_ms": 0}
+            for session in sessions
+        ]
+
+    def test_failed_write_puts_the_batch_back(self):
+        buffer = plays.MemoryBuffer(maxsize=3)
+        buffer.offer(self.events("a", "b", "c"))
+        with mock.patch.object(plays, "_write", side_effect=DatabaseError), self.assertRaises(DatabaseError):
+            plays.flush(buffer, limit=2)
+        self.assertEqual([event["session"] for event in buffer.take(3)], ["a", "b", "c"])
+
+    def test_batch_that_no_longer_fits_is_dropped(self):
+        buffer = plays.MemoryBuffer(maxsize=2)
+        buffer.offer(self.events("a", "b"))
+        taken = buffer.take(2)
+        buffer.offer(self.events("c"))
+        self.assertEqual(buffer.requeue(taken), 1)
+        self.assertEqual([event["session"] for event in buffer.take(2)], ["a", "c"])
+        # the dropped event is forgotten, so the client's retry is accepted
+        self.assertEqual(buffer.offer(self.events("b")), (1, 0, 0))
+
+    def test_offer_dedupes_and_drops_past_maxsize(self):
+        buffer = plays.MemoryBuffer(maxsize=2)
+        self.assertEqual(buffer.offer(self.events("a", "a", "b", "c")), (2, 1, 1))
+        self.assertEqual(buffer.depth(), 2)
+        # still a duplicate once written: the seen keys outlive the queue
+        buffer.take(2)
+        self.assertEqual(buffer.offer(self.events("a", "c")), (1, 1, 0))
+
+
+class RangeParsingTests(SimpleTestCase):
+    def test_single_ranges(self):
+        self.assertEqual(streaming.parse_range("bytes=0-99", 1000), (0, 99))
+        self.assertEqual(streaming.parse_range("bytes=900-", 1000), (900, 999))
+        # an end past the last byte is clamped to it
+        self.assertEqual(streaming.parse_range("bytes=900-5000", 1000), (900, 999))
+
+    def test_suffix_ranges(self):
+        self.assertEqual(streaming.parse_range("bytes=-100", 1000), (900, 999))
+        self.assertEqual(streaming.parse_range("bytes=-5000", 1000), (0, 999))
+        self.assertIs(streaming.parse_range("bytes=-0", 1000), False)
+
+    def test_unsatisfiable_ranges(self):
+        self.assertIs(streaming.parse_range("bytes=1000-", 1000), False)
+        self.assertIs(streaming.parse_range("bytes=500-100", 1000), False)
+
+    def test_multiple_or_malformed_ranges_serve_the_whole_file(self):
+        self.assertIsNone(streaming.parse_range("bytes=0-99,200-299", 1000))
+        self.assertIsNone(streaming.parse_range("bytes=-", 1000))
+        self.assertIsNone(streaming.parse_range("items=0-99", 1000))
+        self.assertIsNone(streaming.parse_range(None, 1000))
+
+    def test_missing_file_is_not_found(self):
+        storage = FileSystemStorage(location=tempfile.gettempdir())
+        field_file = mock.Mock(storage=storage)
+        field_file.name = "songs/gone.mp3"
+        with self.assertRaises(Http404):
+            streaming.stream_file(APIRequestFactory().get("/"), field_file)
+
+
+class _RangeHandler(BaseHTTPRequestHandler):
+    body = bytes(range(256)) * 40
+
+    def do_GET(self):
+        self.server.requests += 1
+        match = re.fullmatch(r"bytes=(\d+)-(\d+)", self.headers.get("Range", ""))
+        if not self.server.ranges or match is None:
+            self.send_response(200)
+            body = self.body
+        else:
+            start, end = int(match[1]), min(int(match[2]), len(self.body) - 1)
+            if start >= len(self.body):
+                self.send_response(416)
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{len(self.body)}")
+            body = self.body[start : end + 1]
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class RangeFileTests(SimpleTestCase):
+    def open(self, ranges):
+        server = ThreadingHTTPServer(("127.0.0.1", 0), _RangeHandler)
+        server.ranges, server.requests = ranges, 0
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        remote = ingest.RangeFile(f"http://127.0.0.1:{server.server_port}/song.mp3")
+        remote.block_size = 1024
+        return server, remote
+
+    def assertReads(self, remote):
+        body = _RangeHandler.body
+        self.assertEqual(remote.seek(0, io.SEEK_END), len(body))
+        # at the end, on a block boundary: nothing is requested past it
+        self.assertEqual(remote.read(10), b"")
+        remote.seek(1020)
+        self.assertEqual(remote.read(10), body[1020:1030])
+        remote.seek(-4, io.SEEK_END)
+        self.assertEqual(remote.read(10), body[-4:])
+
+    def test_fetches_only_the_blocks_read(self):
+        server, remote = self.open(ranges=True)
+        self.assertReads(remote)
+        self.assertEqual(server.requests, 3)
+
+    def test_whole_body_response_is_kept(self):
+        server, remote = self.open(ranges=False)
+        self.assertReads(remote)
+        self.assertEqual(server.requests, 1)
+
+
+@skipIf(not images.FORMATS, "Pillow was built without WebP or AVIF support")
+class ImageDerivativeTests(SimpleTestCase):
+    def setUp(self):
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location)
+        self.storage = FileSystemStorage(location=location)
+        source = io.BytesIO()
+        Image.new("RGB", (800, 400), "red").save(source, "PNG")
+        self.field_file = mock.Mock(storage=self.storage)
+        self.field_file.name = self.storage.save("covers/cover.png", ContentFile(source.getvalue()))
+        patcher = mock.patch.object(images, "CACHE_DIR", f"{location}/cache")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def get(self, token):
+        with mock.patch.object(views, "default_storage", self.storage):
+            return views.ImageDerivativeView.as_view()(APIRequestFactory().get("/"), token=token)
+
+    def width(self, content):
+        return Image.open(io.BytesIO(content)).width
+
+    def test_generate_writes_the_smaller_widths(self):
+        variants = images.generate(self.field_file)
+        self.assertEqual(variants["src"], self.field_file.name)
+        for fmt in images.FORMATS:
+            self.assertEqual(list(variants[fmt]), [str(width) for width in images.WIDTHS if width < 800])
+            for width, name in variants[fmt].items():
+                with self.storage.open(name) as f:
+                    self.assertEqual(self.width(f.read()), int(width))
+
+    def test_lazy_endpoint_renders_once_then_serves_the_cache(self):
+        fmt = images.FORMATS[0]
+        token = images.lazy_url(self.field_file.name, 320, fmt).rstrip("/").rsplit("/", 1)[1]
+        response = self.get(token)
+        self.assertEqual((response.status_code, response["Content-Type"]), (200, images.CONTENT_TYPES[fmt]))
+        self.assertIn("immutable", response["Cache-Control"])
+        self.assertEqual(self.width(b"".join(response.streaming_content)), 320)
+        response.close()
+        with mock.patch.object(images, "open_source", side_effect=AssertionError("rendered twice")):
+            response = self.get(token)
+            self.assertEqual(response.status_code, 200)
+            response.close()
+
+    def test_tampered_or_unsupported_tokens_are_not_found(self):
+        fmt = images.FORMATS[0]
+        token = images.lazy_url(self.field_file.name, 320, fmt).rstrip("/").rsplit("/", 1)[1]
+        self.assertEqual(self.get(token[:-2]).status_code, 404)
+        odd_width = signing.dumps({"n": self.field_file.name, "w": 333, "f": fmt}, salt=images._SALT, compress=True)
+        self.assertEqual(self.get(odd_width).status_code, 404)
+
+
+class UploadTypeTests(SimpleTestCase):
+    def errors(self, kind, filename, content_type):
+        data = {"kind": kind, "filename": filename, "size": 10, "content_type": content_type, "song_name": "Song"}
+        serializer = serializers.UploadSessionCreateSerializer(data=data)
+        serializer.is_valid()
+        return set(serializer.errors)
+
+    def test_kind_decides_the_accepted_types(self):
+        self.assertEqual(self.errors(UploadSession.KIND_MEDIA, "song.mp3", "audio/mpeg"), set())
+        self.assertEqual(self.errors(UploadSession.KIND_PROFILE_PICTURE, "me.PNG", "Image/PNG; charset=binary"), set())
+        self.assertEqual(
+            self.errors(UploadSession.KIND_PROFILE_PICTURE, "me.mp3", "audio/mpeg"), {"content_type", "filename"}
+        )
+
+    def test_extension_must_agree_with_the_kind(self):
+        self.assertEqual(self.errors(UploadSession.KIND_MEDIA, "song.png", "audio/mpeg"), {"filename"})
+
+
+@skipIf(mock_aws is None, "moto is not installed")
+class UploadSessionTests(TestCase):
+    bucket = "profiles-uploads"
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email="uploader@example.com", password="password")
+
+    def setUp(self):
+        aws = mock_aws()
+        aws.start()
+        self.addCleanup(aws.stop)
+        self.storage = MediaStorage(
+            bucket_name=self.bucket, access_key="testing", secret_key="testing", region_name="us-east-1"
+        )
+        self.storage.client.create_bucket(Bucket=self.bucket)
+        patcher = mock.patch.object(uploads, "get_storage", return_value=self.storage)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        # two parts: a full one and a single byte
+        self.session = uploads.start(
+            self.user, UploadSession.KIND_MEDIA, "song.mp3", uploads.PART_SIZE + 1, "audio/mpeg", {"song_name": "Song"}
+        )
+
+    def upload(self, number):
+        self.storage.client.upload_part(
+            Bucket=self.bucket,
+            Key=self.storage._key(self.session.name),
+            UploadId=self.session.upload_id,
+            PartNumber=number,
+            Body=b"\0" * (self.session.part_size if number == 1 else 1),
+        )
+
+    def test_resume_offers_only_the_missing_parts(self):
+        state = uploads.state(self.session)
+        self.assertEqual((state["uploaded_parts"], sorted(state["part_urls"])), ([], [1, 2]))
+        self.upload(1)
+        state = uploads.state(self.session)
+        self.assertEqual((state["uploaded_parts"], sorted(state["part_urls"])), ([1], [2]))
+
+    def test_complete_with_a_missing_part_reopens_the_session(self):
+        self.upload(1)
+        with self.assertRaises(ValidationError) as raised:
+            uploads.complete(self.session)
+        self.assertEqual(raised.exception.detail["missing_parts"], ["2"])
+        self.session.refresh_from_db()
+        self.assertEqual(self.session.status, UploadSession.STATUS_OPEN)
+
+    def test_complete_assembles_the_object_once(self):
+        self.upload(1)
+        self.upload(2)
+        session = uploads.complete(self.session)
+        self.assertEqual(session.status, UploadSession.STATUS_COMPLETED)
+        self.assertEqual(session.media.file.name, session.name)
+        self.assertEqual(self.storage.size(session.name), session.size)
+        with self.assertRaises(ValidationError):
+            uploads.complete(session)
+
+    def test_abort_discards_the_parts(self):
+        self.upload(1)
+        uploads.abort(self.session)
+        self.assertEqual(self.session.status, UploadSession.STATUS_ABORTED)
+        self.assertEqual(self.storage.client.list_multipart_uploads(Bucket=self.bucket).get("Uploads", []), [])
+
+
+class QuerySignatureTests(SimpleTestCase):
+    def test_n_plus_one_queries_share_a_signature(self):
+        stats = instrumentation.Stats()
+        for pk in range(3):
+            stats.add_query(f'SELECT "name" FROM "artiste" WHERE "id" = {pk}', 0.001)
+        stats.add_query('SELECT "id" FROM "media" WHERE "id" IN (%s, %s, %s)', 0.001)
+        stats.add_query('SELECT "id" FROM "media" WHERE "id" IN (%s, %s)', 0.001)
+        self.assertEqual(stats.duplicates(), [('SELECT "name" FROM "artiste" WHERE "id" = ?', 3)])
+        self.assertEqual(stats.signatures['SELECT "id" FROM "media" WHERE "id" IN (%s, ...)'], 2)
+
+
+@instrumentation.query_budget(1)
+def _two_queries(request):
+    Media.objects.count()
+    Media.objects.count()
+    return HttpResponse()
+
+
+class QueryBudgetTests(TestCase):
+    def test_exceeded_budget_raises_under_tests(self):
+        with self.assertRaises(instrumentation.QueryBudgetExceeded):
+            _two_queries(APIRequestFactory().get("/"))
+
+    @override_settings(PROFILES_QUERY_BUDGET_STRICT=False)
+    def test_exceeded_budget_passes_when_not_strict(self):
+        self.assertEqual(_two_queries(APIRequestFactory().get("/")).status_code, 200)
+
+
+class IndexUsageTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email="fan@example.com", password="password")
+        cls.media = Media.objects.create(owner=cls.user, file="songs/0.mp3", song_name="Song")
+
+    def assertUsesIndex(self, queryset, index=None):
+        if connection.vendor == "postgresql":
+            with connection.cursor() as cursor:
+                # tiny test tables would otherwise always be scanned sequentially
+                cursor.execute("SET LOCAL enable_seqscan = off")
+            plan = queryset.explain()
+            self.assertNotIn("Seq Scan", plan)
+        else:
+            plan = queryset.explain()
+            self.assertRegex(plan, r"SEARCH \S+ USING (COVERING )?INDEX")
+        if index:
+            self.assertIn(index, plan)
+
+    def test_comment_page_uses_an_index(self):
+        self.assertUsesIndex(MediaComment.objects.filter(media=self.media).order_by("-id")[:20])
+
+    def test_uploads_by_owner_use_an_index(self):
+        self.assertUsesIndex(Media.objects.filter(owner=self.user).order_by("-id")[:20])
+
+    def test_daily_like_counter_lookup_uses_composite_index(self):
+        counters = UserLikeDislikeCount.objects.filter(user=self.user, song=self.media, created=timezone.now().date())
+        self.assertUsesIndex(counters, "likecount_user_song_day_idx")
+
+    @skipIf(connection.vendor != "postgresql", "the trigram index is PostgreSQL-only")
+    def test_song_name_search_uses_trigram_index(self):
+        self.assertUsesIndex(Media.objects.filter(song_name__icontains="son"), "media_song_name_trgm_idx")
+
+    def test_artist_filter_uses_user_type_index(self):
+        Artiste.objects.create(user=self.user, stage_name="Band")
+        self.assertUsesIndex(Artiste.objects.filter(user__user_type="artist"), "profiles_user_type_idx")
+
+
+class AccountDeletionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.fan = User.objects.create_user(email="fan@example.com", password="password")
+        cls.artist = User.objects.create_user(email="artist@example.com", password="password")
+        Profile.objects.create(user=cls.fan)
+        Profile.objects.create(user=cls.artist, stage_name="Artist")
+        cls.own = Media.objects.create(owner=cls.artist, file="songs/own.mp3", song_name="Own")
+        cls.other = Media.objects.create(owner=cls.fan, file="songs/other.mp3", song_name="Other")
+        cls.own.likes.add(cls.fan)
+        cls.other.likes.add(cls.artist)
+        Media.objects.filter(pk=cls.other.pk).update(likes_count=1)
+        MediaComment.objects.create(media=cls.own, commenter=cls.fan, body="Nice")
+        MediaComment.objects.create(media=cls.other, commenter=cls.artist, body="Thanks")
+        band = Artiste.objects.create(user=cls.fan, stage_name="Band")
+        cls.song = AudioMedia.objects.create(artiste=band, title="Hit")
+        SongRanking.objects.update_or_create(song=cls.song, defaults={"likes_count": 1})
+        cls.song.likes.through.objects.create(
+            **{
+                f"{AudioMedia.likes.field.m2m_field_name()}_id": cls.song.pk,
+                f"{AudioMedia.likes.field.m2m_reverse_field_name()}_id": cls.artist.pk,
+            }
+        )
+
+    def test_dry_run_deletes_nothing(self):
+        report = deletion.delete_account(self.artist.pk, dry_run=True)
+        self.assertEqual(report["profiles.Media"], 1)
+        self.assertEqual(report["profiles.MediaComment"], 2)
+        self.assertEqual(report["files"], 1)
+        self.assertTrue(User.objects.filter(pk=self.artist.pk).exists())
+
+    def test_deletes_the_account_graph_and_keeps_counters(self):
+        deletion.delete_account(self.artist.pk, batch_size=1)
+        self.assertFalse(User.objects.filter(pk=self.artist.pk).exists())
+        self.assertFalse(Media.objects.filter(pk=self.own.pk).exists())
+        self.assertEqual(MediaComment.objects.count(), 0)
+        other = Media.objects.get(pk=self.other.pk)
+        self.assertEqual(other.likes_count, 0)
+        self.assertFalse(other.likes.exists())
+        self.assertTrue(Profile.objects.filter(pk=self.fan.pk).exists())
+        self.assertEqual(SongRanking.objects.get(song=self.song).likes_count, 0)
+
+    def test_rerun_does_not_uncount_twice(self):
+        deletion.delete_account(self.artist.pk)
+        Media.objects.filter(pk=self.other.pk).update(likes_count=1)
+        deletion.delete_account(self.artist.pk)
+        self.assertEqual(Media.objects.get(pk=self.other.pk).likes_count, 1)
+
+    def test_deleting_a_profile_goes_through_the_service(self):
+        Profile.objects.get(pk=self.artist.pk).delete()
+        self.assertFalse(User.objects.filter(pk=self.artist.pk).exists())
+        self.assertFalse(Media.objects.filter(pk=self.own.pk).exists())
+
+
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+class ReplicaRouterTests(TransactionTestCase):
+    # TestCase would wrap every test in a transaction, which pins reads to the primary
+    router = replicas.ReplicaRouter()
+
+    def test_reads_follow_the_request_replica(self):
+        self.assertEqual(self.router.db_for_read(Media), "default")
+        with replicas.reading("replica"):
+            self.assertEqual(self.router.db_for_read(Media), "replica")
+            self.assertEqual(self.router.db_for_write(Media), "default")
+
+    def test_reads_in_a_transaction_stay_on_the_primary(self):
+        with replicas.reading("replica"), transaction.atomic():
+            self.assertEqual(self.router.db_for_read(Media), "default")
+
+    def test_writes_make_the_user_sticky(self):
+        self.assertFalse(replicas.is_sticky(42))
+        replicas.mark_sticky(42)
+        self.assertTrue(replicas.is_sticky(42))
+
+
+class VerificationAdminTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        for i in range(5):
+            user = User.objects.create_user(email=f"artist{i}@example.com", password="password")
+            User.objects.filter(pk=user.pk).update(verification_status=VERIFICATION_PENDING)
+            Profile.objects.create(user=user)
+
+    def test_bulk_approve_is_one_update(self):
+        queryset = VerificationRequests.objects.filter(user__verification_status=VERIFICATION_PENDING)
+        with self.assertNumQueries(2):
+            updated = profiles_admin.set_verification_status(queryset, VERIFICATION_APPROVED)
+        self.assertEqual(updated, 5)
+        self.assertEqual(User.objects.filter(verification_status=VERIFICATION_APPROVED).count(), 5)
+
+    def test_small_changelists_are_counted_exactly(self):
+        self.assertEqual(EstimatedCountPaginator(Profile.objects.order_by("pk"), 2).count, 5)
+
+    def test_queue_rejects_invalid_selection(self):
+        model_admin = admin.site._registry[VerificationRequests]
+        request = APIRequestFactory().post("/", {"action": "approve", "selected": ["1", "not-a-pk"]})
+        request.user = User.objects.create_superuser(email="admin@example.com", password="password")
+        with mock.patch.object(model_admin, "message_user") as message_user:
+            response = model_admin.queue_view(request)
+        self.assertEqual(response.status_code, 302)
+        message_user.assert_called_once_with(request, "Invalid selection.", messages.ERROR)
+        self.assertFalse(User.objects.filter(verification_status=VERIFICATION_APPROVED).exists())
+
+
+class ReactionCounterTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.fan = User.objects.create_user(email="fan@example.com", password="password")
+        cls.media = Media.objects.create(owner=cls.fan, file="songs/0.mp3", song_name="Song")
+
+    def react(self, value):
+        reactions.react(self.fan, Reaction.KIND_MEDIA, self.media.pk, value)
+        return reactions.counts(Reaction.KIND_MEDIA, [self.media.pk])[self.media.pk]
+
+    def test_repeated_reaction_counts_once(self):
+        self.assertEqual(self.react(Reaction.LIKE), (1, 0))
+        self.assertEqual(self.react(Reaction.LIKE), (1, 0))
+        self.assertEqual(Reaction.objects.filter(user=self.fan).count(), 1)
+        self.assertEqual(list(self.media.likes.all()), [self.fan])
+
+    def test_like_dislike_none_transitions(self):
+        self.assertEqual(self.react(Reaction.LIKE), (1, 0))
+        self.assertEqual(self.react(Reaction.DISLIKE), (0, 1))
+        self.assertFalse(self.media.likes.exists())
+        self.assertEqual(list(self.media.dislikes.all()), [self.fan])
+        self.assertEqual(self.react(reactions.NONE), (0, 0))
+        self.assertFalse(Reaction.objects.filter(user=self.fan).exists())
+        self.assertFalse(self.media.dislikes.exists())
+
+    def test_legacy_like_is_not_counted_twice(self):
+        self.media.likes.add(self.fan)
+        self.assertTrue(reactions.backfill())
+        self.assertFalse(reactions.backfill())
+        self.assertEqual(reactions.counts(Reaction.KIND_MEDIA, [self.media.pk])[self.media.pk], (1, 0))
+        self.assertEqual(self.react(Reaction.LIKE), (1, 0))
+        self.assertEqual(self.react(reactions.NONE), (0, 0))
+
+    def test_legacy_like_without_reaction_row_toggles_off(self):
+        self.media.likes.add(self.fan)
+        Media.objects.filter(pk=self.media.pk).update(likes_count=1)
+        self.assertEqual(self.react(Reaction.LIKE), (1, 0))
+        self.assertEqual(self.react(Reaction.DISLIKE), (0, 1))
+        self.assertFalse(self.media.likes.exists())
+
+
+class RollupTests(TestCase):
+    now = datetime(2026, 3, 10, 12, tzinfo=dt_timezone.utc)
+
+    def bucket(self, object_id, start, granularity=EngagementBucket.HOUR, **counts):
+        return EngagementBucket.objects.create(
+            kind=EngagementBucket.KIND_MEDIA, object_id=object_id, granularity=granularity, start=start, **counts
+        )
+
+    def test_upsert_adds_onto_the_stored_bucket(self):
+        key = (EngagementBucket.KIND_MEDIA, 1, EngagementBucket.HOUR, rollups.hour_start(self.now))
+        rollups.upsert({key: {**dict.fromkeys(rollups.METRICS, 0), "likes": 1, "plays": 2}})
+        rollups.upsert({key: {**dict.fromkeys(rollups.METRICS, 0), "likes": 1, "plays": 2}})
+        bucket = EngagementBucket.objects.get()
+        self.assertEqual((bucket.likes, bucket.plays, bucket.comments), (2, 4, 0))
+
+    def test_compact_folds_old_hours_into_days(self):
+        old_day = rollups.day_start(self.now - timedelta(days=3))
+        self.bucket(1, old_day + timedelta(hours=1), likes=1)
+        self.bucket(1, old_day + timedelta(hours=5), likes=2, plays=1)
+        self.bucket(1, old_day, granularity=EngagementBucket.DAY, likes=10)
+        recent = self.bucket(1, rollups.hour_start(self.now - timedelta(hours=1)), likes=4)
+        self.assertEqual(rollups.compact(self.now), 2)
+        self.assertEqual(rollups.compact(self.now), 0)
+        day = EngagementBucket.objects.get(granularity=EngagementBucket.DAY)
+        self.assertEqual((day.start, day.likes, day.plays), (old_day, 13, 1))
+        self.assertEqual(list(EngagementBucket.objects.filter(granularity=EngagementBucket.HOUR)), [recent])
+
+    def test_scores_halve_every_half_life(self):
+        _, half_life = rollups.WINDOWS["week"]
+        self.bucket(1, self.now - timedelta(hours=1), likes=1)
+        self.bucket(2, self.now - timedelta(hours=1 + half_life), likes=1)
+        scores = rollups.scores(EngagementBucket.KIND_MEDIA, self.now)
+        self.assertAlmostEqual(scores["week"][1] / scores["week"][2], 2)
+        # the older bucket ended before the day window began
+        self.assertEqual(list(scores["day"]), [1])
+        rollups.refresh_trending(self.now)
+        self.assertEqual(rollups.trending_ids(EngagementBucket.KIND_MEDIA, "week"), [1, 2])
+
+
+class LeaderboardTests(TestCase):
+    board = LeaderboardEntry.BOARD_MOST_LIKED_SONGS
+
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user(email="artist@example.com", password="password")
+        artiste = Artiste.objects.create(user=user, stage_name="Band")
+        cls.songs = [AudioMedia.objects.create(artiste=artiste, title=f"Song {i}") for i in range(3)]
+        for i, song in enumerate(cls.songs):
+            SongRanking.objects.update_or_create(song=song, defaults={"likes_count": i + 1})
+
+    def setUp(self):
+        cache.delete(ranking._pending_key(self.board))
+
+    def test_rebuilding_twice_gives_the_same_board(self):
+        ranking.refresh_board(self.board)
+        ranking.refresh_board(self.board)
+        self.assertEqual(len(ranking.get_leaderboards()[self.board]), 3)
+
+    @mock.patch.object(tasks, "BROKER", tasks.BROKER_INLINE)
+    def test_likes_rebuild_the_board_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            ranking.adjust_song_likes(self.songs[0].pk, 5)
+            ranking.adjust_song_likes(self.songs[0].pk, 1)
+            self.assertFalse(LeaderboardEntry.objects.filter(board=self.board).exists())
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(ranking.get_leaderboards()[self.board][0], self.songs[0].pk)
+
+
+class TaskClaimTests(TestCase):
+    def test_claims_every_queue_by_default(self):
+        Task.objects.create(queue="images", path="os.getcwd")
+        Task.objects.create(queue="storage", path="os.getcwd")
+        self.assertEqual(len(tasks.claim([], 10)), 2)
+        self.assertEqual(tasks.claim(["images"], 10), [])
+
+    def test_expired_lease_is_reclaimed_as_an_attempt(self):
+        expired = timezone.now() - timedelta(seconds=1)
+        lost = Task.objects.create(path="os.getcwd", status=Task.STATUS_RUNNING, run_after=expired)
+        dead = Task.objects.create(
+            path="os.getcwd", status=Task.STATUS_RUNNING, run_after=expired, attempts=2, max_attempts=3
+        )
+        self.assertEqual([task.pk for task in tasks.claim([], 10)], [lost.pk])
+        lost.refresh_from_db()
+        dead.refresh_from_db()
+        self.assertEqual((lost.status, lost.attempts), (Task.STATUS_RUNNING, 1))
+        self.assertGreater(lost.run_after, timezone.now())
+        self.assertEqual((dead.status, dead.attempts), (Task.STATUS_FAILED, 3))
+
+
+class SearchRankingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        song, artiste = SearchDocument.KIND_SONG, SearchDocument.KIND_ARTISTE
+        SearchDocument.objects.create(kind=song, object_id=1, document="midnight")
+        SearchDocument.objects.create(kind=song, object_id=2, document="love story", popularity=math.log1p(100))
+        SearchDocument.objects.create(kind=song, object_id=3, document="love song")
+        SearchDocument.objects.create(kind=artiste, object_id=4, document="love band", popularity=math.log1p(1000))
+
+    def test_prefix_matches(self):
+        self.assertEqual(search.search(SearchDocument.KIND_SONG, "midn"), ([1], False))
+
+    def test_popularity_orders_equal_matches(self):
+        self.assertEqual(search.search(SearchDocument.KIND_SONG, "love"), ([2, 3], False))
+        self.assertEqual(search.search(SearchDocument.KIND_SONG, "love", page=2, page_size=1), ([3], False))
+
+    def test_case_and_accents_are_ignored(self):
+        self.assertEqual(search.search(SearchDocument.KIND_SONG, "LOVÉ"), ([2, 3], False))
+
+    @skipIf(connection.vendor not in search.BACKENDS, "the fallback backend has no fuzzy matching")
+    def test_typo_still_matches(self):
+        self.assertEqual(search.search(SearchDocument.KIND_SONG, "midnigth")[0][:1], [1])
+
+
+class SuggestIndexTests(SimpleTestCase):
+    def test_max_entries_is_a_cap(self):
+        index = suggest.SuggestIndex(max_entries=3)
+        index.load([])
+        for i in range(10):
+            index.update(suggest.KIND_SONG, i, f"song {i}", score=i)
+        self.assertEqual(len(index), 3)
+        self.assertEqual([row["id"] for row in index.query("song")], [9, 8, 7])
+        index.update(suggest.KIND_SONG, 0, "song 0", score=0)
+        self.assertEqual(len(index), 3)
+
+    def test_rescoring_keeps_heavy_prefix_lists(self):
+        index = suggest.SuggestIndex(top_k=3, scan_limit=5, background=False)
+        index.load([(suggest.KIND_SONG, i, f"song {i}", i, f"song {i}") for i in range(50)])
+        index.update(suggest.KIND_SONG, 10, "song 10", score=100)
+        self.assertEqual([row["id"] for row in index.query("s")], [10, 49, 48])
+        self.assertIsNotNone(index._top["s"])
+        # sinking out of the top-k leaves the list stale until the refresh finds the new third entry
+        index.update(suggest.KIND_SONG, 48, "song 48", score=0)
+        self.assertIn("s", index._stale)
+        index.refresh_stale()
+        self.assertEqual([row["id"] for row in index.query("s")], [10, 49, 47])
+
+
+class CatalogueTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user(email="band@example.com", password="password")
+        for i in range(3):
+            Media.objects.create(owner=cls.owner, file=f"songs/{i}.mp3", song_name=f"Song {i}", album_name="Album")
+
+    def snapshot(self):
+        return list(Media.objects.order_by("uid").values_list("uid", "owner_id", "file", "song_name", "album_name"))
+
+    def export(self, fmt):
+        f = io.StringIO()
+        catalogue.write(catalogue.export_rows("media"), f, fmt, catalogue.Spec(Media).columns)
+        f.seek(0)
+        return f
+
+    def import_(self, f, fmt, **kwargs):
+        rows = catalogue.read(f, fmt)
+        return list(catalogue.import_rows("media", rows, workers=1, enqueue_ingest=False, **kwargs))
+
+    def test_round_trip_restores_the_rows(self):
+        before = self.snapshot()
+        for fmt in catalogue.FORMATS:
+            with self.subTest(fmt=fmt):
+                exported = self.export(fmt)
+                Media.objects.filter(song_name="Song 0").delete()
+                Media.objects.filter(song_name="Song 1").update(song_name="Renamed")
+                self.assertEqual(self.import_(exported, fmt)[-1]["imported"], 3)
+                self.assertEqual(self.snapshot(), before)
+
+    def test_resume_continues_after_the_last_committed_batch(self):
+        before = self.snapshot()
+        exported = self.export("jsonl").getvalue()
+        Media.objects.all().delete()
+        progress = catalogue.import_rows(
+            "media", catalogue.read(io.StringIO(exported), "jsonl"), batch_size=1, workers=1, enqueue_ingest=False
+        )
+        position = next(progress)["position"]
+        progress.close()
+        self.assertEqual(Media.objects.count(), 1)
+        steps = self.import_(io.StringIO(exported), "jsonl", batch_size=1, start=position)
+        self.assertEqual([step["position"] for step in steps], [2, 3])
+        self.assertEqual(self.snapshot(), before)
+
+
+class LinkFoldingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.field, cls.platform = next(iter(artiste_links.LEGACY_FIELDS.items()))
+        cls.band = User.objects.create_user(email="band@example.com", password="password")
+        cls.fan = User.objects.create_user(email="fan@example.com", password="password")
+        cls.artiste = Artiste.objects.create(user=cls.band, stage_name="Band")
+        for user in (cls.band, cls.fan):
+            Profile.objects.create(user=user, **{cls.field: f"https://example.com/{user.pk}"})
+
+    def test_clear_only_blanks_folded_profiles(self):
+        self.assertEqual(artiste_links.fold_legacy(clear=True), 1)
+        link = Links.objects.get(artiste=self.artiste)
+        self.assertEqual((link.link_type, link.link_url), (self.platform, f"https://example.com/{self.band.pk}"))
+        self.assertEqual(getattr(Profile.objects.get(pk=self.band.pk), self.field), "")
+        # no artiste to fold into, so the only copy of the link stays where it is
+        self.assertEqual(getattr(Profile.objects.get(pk=self.fan.pk), self.field), f"https://example.com/{self.fan.pk}")
+
+    def test_existing_link_wins(self):
+        Links.objects.create(artiste=self.artiste, link_type=self.platform, link_url="https://example.com/new")
+        self.assertEqual(artiste_links.fold_legacy(), 0)
+        self.assertEqual(Links.objects.get(artiste=self.artiste).link_url, "https://example.com/new")
+
+    def test_save_links_upserts(self):
+        artiste_links.save_links(self.artiste, {self.platform: "https://example.com/a"})
+        artiste_links.save_links(self.artiste, {self.platform: "https://example.com/b"})
+        self.assertEqual(
+            list(Links.objects.filter(artiste=self.artiste).values_list("link_url", flat=True)),
+            ["https://example.com/b"],
+        )
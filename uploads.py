@@ -0,0 +1,175 @@
+import mimetypes
+import os
+import uuid
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+
+from apps.artiste.models import Artiste
+from profiles.models import Media, Profile, UploadSession
+from users.constants import ACCOUNT_TYPE_ARTISTE, ACCOUNT_TYPE_FAN
+from users.models import Fan
+
+MIN_PART_SIZE = 5 * 1024 * 1024
+MAX_PARTS = 10000
+PART_SIZE = max(getattr(settings, "PROFILES_UPLOAD_PART_SIZE", 8 * 1024 * 1024), MIN_PART_SIZE)
+MAX_UPLOAD_SIZE = getattr(settings, "PROFILES_UPLOAD_MAX_SIZE", 2 * 1024 * 1024 * 1024)
+URL_EXPIRY = getattr(settings, "PROFILES_UPLOAD_URL_EXPIRY", 3600)
+URLS_PER_RESPONSE = 20
+
+AUDIO_TYPES = {
+    "audio/aac",
+    "audio/flac",
+    "audio/mp4",
+    "audio/mpeg",
+    "audio/ogg",
+    "audio/wav",
+    "audio/x-m4a",
+    "audio/x-wav",
+}
+# what images.generate() can decode
+IMAGE_TYPES = {"image/jpeg", "image/png", "image/webp", "image/gif"}
+CONTENT_TYPES = {
+    UploadSession.KIND_MEDIA: AUDIO_TYPES,
+    UploadSession.KIND_PROFILE_SONG: AUDIO_TYPES,
+    UploadSession.KIND_PROFILE_PICTURE: IMAGE_TYPES,
+}
+
+
+def get_storage():
+    if not hasattr(default_storage, "create_multipart_upload"):
+        raise ImproperlyConfigured("Upload sessions need a storage backend with multipart support (MediaStorage).")
+    return default_storage
+
+
+def get_account_profile(user):
+    if user.account_type == ACCOUNT_TYPE_FAN:
+        return Fan.objects.get_or_create(user=user)[0]
+    elif user.account_type == ACCOUNT_TYPE_ARTISTE:
+        return Artiste.objects.get_or_create(user=user)[0]
+
+
+def check_type(kind, filename, content_type):
+    """``{field: message}`` for the declared ``content_type`` or ``filename`` extension that ``kind`` won't take."""
+    allowed = CONTENT_TYPES[kind]
+    errors = {}
+    if content_type not in allowed:
+        errors["content_type"] = f"Expected one of: {', '.join(sorted(allowed))}."
+    if mimetypes.guess_type(filename, strict=False)[0] not in allowed:
+        errors["filename"] = "The file extension does not match the kind of upload."
+    return errors
+
+
+def start(user, kind, filename, size, content_type, metadata=None):
+    if size > MAX_UPLOAD_SIZE:
+        raise ValidationError({"size": f"Uploads are limited to {MAX_UPLOAD_SIZE} bytes."})
+    part_size = max(PART_SIZE, -(-size // MAX_PARTS))
+    name = f"uploads/{uuid.uuid4().hex}/{os.path.basename(filename)}"
+    upload_id = get_storage().create_multipart_upload(name, content_type)
+    return UploadSession.objects.create(
+        user=user,
+        kind=kind,
+        name=name,
+        upload_id=upload_id,
+        filename=filename,
+        content_type=content_type,
+        size=size,
+        part_size=part_size,
+        metadata=metadata or {},
+    )
+
+
+def state(session):
+    """Describe ``session`` for the client: which parts S3 already has and where to PUT the next ones."""
+    data = {
+        "uid": session.uid,
+        "status": session.status,
+        "part_size": session.part_size,
+        "part_count": session.part_count,
+        "uploaded_parts": [],
+        "part_urls": {},
+    }
+    if session.status != UploadSession.STATUS_OPEN:
+        return data
+    storage = get_storage()
+    uploaded = {part["PartNumber"] for part in storage.list_uploaded_parts(session.name, session.upload_id)}
+    missing = [number for number in range(1, session.part_count + 1) if number not in uploaded]
+    data["uploaded_parts"] = sorted(uploaded)
+    data["part_urls"] = {
+        number: storage.presign_upload_part(session.name, session.upload_id, number, URL_EXPIRY)
+        for number in missing[:URLS_PER_RESPONSE]
+    }
+    return data
+
+
+def complete(session):
+    # claimed under the row lock, so a concurrent complete or abort sees it "completing" and stops;
+    # the S3 round trips happen after the lock (and its connection) is released
+    with transaction.atomic():
+        session = UploadSession.objects.select_for_update().get(pk=session.pk)
+        if session.status != UploadSession.STATUS_OPEN:
+            raise ValidationError({"detail": f"Upload session is {session.status}."})
+        session.status = UploadSession.STATUS_COMPLETING
+        session.save(update_fields=["status", "updated"])
+    storage = get_storage()
+    try:
+        parts = storage.list_uploaded_parts(session.name, session.upload_id)
+        numbers = {part["PartNumber"] for part in parts}
+        missing = [number for number in range(1, session.part_count + 1) if number not in numbers]
+        if missing:
+            raise ValidationError({"missing_parts": missing[:URLS_PER_RESPONSE]})
+        if sum(part["Size"] for part in parts) != session.size:
+            raise ValidationError({"detail": "Uploaded size does not match the declared size."})
+        storage.complete_multipart_upload(
+            session.name, session.upload_id, sorted(parts, key=lambda p: p["PartNumber"])
+        )
+    except Exception:
+        # nothing was assembled: the client can upload what is missing and complete again
+        UploadSession.objects.filter(pk=session.pk, status=UploadSession.STATUS_COMPLETING).update(
+            status=UploadSession.STATUS_OPEN, updated=timezone.now()
+        )
+        raise
+    with transaction.atomic():
+        finalize(session)
+        session.status = UploadSession.STATUS_COMPLETED
+        session.save(update_fields=["status", "media", "updated"])
+    return session
+
+
+def finalize(session):
+    user = session.user
+    if session.kind == UploadSession.KIND_MEDIA:
+        # creating the row queues the ingest task (see signals.ingest_uploaded_media)
+        session.media = Media.objects.create(
+            owner=user,
+            file=session.name,
+            song_name=session.metadata.get("song_name"),
+            album_name=session.metadata.get("album_name"),
+        )
+    elif session.kind == UploadSession.KIND_PROFILE_SONG:
+        profile = Profile.objects.get_or_create(user=user)[0]
+        profile.profile_song = session.name
+        profile.song_name = session.metadata.get("song_name") or profile.song_name
+        profile.save(update_fields=["profile_song", "song_name"])
+    elif session.kind == UploadSession.KIND_PROFILE_PICTURE:
+        profile = get_account_profile(user)
+        if profile is not None:
+            profile.profile_picture = session.name
+            profile.save()
+            user.profile_flag = True
+            user.save(update_fields=["profile_flag"])
+
+
+def abort(session):
+    # only an open session can be aborted; one being completed is left to finish
+    aborted = UploadSession.objects.filter(pk=session.pk, status=UploadSession.STATUS_OPEN).update(
+        status=UploadSession.STATUS_ABORTED, updated=timezone.now()
+    )
+    if aborted:
+        get_storage().abort_multipart_upload(session.name, session.upload_id)
+    session.refresh_from_db(fields=["status", "updated"])
+    return session
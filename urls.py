@@ -1,16 +1,32 @@
 from django.urls import include, path
 
-from profiles import views
+from profiles import async_views, instrumentation, views
 
 urlpatterns = [
     path("profile/", views.UserProfileView.as_view()),
     path("profile/upload-image/", views.UserProfilePictureUpdate.as_view()),
     path('api-auth/', include('rest_framework.urls', namespace='rest_framework')),
     path("profile/liked-songs/", views.LikedSongsListView.as_view()),
-    path("profile/artists-followed/", views.FollowedArtistsView.as_view()),
-    path("trending-songs", views.TrendingSongView.as_view()),
+    path("profile/artists-followed/", views.FollowedArtistsView.as_view(), name="followed_artists"),
+    path("profile/<uuid:uid>/song/stream/", views.ProfileSongStreamView.as_view(), name="profile_song_stream"),
+    path("media/<uuid:uid>/stream/", views.MediaStreamView.as_view(), name="media_stream"),
+    path("media/<uuid:uid>/comments/", views.MediaCommentListView.as_view(), name="media_comments"),
+    path("reactions/", views.ReactionView.as_view(), name="reactions"),
+    path("reactions/batch/", views.ReactionBatchView.as_view(), name="reactions_batch"),
+    path("plays/", views.PlayEventView.as_view(), name="plays"),
+    path("images/<str:token>/", views.ImageDerivativeView.as_view(), name="image_derivative"),
+    path("uploads/", views.UploadSessionCreateView.as_view(), name="upload_sessions"),
+    path("uploads/<uuid:uid>/", views.UploadSessionDetailView.as_view(), name="upload_session"),
+    path("uploads/<uuid:uid>/complete/", views.UploadSessionCompleteView.as_view(), name="upload_session_complete"),
+    path("trending-songs", views.TrendingSongView.as_view(), name="trending_songs"),
     # api changes
-    path("search/", views.SearchAPIView.as_view()),
+    path("search/", views.SearchAPIView.as_view(), name="search"),
+    path("search/suggest/", views.SearchSuggestView.as_view(), name="search_suggest"),
     path('suggestions/', views.SuggestionView.as_view(), name='suggestions'),
+    # async variants for ASGI deployments
+    path("async/search/", async_views.AsyncSearchAPIView.as_view(), name="async_search"),
+    path("async/suggestions/", async_views.AsyncSuggestionView.as_view(), name="async_suggestions"),
+    path("async/trending-songs/", async_views.AsyncTrendingSongView.as_view(), name="async_trending_songs"),
+    path("metrics/", instrumentation.metrics_view, name="metrics"),
     path("terms-and-conditions/", views.TermsAndConditionsAPIView.as_view(), name="terms_and_conditions"),
 ]
@@ -18,3 +18,20 @@ def song_duration(file):
     return f"{mins:02}:{seconds:02}"
 
 
+def format_duration_ms(duration_ms):
+    mins, seconds = parse_duration(duration_ms // 1000)
+    return f"{mins:02}:{seconds:02}"
+
+
+def duration_text_ms(text):
+    """Milliseconds from a stored ``"MM:SS"`` or ``"HH:MM:SS"`` duration, or ``None`` if it doesn't parse."""
+    try:
+        parts = [int(part) for part in (text or "").strip().split(":")]
+    except ValueError:
+        return None
+    if not 2 <= len(parts) <= 3 or any(part < 0 for part in parts):
+        return None
+    seconds = 0
+    for part in parts:
+        seconds = seconds * 60 + part
+    return seconds * 1000
@@ -1,24 +1,53 @@
 from django.contrib.auth import get_user_model
-from django.db.models import Q
 from drf_yasg import openapi
 from drf_yasg.utils import swagger_auto_schema
 from django.forms.models import model_to_dict
+from django.core import signing
+from django.core.files.storage import default_storage
+from django.http import FileResponse, Http404, HttpResponse
+from django.shortcuts import get_object_or_404
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_http_date_safe
 from rest_framework import (
     generics,
-    pagination,
     permissions,
     status,
     views,
     viewsets,
 )
+from rest_framework.exceptions import ValidationError
 from rest_framework.parsers import FormParser, MultiPartParser
 from rest_framework.response import Response
 
 from apps.artiste.models import Artiste, AudioMedia
-from apps.lib.constants import USER_TYPE_ARTISTE, USER_TYPE_FAN
 from apps.lib.models import TermsAndConditions
-from profiles import serializers
-from profiles.models import Media, Profile
+from profiles import (
+    images,
+    plays,
+    profile_cache,
+    ranking,
+    reactions,
+    recommend,
+    rollups,
+    search,
+    serializers,
+    streaming,
+    suggest,
+    terms,
+    uploads,
+)
+from profiles.models import (
+    EngagementBucket,
+    LeaderboardEntry,
+    Media,
+    MediaComment,
+    Profile,
+    SearchDocument,
+    UploadSession,
+)
+from profiles.instrumentation import query_budget
+from profiles.pagination import KeysetPagination
+from profiles.replicas import read_replica
 from users.constants import ACCOUNT_TYPE_ARTISTE, ACCOUNT_TYPE_FAN
 from users.models import Fan
 
@@ -34,6 +63,7 @@ class UserProfileViewe(generics.RetrieveUpdateAPIView):
         return Profile.objects.get_or_create(user=self.request.user)[0]
 
 
+@query_budget(30)
 class UserProfileView(generics.RetrieveUpdateAPIView):
     permission_classes = [permissions.IsAuthenticated]
 
@@ -56,17 +86,26 @@ class UserProfileView(generics.RetrieveUpdateAPIView):
             return Artiste.objects.get_or_create(user=self.request.user)[0]
 
     def get(self, request, *args, **kwargs):
-        if self.request.user.account_type == ACCOUNT_TYPE_FAN:  # type: ignore
-            obj, _ = Fan.objects.get_or_create(user=self.request.user)
-        elif self.request.user.account_type == ACCOUNT_TYPE_ARTISTE:  # type: ignore
-            obj, _ = Fan.objects.get_or_create(user=self.request.user)
-            obj, _ = Artiste.objects.get_or_create(user=self.request.user)
-        response=self.retrieve(request, *args, **kwargs)  
-        UserData=User.objects.get(email=response.data.get("email_id"))
-        user_dict = model_to_dict(UserData)
-        response.data["profile_flag"]=user_dict.get("profile_flag")
+        etag, data = profile_cache.get_or_build(
+            request.user,
+            lambda: self.build_payload(request, *args, **kwargs),
+            variant=",".join(serializers.expanded(request)),
+        )
+        if streaming.etag_matches(request.headers.get("If-None-Match"), etag):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = Response(data)
+        response["ETag"] = etag
+        response["Cache-Control"] = "private, no-cache"
         return response
 
+    def build_payload(self, request, *args, **kwargs):
+        if self.request.user.account_type == ACCOUNT_TYPE_ARTISTE:  # type: ignore
+            Fan.objects.get_or_create(user=self.request.user)
+        data = self.get_serializer(self.get_object()).data
+        data["profile_flag"] = request.user.profile_flag
+        return data
+
 
 class UserProfilePictureUpdate(views.APIView):
     parser_classes = (
@@ -105,104 +144,395 @@ class UserProfilePictureUpdate(views.APIView):
         # return Response({"detail": "Profile picture updated","data":(json.dumps(_user))})
 
 
+class ReactionView(views.APIView):
+    permission_classes = [
+        permissions.IsAuthenticated,
+    ]
+
+    def apply(self, request, items):
+        ids = {}
+        for kind in {item["kind"] for item in items}:
+            ids[kind] = reactions.resolve_ids(kind, [item["id"] for item in items if item["kind"] == kind])
+        wanted = []
+        for item in items:
+            pk = ids[item["kind"]].get(item["id"])
+            if pk is None:
+                raise Http404
+            wanted.append((item["kind"], pk, reactions.VALUES[item["reaction"]]))
+        result = reactions.react_many(request.user, wanted)
+        counts = {kind: reactions.counts(kind, list(kind_ids.values())) for kind, kind_ids in ids.items()}
+        data = []
+        for item, (kind, pk, _) in zip(items, wanted):
+            likes, dislikes = counts[kind][pk]
+            data.append(
+                {
+                    "kind": kind,
+                    "id": item["id"],
+                    "reaction": reactions.NAMES[result[(kind, pk)]],
+                    "likes_count": likes,
+                    "dislikes_count": dislikes,
+                }
+            )
+        return data
+
+    @swagger_auto_schema(request_body=serializers.ReactionSerializer)
+    def post(self, request, format=None):
+        serializer = serializers.ReactionSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return Response(self.apply(request, [serializer.validated_data])[0], status=status.HTTP_200_OK)
+
+
+class ReactionBatchView(ReactionView):
+    @swagger_auto_schema(request_body=serializers.ReactionBatchSerializer)
+    def post(self, request, format=None):
+        serializer = serializers.ReactionBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = self.apply(request, serializer.validated_data["reactions"])
+        return Response({"reactions": data}, status=status.HTTP_200_OK)
+
+
+class PlayEventView(views.APIView):
+    """Accepts batched client play events into the play buffer; writes happen in the background."""
+
+    permission_classes = [
+        permissions.IsAuthenticated,
+    ]
+
+    @swagger_auto_schema(request_body=serializers.PlayEventBatchSerializer)
+    def post(self, request, format=None):
+        serializer = serializers.PlayEventBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        accepted, duplicates, dropped = plays.record(request.user, serializer.validated_data["events"])
+        data = {"accepted": accepted, "duplicates": duplicates, "dropped": dropped}
+        if dropped:
+            # buffer full: the client retries later, and already accepted events come back as duplicates
+            response = Response(data, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+            response["Retry-After"] = "5"
+            return response
+        return Response(data, status=status.HTTP_202_ACCEPTED)
+
+
+class UploadSessionCreateView(views.APIView):
+    permission_classes = [
+        permissions.IsAuthenticated,
+    ]
+
+    @swagger_auto_schema(request_body=serializers.UploadSessionCreateSerializer)
+    def post(self, request, format=None):
+        serializer = serializers.UploadSessionCreateSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        metadata = {key: data[key] for key in ("song_name", "album_name") if key in data}
+        session = uploads.start(
+            request.user, data["kind"], data["filename"], data["size"], data["content_type"], metadata
+        )
+        return Response(uploads.state(session), status=status.HTTP_201_CREATED)
+
+
+class UploadSessionDetailView(views.APIView):
+    permission_classes = [
+        permissions.IsAuthenticated,
+    ]
+
+    def get_session(self, uid):
+        return get_object_or_404(UploadSession, uid=uid, user=self.request.user)
+
+    def get(self, request, uid, format=None):
+        return Response(uploads.state(self.get_session(uid)), status=status.HTTP_200_OK)
+
+    def delete(self, request, uid, format=None):
+        uploads.abort(self.get_session(uid))
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class UploadSessionCompleteView(UploadSessionDetailView):
+    http_method_names = ["post", "options"]
+
+    @swagger_auto_schema(request_body=serializers.EmptyBodySerializer)
+    def post(self, request, uid, format=None):
+        session = uploads.complete(self.get_session(uid))
+        data = uploads.state(session)
+        if session.media_id:
+            data["media_uid"] = session.media.uid
+        return Response(data, status=status.HTTP_200_OK)
+
+
+class MediaStreamView(views.APIView):
+    permission_classes = [
+        permissions.IsAuthenticated,
+    ]
+
+    @swagger_auto_schema(
+        manual_parameters=[
+            openapi.Parameter(
+                in_=openapi.IN_QUERY,
+                type=openapi.TYPE_STRING,
+                name='rendition',
+                description='"stream" for the low-bitrate copy',
+            ),
+        ]
+    )
+    def get(self, request, uid, format=None):
+        media = get_object_or_404(Media.objects.only("file", "stream_file"), uid=uid)
+        field_file = media.file
+        if request.query_params.get("rendition") == "stream" and media.stream_file:
+            field_file = media.stream_file
+        if not field_file:
+            raise Http404
+        return streaming.stream_file(request, field_file)
+
+
+class ProfileSongStreamView(views.APIView):
+    permission_classes = [
+        permissions.IsAuthenticated,
+    ]
+
+    def get(self, request, uid, format=None):
+        profile = get_object_or_404(Profile.objects.only("profile_song"), user__uid=uid)
+        if not profile.profile_song:
+            raise Http404
+        return streaming.stream_file(request, profile.profile_song)
+
+
+class ImageDerivativeView(views.APIView):
+    permission_classes = [
+        permissions.AllowAny,
+    ]
+
+    def get(self, request, token, format=None):
+        try:
+            path, content_type = images.cached_derivative(token, default_storage)
+        except (signing.BadSignature, FileNotFoundError):
+            raise Http404
+        response = FileResponse(open(path, "rb"), content_type=content_type)
+        response["Cache-Control"] = "public, max-age=31536000, immutable"
+        return response
+
+
+@query_budget(15)
+@read_replica
 class LikedSongsListView(generics.ListAPIView):
     serializer_class = serializers.MediaSerializer
     queryset = Media.objects.all()
     permission_classes = [
         permissions.IsAuthenticated,
     ]
-    pagination_class = pagination.LimitOffsetPagination
+    pagination_class = KeysetPagination
+
+    def get_queryset(self):
+        return serializers.MediaSerializer.setup_eager_loading(self.request.user.liked_media.all())
+
+
+@query_budget(8)
+class MediaCommentListView(generics.ListCreateAPIView):
+    serializer_class = serializers.MediaCommentSerializer
+    permission_classes = [
+        permissions.IsAuthenticated,
+    ]
+    pagination_class = KeysetPagination
+    # matches MediaComment.Meta.ordering
+    keyset_ordering = ("-id",)
+
+    def get_media(self):
+        return get_object_or_404(Media.objects.only("pk"), uid=self.kwargs["uid"])
 
     def get_queryset(self):
-        return self.request.user.liked_media.all()
+        return MediaComment.objects.filter(media=self.get_media()).select_related("commenter__profile")
+
+    def perform_create(self, serializer):
+        serializer.save(media=self.get_media())
 
 
+@query_budget(15)
+@read_replica
 class FollowedArtistsView(generics.ListAPIView):
     serializer_class = serializers.ArtisteProfileSerializer
-    queryset = Profile.objects.all()
+    queryset = Artiste.objects.all()
     permission_classes = [
         permissions.IsAuthenticated,
     ]
-    pagination_class = pagination.LimitOffsetPagination
+    pagination_class = KeysetPagination
+    keyset_ordering = ("pk",)
 
     def get_queryset(self):
-        followed_artists = self.request.user.followed.all()
-        profiles = Profile.objects.filter(user__in=followed_artists)
-        return profiles
+        followed = profile_cache.followed_by(self.request.user.pk).values(Artiste.followers.field.attname)
+        artistes = Artiste.objects.filter(pk__in=followed)
+        return serializers.ArtisteProfileSerializer.setup_eager_loading(artistes)
         # return self.request.user.liked_profiles.all()
 
 
+@query_budget(15)
 class MoreOfWhatYouLikeViewset(viewsets.ReadOnlyModelViewSet):
     serializer_class = serializers.MoreOfWhatYouLikeSerializer
     permission_classes = [
         permissions.IsAuthenticated,
     ]
     queryset = Media.objects.all()
-    pagination_class = pagination.PageNumberPagination
+    pagination_class = KeysetPagination
+    # the recommendations in rank order; the rank is constant (so newest first) when there are none
+    keyset_ordering = ("recommendation_rank", "-pk")
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action == "list":
+            ids = recommend.recommend_ids(self.request.user.pk)
+            # sorting the whole table by the rank CASE would scan it; a user with no likes yet gets the full list
+            if ids:
+                queryset = queryset.filter(pk__in=ids)
+            queryset = queryset.annotate(recommendation_rank=recommend.rank(ids))
+        return queryset
 
 
 class PopularArtistViewSet(viewsets.ModelViewSet):
     serializer_class = serializers.ArtisteProfileSerializer
     permission_classes = [permissions.IsAuthenticated]
-    queryset = Profile.objects.filter(user__user_type="artist")
+    queryset = Artiste.objects.filter(user__user_type="artist")
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in ("list", "retrieve"):
+            queryset = serializers.ArtisteProfileSerializer.setup_eager_loading(queryset)
+        return queryset
 
+
+@query_budget(15)
+@read_replica
 class TrendingSongView(generics.ListAPIView):
     queryset = Media.objects.all()
     serializer_class = serializers.MediaSerializer
     permission_classes = [
         permissions.IsAuthenticated,
     ]
+    pagination_class = KeysetPagination
+    keyset_ordering = ("trending_position", "-pk")
 
+    @swagger_auto_schema(
+        manual_parameters=[
+            openapi.Parameter(
+                in_=openapi.IN_QUERY,
+                type=openapi.TYPE_STRING,
+                name='window',
+                description='Trending window: ' + ', '.join(rollups.WINDOWS),
+            ),
+        ]
+    )
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
 
+    def get_queryset(self):
+        window = self.request.query_params.get("window", rollups.DEFAULT_WINDOW)
+        if window not in rollups.WINDOWS:
+            raise ValidationError({"window": f"Choose one of: {', '.join(rollups.WINDOWS)}."})
+        queryset = super().get_queryset()
+        ids = rollups.trending_ids(EngagementBucket.KIND_MEDIA, window)
+        # before the first rollup refresh there are no scores yet; serve the full list
+        if ids:
+            queryset = queryset.filter(pk__in=ids)
+        positions = ranking.delta_case("pk", {pk: position for position, pk in enumerate(ids, start=1)})
+        queryset = queryset.annotate(trending_position=positions)
+        return serializers.MediaSerializer.setup_eager_loading(queryset)
+
+
+@query_budget(10)
+@read_replica
 class SearchAPIView(generics.GenericAPIView):
     permission_classes = [
         permissions.IsAuthenticated,
     ]
     serializer_class = serializers.MediaSearchSerializer
 
+    page_size = 20
+    max_page_size = 100
+
     @swagger_auto_schema(
         manual_parameters=[
             openapi.Parameter(in_=openapi.IN_QUERY, type=openapi.TYPE_STRING, name='search', description='SearchAPI'),
+            openapi.Parameter(in_=openapi.IN_QUERY, type=openapi.TYPE_INTEGER, name='page', description='Page'),
+            openapi.Parameter(
+                in_=openapi.IN_QUERY, type=openapi.TYPE_INTEGER, name='page_size', description='Page size'
+            ),
         ]
     )
     def get(self, request, format=None):
         search_query = request.query_params.get('search', None)
         if search_query is None:
             return Response({'error': 'Please provide a search term'}, status=status.HTTP_400_BAD_REQUEST)
-        songs = AudioMedia.objects.filter(
-            Q(title__icontains=search_query) | Q(album__album_name__icontains=search_query)
-        )
+        try:
+            page = max(int(request.query_params.get('page', 1)), 1)
+            page_size = min(max(int(request.query_params.get('page_size', self.page_size)), 1), self.max_page_size)
+        except ValueError:
+            return Response({'error': 'Invalid page or page_size'}, status=status.HTTP_400_BAD_REQUEST)
+
+        song_ids, songs_has_more = search.search(SearchDocument.KIND_SONG, search_query, page, page_size)
+        songs = AudioMedia.objects.select_related('artiste', 'album').in_bulk(song_ids)
+        songs = [songs[pk] for pk in song_ids if pk in songs]
         songs_serializer = serializers.SuggestionsSerializer(songs, context={"request": request}, many=True)
-        artiste = Artiste.objects.filter(
-            Q(stage_name__icontains=search_query)
-            | Q(user__first_name__icontains=search_query)
-            | Q(user__last_name__icontains=search_query)
-        )
+
+        artiste_ids, artistes_has_more = search.search(SearchDocument.KIND_ARTISTE, search_query, page, page_size)
+        artiste = Artiste.objects.select_related('user').in_bulk(artiste_ids)
+        artiste = [artiste[pk] for pk in artiste_ids if pk in artiste]
         artiste_serializer = serializers.ArtisteSerializer(artiste, context={"request": request}, many=True)
 
         data = {
             'songs': songs_serializer.data,
             'artistes': artiste_serializer.data,
+            'page': page,
+            'page_size': page_size,
+            'songs_has_more': songs_has_more,
+            'artistes_has_more': artistes_has_more,
         }
         return Response(data, status=status.HTTP_200_OK)
 
 
+class SearchSuggestView(views.APIView):
+    permission_classes = [
+        permissions.IsAuthenticated,
+    ]
+    max_limit = 20
+
+    @swagger_auto_schema(
+        manual_parameters=[
+            openapi.Parameter(in_=openapi.IN_QUERY, type=openapi.TYPE_STRING, name='q', description='Typed prefix'),
+            openapi.Parameter(in_=openapi.IN_QUERY, type=openapi.TYPE_INTEGER, name='limit', description='Limit'),
+        ]
+    )
+    def get(self, request, format=None):
+        suggest.maybe_reload()
+        try:
+            limit = min(max(int(request.query_params.get('limit', 10)), 1), self.max_limit)
+        except ValueError:
+            return Response({'error': 'Invalid limit'}, status=status.HTTP_400_BAD_REQUEST)
+        suggestions = suggest.index.query(request.query_params.get('q', ''), limit=limit)
+        return Response({'suggestions': suggestions}, status=status.HTTP_200_OK)
+
+
+@query_budget(10)
+@read_replica
 class SuggestionView(views.APIView):
     permission_classes = [
         permissions.IsAuthenticated,
     ]
 
     def get(self, request, format=None):
-        most_liked_songs = AudioMedia.objects.prefetch_related('likes').all().order_by('-likes')[:20]
+        boards = ranking.get_leaderboards()
+        song_ids = set(boards[LeaderboardEntry.BOARD_MOST_LIKED_SONGS])
+        song_ids.update(boards[LeaderboardEntry.BOARD_TOP_TRENDING_SONGS])
+        songs = AudioMedia.objects.select_related('artiste', 'album')
+        songs = songs.in_bulk(song_ids)
+        artistes = Artiste.objects.select_related('user')
+        artistes = artistes.in_bulk(boards[LeaderboardEntry.BOARD_MOST_LIKED_ARTISTS])
+
+        most_liked_songs = [songs[pk] for pk in boards[LeaderboardEntry.BOARD_MOST_LIKED_SONGS] if pk in songs]
         serializer = serializers.SuggestionsSerializer(most_liked_songs, context={"request": request}, many=True)
 
-        most_liked_artists = Artiste.objects.prefetch_related('followers').all().order_by('-followers')[:20]
+        most_liked_artists = [
+            artistes[pk] for pk in boards[LeaderboardEntry.BOARD_MOST_LIKED_ARTISTS] if pk in artistes
+        ]
         most_liked_artists_serializer = serializers.ArtisteSerializer(
             most_liked_artists, context={"request": request}, many=True
         )
 
-        top_trending_songs = AudioMedia.objects.prefetch_related('comments').all().order_by('-comments')[:20]
+        top_trending_songs = [songs[pk] for pk in boards[LeaderboardEntry.BOARD_TOP_TRENDING_SONGS] if pk in songs]
         trending_serializer = serializers.SuggestionsSerializer(
             top_trending_songs, context={"request": request}, many=True
         )
@@ -222,12 +552,42 @@ class TermsAndConditionsAPIView(generics.GenericAPIView):
         permissions.IsAuthenticated,
     ]
 
-    def get_queryset(self):
-        if self.request.user.user_type == "artist":
-            return super().get_queryset().filter(user_type=USER_TYPE_ARTISTE).order_by('-updated_datetime').first()
-        return super().get_queryset().filter(user_type=USER_TYPE_FAN).order_by('-updated_datetime').first()
+    def not_modified(self, request, entry, since):
+        if since:
+            return since == entry.version
+        if request.headers.get("If-None-Match"):
+            return streaming.etag_matches(request.headers["If-None-Match"], entry.etag)
+        modified_since = parse_http_date_safe(request.headers.get("If-Modified-Since", ""))
+        return bool(entry.last_modified and modified_since and int(entry.last_modified.timestamp()) <= modified_since)
 
-    @swagger_auto_schema(responses={200: serializers.TermsAndConditionsSerializer()})
+    @swagger_auto_schema(
+        manual_parameters=[
+            openapi.Parameter(
+                in_=openapi.IN_QUERY,
+                type=openapi.TYPE_STRING,
+                name='since',
+                description='Version the client already has; answered with 304 or a diff',
+            ),
+        ],
+        responses={200: serializers.TermsAndConditionsSerializer()},
+    )
     def get(self, request, format=None):
-        serializer = self.serializer_class(self.get_queryset())
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        entry = terms.get(terms.user_type_for(request.user))
+        since = request.query_params.get("since")
+        not_modified = self.not_modified(request, entry, since)
+        changes = terms.diff(entry, since) if since and entry.version and not not_modified else None
+        if not_modified:
+            response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+        elif changes is not None:
+            response = Response({"version": entry.version, "since": since, "diff": changes})
+        else:
+            encoding, content = entry.encoded(request.headers.get("Accept-Encoding"))
+            response = HttpResponse(content, content_type="application/json")
+            if encoding != "identity":
+                response["Content-Encoding"] = encoding
+            patch_vary_headers(response, ["Accept-Encoding"])
+        response["ETag"] = entry.etag
+        if entry.last_modified_header:
+            response["Last-Modified"] = entry.last_modified_header
+        response["Cache-Control"] = "private, no-cache"
+        return response